@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Model architectures shared by training, distillation and conversion.
+
+Checkpoints store the `arch` they were built from, so load_pytorch_model can
+rebuild distilled students and teachers as well as the default
+MobileNetV3-Small. Checkpoints without an `arch` entry use DEFAULT_ARCH.
+"""
+import copy
+import torch.nn as nn
+from torchvision import models, transforms
+
+DEFAULT_ARCH = {
+    'name': 'mobilenet_v3_small',
+    'width_mult': 1.0,
+    'hidden_units': 256,
+    'dropout': 0.2,
+    'input_size': 224
+}
+TEACHERS = ('mobilenet_v3_large', 'resnet50')
+
+# Pretrained blocks kept frozen while fine-tuning: entries of `features` for
+# MobileNetV3, top-level children (stem, layer1, layer2) for ResNet50
+FROZEN_LAYERS = {
+    'mobilenet_v3_small': 9,
+    'mobilenet_v3_large': 10,
+    'resnet50': 6
+}
+
+
+def make_arch(name='mobilenet_v3_small', **overrides):
+    """Architecture description, DEFAULT_ARCH with the given overrides."""
+    if name not in FROZEN_LAYERS:
+        raise ValueError(f"Unknown architecture: {name}")
+    return {**DEFAULT_ARCH, 'name': name, **overrides}
+
+
+def checkpoint_arch(checkpoint):
+    """The architecture a checkpoint was trained with."""
+    return {**DEFAULT_ARCH, **checkpoint.get('arch', {})}
+
+
+def make_val_transforms(size=224):
+    """Resize, tensor conversion and ImageNet normalization used for evaluation."""
+    return transforms.Compose([
+        transforms.Resize((size, size)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ])
+
+
+def has_pretrained_weights(arch):
+    """torchvision only ships ImageNet weights for the full-width models."""
+    return arch['width_mult'] == 1.0
+
+
+def default_frozen_layers(arch):
+    """Number of frozen prefix blocks; models trained from scratch freeze nothing."""
+    return FROZEN_LAYERS[arch['name']] if has_pretrained_weights(arch) else 0
+
+
+def _head(in_features, arch, num_classes):
+    return nn.Sequential(
+        nn.Linear(in_features, arch['hidden_units']),
+        nn.Hardswish(),
+        nn.Dropout(arch['dropout']),
+        nn.Linear(arch['hidden_units'], num_classes)
+    )
+
+
+def build_network(arch, num_classes, pretrained=False):
+    """Create the network for an architecture with a fresh classifier head."""
+    pretrained = pretrained and has_pretrained_weights(arch)
+
+    if arch['name'] == 'resnet50':
+        model = models.resnet50(pretrained=pretrained)
+        model.fc = _head(model.fc.in_features, arch, num_classes)
+        return model
+
+    if arch['name'] == 'mobilenet_v3_large':
+        model = models.mobilenet_v3_large(pretrained=pretrained, width_mult=arch['width_mult'])
+    else:
+        model = models.mobilenet_v3_small(pretrained=pretrained, width_mult=arch['width_mult'])
+    model.classifier = _head(model.classifier[0].in_features, arch, num_classes)
+    return model
+
+
+def embedding_network(model, arch):
+    """Copy of the network that outputs the hidden layer of the classifier head."""
+    model = copy.deepcopy(model)
+    # Keep Linear + Hardswish, drop Dropout and the class logits
+    if arch['name'] == 'resnet50':
+        model.fc = model.fc[:2]
+    else:
+        model.classifier = model.classifier[:2]
+    return model.eval()
+
+
+def final_layer(model, arch):
+    """The Linear layer of the classifier head that outputs the class logits."""
+    return model.fc[-1] if arch['name'] == 'resnet50' else model.classifier[-1]
+
+
+def frozen_prefix(model, arch, frozen_layers):
+    """The first `frozen_layers` blocks of the network as one module."""
+    if arch['name'] == 'resnet50':
+        return nn.Sequential(*list(model.children())[:frozen_layers])
+    return model.features[:frozen_layers]
+
+
+def describe(arch):
+    """Short human-readable name, e.g. 'MobileNetV3-Small x0.75 @160px'."""
+    names = {
+        'mobilenet_v3_small': 'MobileNetV3-Small',
+        'mobilenet_v3_large': 'MobileNetV3-Large',
+        'resnet50': 'ResNet50'
+    }
+    text = names[arch['name']]
+    if arch['width_mult'] != 1.0:
+        text += f" x{arch['width_mult']}"
+    if arch['input_size'] != DEFAULT_ARCH['input_size']:
+        text += f" @{arch['input_size']}px"
+    return text
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Batched tensor augmentation for collated uint8 image batches.
+
+Mirrors the per-sample PIL pipeline in train_model.py (horizontal flip, rotation,
+brightness/contrast jitter, normalization) but runs on whole batches on the
+training device, so DataLoader workers only have to hand over uint8 tensors.
+"""
+import math
+import torch
+import torch.nn.functional as F
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+class BatchAugmenter:
+    """Augment and normalize (N, 3, H, W) uint8 batches on a device.
+
+    With `size`, batches are resized to size x size after augmentation, e.g.
+    for a student model with a smaller input than the tensor cache.
+    """
+
+    def __init__(self, device, seed=None, degrees=15, brightness=0.2, contrast=0.2,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD, size=None):
+        self.device = torch.device(device)
+        self.size = size
+        self.degrees = degrees
+        self.brightness = brightness
+        self.contrast = contrast
+        self.mean = torch.tensor(mean, device=self.device).view(1, 3, 1, 1)
+        self.std = torch.tensor(std, device=self.device).view(1, 3, 1, 1)
+
+        self.generator = torch.Generator(device=self.device)
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        else:
+            self.generator.seed()
+
+    def _uniform(self, n, low, high):
+        """Sample n values uniformly from [low, high) on the device."""
+        values = torch.rand(n, generator=self.generator, device=self.device)
+        return values * (high - low) + low
+
+    def _flip(self, x):
+        flip = torch.rand(x.shape[0], generator=self.generator, device=self.device) < 0.5
+        return torch.where(flip.view(-1, 1, 1, 1), x.flip(-1), x)
+
+    def _rotate(self, x):
+        # Rotate around the image center, filling with black like RandomRotation
+        angle = self._uniform(x.shape[0], -self.degrees, self.degrees) * (math.pi / 180)
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        zero = torch.zeros_like(angle)
+        theta = torch.stack([
+            torch.stack([cos, -sin, zero], dim=1),
+            torch.stack([sin, cos, zero], dim=1)
+        ], dim=1)
+        grid = F.affine_grid(theta, x.shape, align_corners=False)
+        return F.grid_sample(x, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+    def _jitter(self, x):
+        n = x.shape[0]
+        brightness = self._uniform(n, 1 - self.brightness, 1 + self.brightness).view(-1, 1, 1, 1)
+        x = (x * brightness).clamp_(0, 1)
+
+        # Blend with the mean grayscale value, as ColorJitter's contrast does
+        contrast = self._uniform(n, 1 - self.contrast, 1 + self.contrast).view(-1, 1, 1, 1)
+        gray = 0.299 * x[:, 0] + 0.587 * x[:, 1] + 0.114 * x[:, 2]
+        gray_mean = gray.mean(dim=(-2, -1)).view(-1, 1, 1, 1)
+        return ((x - gray_mean) * contrast + gray_mean).clamp_(0, 1)
+
+    def __call__(self, images, train=True):
+        """Return a normalized float batch, augmented when `train` is set."""
+        x = images.to(self.device, non_blocking=True).float().div_(255)
+
+        if train:
+            x = self._flip(x)
+            x = self._rotate(x)
+            x = self._jitter(x)
+
+        if self.size is not None and x.shape[-2:] != (self.size, self.size):
+            x = F.interpolate(x, size=(self.size, self.size), mode='bilinear',
+                              align_corners=False, antialias=True)
+
+        return (x - self.mean) / self.std
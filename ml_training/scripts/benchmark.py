@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Benchmark CPU inference speed of the trained landmark classifier.
+
+Measures single-image latency percentiles and batched throughput across batch
+sizes and thread counts for several model variants, plus DataLoader images/sec
+for the training transforms and, with --gated-head, the cost of scoring the
+classifier head per location versus over all classes. Results are written as JSON so runs from
+different commits can be compared with --compare.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from torchvision import datasets
+from convert_to_coreml import load_pytorch_model
+from architectures import checkpoint_arch
+
+VARIANTS = ('eager', 'torchscript', 'channels_last', 'dynamic_linear', 'static_int8')
+
+
+def build_variant(model, variant, input_size=224, calibration=None):
+    """Return (model, memory_format) for one benchmark variant.
+
+    `calibration` is a DataLoader of validation batches, needed for static_int8.
+    """
+    model = model.eval()
+    if variant == 'eager':
+        return model, torch.contiguous_format
+    if variant == 'torchscript':
+        # Same trace as convert_to_coreml.convert_to_coreml
+        example_input = torch.rand(1, 3, input_size, input_size)
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example_input)
+        return traced, torch.contiguous_format
+    if variant == 'channels_last':
+        return copy.deepcopy(model).to(memory_format=torch.channels_last), torch.channels_last
+    if variant == 'dynamic_linear':
+        # Dynamic int8 quantization of the linear layers (classifier head) only,
+        # the convolutions stay fp32
+        quantized = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        return quantized, torch.contiguous_format
+    if variant == 'static_int8':
+        # The int8 model optimize_model.py evaluates; imported lazily, it imports this module
+        from optimize_model import quantize_static
+        if calibration is None:
+            raise ValueError("static_int8 needs validation batches for calibration")
+        return quantize_static(model, calibration, input_size=input_size), torch.contiguous_format
+    raise ValueError(f"Unknown variant: {variant}")
+
+
+def _time_calls(fn, iterations, warmup):
+    """Run fn warmup + iterations times and return per-call seconds."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings)
+
+
+@torch.inference_mode()
+def measure_latency(model, memory_format, iterations=200, warmup=20, input_size=224):
+    """Single-image latency percentiles in milliseconds."""
+    x = torch.rand(1, 3, input_size, input_size).contiguous(memory_format=memory_format)
+    timings = _time_calls(lambda: model(x), iterations, warmup) * 1000
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'mean_ms': float(timings.mean())
+    }
+
+
+@torch.inference_mode()
+def measure_throughput(model, memory_format, batch_size, iterations=20, warmup=3, input_size=224):
+    """Batched throughput in images per second."""
+    x = torch.rand(batch_size, 3, input_size, input_size).contiguous(memory_format=memory_format)
+    timings = _time_calls(lambda: model(x), iterations, warmup)
+    return {'images_per_sec': float(batch_size / np.median(timings))}
+
+
+def measure_dataloader(dataset, batch_size=32, num_workers=2, max_batches=50):
+    """Images per second delivered by a DataLoader over the dataset."""
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+    images = 0
+    start = time.perf_counter()
+    for i, (inputs, _) in enumerate(loader):
+        images += inputs.shape[0]
+        if i + 1 >= max_batches:
+            break
+    return {'images_per_sec': images / (time.perf_counter() - start), 'images': images}
+
+
+def benchmark_dataloaders(data_dir, batch_size, worker_counts):
+    """DataLoader images/sec for the current training transforms."""
+    # Imported lazily, LandmarkClassifier pulls in the whole training setup
+    from train_model import LandmarkClassifier
+    from tensor_cache import CachedImageFolder, build_tensor_cache
+
+    classifier = LandmarkClassifier(data_dir=data_dir)
+    pipelines = {
+        'imagefolder_pil': datasets.ImageFolder(classifier.data_dir / 'train', transform=classifier.train_transforms),
+        'imagefolder_uint8': datasets.ImageFolder(classifier.data_dir / 'train', transform=classifier.uint8_transforms)
+    }
+    store_dirs = build_tensor_cache(classifier.data_dir)
+    pipelines['tensor_cache'] = CachedImageFolder(store_dirs['train'], transform=classifier.cached_train_transforms)
+    pipelines['tensor_cache_uint8'] = CachedImageFolder(store_dirs['train'])
+
+    results = []
+    for name, dataset in pipelines.items():
+        for num_workers in worker_counts:
+            result = measure_dataloader(dataset, batch_size=batch_size, num_workers=num_workers)
+            results.append({'pipeline': name, 'num_workers': num_workers, 'batch_size': batch_size, **result})
+            print(f"  {name:20s} workers={num_workers:<2d} {result['images_per_sec']:8.1f} images/sec")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def load_calibration(checkpoint, data_dir, input_size=224):
+    """Validation batches for static_int8, or None (with a warning) without a validation set."""
+    data_dir = Path(data_dir)
+    if not (data_dir / 'validation').is_dir():
+        print(f"Warning: No validation images in {data_dir}, skipping static_int8")
+        return None
+    from optimize_model import load_validation
+
+    class_to_idx = checkpoint.get('class_to_idx')
+    if class_to_idx is None:
+        with open(data_dir / 'pytorch_class_mapping.json', 'r') as f:
+            class_to_idx = json.load(f)
+    loader, _ = load_validation(data_dir, class_to_idx, input_size)
+    return loader
+
+
+def run_benchmarks(model, variants, batch_sizes, thread_counts, iterations, input_size=224, calibration=None):
+    """Latency and throughput for every variant and thread count."""
+    latency = []
+    throughput = []
+    for variant in variants:
+        variant_model, memory_format = build_variant(model, variant, input_size, calibration)
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+
+            result = measure_latency(variant_model, memory_format, iterations=iterations, input_size=input_size)
+            latency.append({'variant': variant, 'threads': threads, **result})
+            print(f"  {variant:14s} threads={threads:<3d} p50={result['p50_ms']:7.2f}ms "
+                  f"p95={result['p95_ms']:7.2f}ms p99={result['p99_ms']:7.2f}ms")
+
+            for batch_size in batch_sizes:
+                result = measure_throughput(variant_model, memory_format, batch_size, input_size=input_size)
+                throughput.append({'variant': variant, 'threads': threads, 'batch_size': batch_size, **result})
+                print(f"  {variant:14s} threads={threads:<3d} batch={batch_size:<4d} "
+                      f"{result['images_per_sec']:8.1f} images/sec")
+    return latency, throughput
+
+
+def compare_results(current, baseline, tolerance=0.10):
+    """Return regressions of current vs. baseline beyond the relative tolerance."""
+    regressions = []
+
+    baseline_latency = {(r['variant'], r['threads']): r for r in baseline.get('latency', [])}
+    for r in current.get('latency', []):
+        old = baseline_latency.get((r['variant'], r['threads']))
+        if old and r['p50_ms'] > old['p50_ms'] * (1 + tolerance):
+            regressions.append(f"latency {r['variant']} threads={r['threads']}: "
+                               f"p50 {old['p50_ms']:.2f}ms -> {r['p50_ms']:.2f}ms")
+
+    baseline_throughput = {(r['variant'], r['threads'], r['batch_size']): r for r in baseline.get('throughput', [])}
+    for r in current.get('throughput', []):
+        old = baseline_throughput.get((r['variant'], r['threads'], r['batch_size']))
+        if old and r['images_per_sec'] < old['images_per_sec'] * (1 - tolerance):
+            regressions.append(f"throughput {r['variant']} threads={r['threads']} batch={r['batch_size']}: "
+                               f"{old['images_per_sec']:.1f} -> {r['images_per_sec']:.1f} images/sec")
+
+    return regressions
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the landmark classifier on CPU.')
+    parser.add_argument('--model', default=None, help='checkpoint (default: models/best_model.pth)')
+    parser.add_argument('--variants', default=','.join(VARIANTS),
+                        help=f"comma-separated subset of {','.join(VARIANTS)}")
+    parser.add_argument('--batch-sizes', type=_int_list, default=[1, 8, 32])
+    parser.add_argument('--threads', type=_int_list, default=None,
+                        help='comma-separated thread counts (default: 1 and all cores)')
+    parser.add_argument('--iterations', type=int, default=200, help='timed single-image runs')
+    parser.add_argument('--dataloader', action='store_true',
+                        help='also measure DataLoader images/sec for the training transforms')
+    parser.add_argument('--data-dir', default=None,
+                        help='data directory for --dataloader and the static_int8 calibration')
+    parser.add_argument('--gated-head', action='store_true',
+                        help='also compare location-gated with full head scoring on synthetic landmarks')
+    parser.add_argument('--head-classes', type=_int_list, default=[100, 1000, 10000],
+                        help='class counts for --gated-head')
+    parser.add_argument('--radius', type=float, default=None, help='gating radius in metres for --gated-head')
+    parser.add_argument('--output', default=None, help='JSON output (default: models/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='baseline JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed relative slowdown')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("="*60)
+    print("Landmark Classifier Benchmark")
+    print("="*60)
+
+    # Auto-detect paths based on current directory
+    if Path('models').exists() or Path('.').resolve().name == 'ml_training':
+        models_dir = Path('models')
+    else:
+        models_dir = Path('ml_training/models')
+
+    model_path = Path(args.model) if args.model else models_dir / 'best_model.pth'
+    if not model_path.exists():
+        print(f"Error: Model not found at {model_path}")
+        print("Run 'python scripts/train_model.py' first")
+        sys.exit(1)
+
+    checkpoint = torch.load(model_path, map_location='cpu')
+    model, _ = load_pytorch_model(model_path, checkpoint['num_classes'])
+
+    variants = [v for v in args.variants.split(',') if v]
+    thread_counts = args.threads or sorted({1, os.cpu_count() or 1})
+    commit = _git_commit()
+
+    input_size = checkpoint_arch(checkpoint)['input_size']
+
+    calibration = None
+    if 'static_int8' in variants:
+        calibration = load_calibration(checkpoint, args.data_dir or models_dir.parent / 'data', input_size)
+        if calibration is None:
+            variants.remove('static_int8')
+
+    print(f"\nInference ({', '.join(variants)}, {input_size}px)...")
+    latency, throughput = run_benchmarks(model, variants, args.batch_sizes, thread_counts, args.iterations,
+                                         input_size=input_size, calibration=calibration)
+
+    results = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'model': str(model_path),
+            'num_classes': checkpoint['num_classes'],
+            'input_size': input_size,
+            'torch': torch.__version__,
+            'cpu_count': os.cpu_count(),
+            'platform': platform.platform()
+        },
+        'latency': latency,
+        'throughput': throughput
+    }
+
+    if args.dataloader:
+        print("\nDataLoader...")
+        torch.set_num_threads(os.cpu_count() or 1)
+        results['dataloader'] = benchmark_dataloaders(args.data_dir, 32, [0, 2, min(8, os.cpu_count() or 1)])
+
+    if args.gated_head:
+        # Imported lazily, like the DataLoader benchmark
+        from location_gating import DEFAULT_RADIUS_M, benchmark_gated_head
+
+        torch.set_num_threads(1)
+        print("\nClassifier head, full vs. location-gated (1 thread)...")
+        results['gated_head'] = benchmark_gated_head(args.head_classes, checkpoint_arch(checkpoint)['hidden_units'],
+                                                     radius_m=args.radius or DEFAULT_RADIUS_M)
+
+    output_path = Path(args.output) if args.output else models_dir / 'benchmarks' / f"{commit or 'latest'}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results saved to {output_path}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regressions vs {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"✓ No regressions vs {args.compare} (tolerance {args.tolerance:.0%})")
+
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
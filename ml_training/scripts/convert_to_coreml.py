@@ -1,46 +1,91 @@
 #!/usr/bin/env python3
 """
 Convert the trained PyTorch model to Core ML format for iOS deployment.
+
+The model takes RGB pixels scaled to [0, 1] and applies the per-channel
+ImageNet normalization of training itself. After converting, the result is
+checked against the validation transforms on one image from data/.
+
+torch and torchvision are imported when a model is loaded or converted, so
+the inputs are checked (and --help shown) without paying for them.
 """
+import argparse
 import json
+import platform
 import sys
 from pathlib import Path
-import torch
-import torch.nn as nn
-from torchvision import models
-import coremltools as ct
-from PIL import Image
+from landmark_store import load_class_mapping
 
 
 def load_pytorch_model(model_path, num_classes):
     """Load the trained PyTorch model."""
+    import torch
+    import architectures
+
     print(f"Loading PyTorch model from {model_path}...")
 
-    # Recreate model architecture
-    model = models.mobilenet_v3_small(pretrained=False)
+    checkpoint = torch.load(model_path, map_location='cpu')
 
-    # Replace classifier (same as training)
-    num_features = model.classifier[0].in_features
-    model.classifier = nn.Sequential(
-        nn.Linear(num_features, 256),
-        nn.Hardswish(),
-        nn.Dropout(0.2),
-        nn.Linear(256, num_classes)
-    )
+    # Recreate model architecture (same as training, see architectures.py)
+    arch = architectures.checkpoint_arch(checkpoint)
+    model = architectures.build_network(arch, num_classes)
 
     # Load weights
-    checkpoint = torch.load(model_path, map_location='cpu')
     model.load_state_dict(checkpoint['model_state_dict'])
     model.eval()
 
     print(f"✓ Model loaded successfully")
+    print(f"  Architecture: {architectures.describe(arch)}")
     print(f"  Number of classes: {num_classes}")
 
     return model, checkpoint
 
 
-def convert_to_coreml(pytorch_model, class_labels, output_path=None):
-    """Convert PyTorch model to Core ML format."""
+def with_input_normalization(model):
+    """Wrap a model so it takes [0, 1] RGB and applies ImageNet normalization itself.
+
+    Core ML ImageType preprocessing only has one scale for all channels, so the
+    per-channel mean and std used in training (make_val_transforms) are part of
+    the converted graph instead.
+    """
+    import torch
+    import torch.nn as nn
+
+    class Normalize(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.register_buffer('mean', torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1))
+            self.register_buffer('std', torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1))
+
+        def forward(self, x):
+            return (x - self.mean) / self.std
+
+    return nn.Sequential(Normalize(), model).eval()
+
+
+def image_input(shape):
+    """Core ML image input shared by every exported model: pixels scaled to [0, 1]."""
+    import coremltools as ct
+
+    return ct.ImageType(
+        name="image",
+        shape=shape,
+        scale=1/255.0,  # Normalize to [0, 1]
+        bias=[0, 0, 0]
+    )
+
+
+def convert_to_coreml(pytorch_model, class_labels, output_path=None, pass_pipeline=None,
+                      minimum_deployment_target=None, input_size=224):
+    """Convert PyTorch model to Core ML format.
+
+    A `pass_pipeline` with compression passes (see optimize_model.py) compresses
+    the weights during conversion; compressed weights need iOS 16.
+    """
+    # Imported here so load_pytorch_model also works where coremltools is missing
+    import coremltools as ct
+    import torch
+
     print("\nConverting to Core ML format...")
 
     # Auto-detect output path
@@ -50,26 +95,22 @@ def convert_to_coreml(pytorch_model, class_labels, output_path=None):
         else:
             output_path = 'ml_training/models/LandmarkClassifier.mlpackage'
 
-    # Define input shape (batch=1, channels=3, height=224, width=224)
-    example_input = torch.rand(1, 3, 224, 224)
+    # Define input shape (batch=1, channels=3, height=input_size, width=input_size)
+    example_input = torch.rand(1, 3, input_size, input_size)
 
-    # Trace the model
+    # Trace the model, with the normalization of the validation transforms
     print("  Tracing model...")
-    traced_model = torch.jit.trace(pytorch_model, example_input)
+    traced_model = torch.jit.trace(with_input_normalization(pytorch_model), example_input)
 
     # Convert to Core ML
     print("  Converting to Core ML...")
     mlmodel = ct.convert(
         traced_model,
-        inputs=[ct.ImageType(
-            name="image",
-            shape=example_input.shape,
-            scale=1/255.0,  # Normalize to [0, 1]
-            bias=[0, 0, 0]
-        )],
+        inputs=[image_input(example_input.shape)],
         classifier_config=ct.ClassifierConfig(class_labels),
-        minimum_deployment_target=ct.target.iOS15,
-        compute_units=ct.ComputeUnit.ALL  # Use Neural Engine when available
+        minimum_deployment_target=minimum_deployment_target or ct.target.iOS15,
+        compute_units=ct.ComputeUnit.ALL,  # Use Neural Engine when available
+        pass_pipeline=pass_pipeline
     )
 
     # Add metadata
@@ -79,7 +120,7 @@ def convert_to_coreml(pytorch_model, class_labels, output_path=None):
     mlmodel.license = 'MIT'
 
     # Add input/output descriptions
-    mlmodel.input_description['image'] = 'Input image of a landmark (224x224 RGB)'
+    mlmodel.input_description['image'] = f'Input image of a landmark ({input_size}x{input_size} RGB)'
 
     # Try to add output descriptions (names may vary)
     try:
@@ -106,6 +147,54 @@ def convert_to_coreml(pytorch_model, class_labels, output_path=None):
     return mlmodel, output_path
 
 
+def find_sample_image(data_dir):
+    """One validation (or training) image for the parity check, or None."""
+    for split in ('validation', 'train'):
+        split_dir = Path(data_dir) / split
+        if split_dir.is_dir():
+            for path in sorted(split_dir.rglob('*')):
+                if path.suffix.lower() in ('.jpg', '.jpeg', '.png'):
+                    return path
+    return None
+
+
+def check_preprocessing_parity(pytorch_model, class_labels, image_path, mlmodel=None, input_size=224,
+                               tolerance=1e-4, coreml_tolerance=1e-2):
+    """Compare the converted preprocessing with the validation transforms on one image.
+
+    The reference is the PyTorch model on make_val_transforms output. It is
+    compared with the traced graph that Core ML converts, fed [0, 1] pixels
+    like the ImageType input, and on macOS with the Core ML model itself.
+    Returns the largest probability differences.
+    """
+    import torch
+    from PIL import Image
+    from torchvision import transforms
+    from architectures import make_val_transforms
+
+    with Image.open(image_path) as img:
+        image = img.convert('RGB')
+    resized = transforms.Resize((input_size, input_size))(image)
+
+    with torch.inference_mode():
+        expected = torch.softmax(pytorch_model(make_val_transforms(input_size)(image)[None]), dim=1)[0]
+        pixels = transforms.ToTensor()(resized)[None]
+        traced = torch.jit.trace(with_input_normalization(pytorch_model), pixels)
+        actual = torch.softmax(traced(pixels), dim=1)[0]
+
+    diffs = {'traced': float((expected - actual).abs().max())}
+    if diffs['traced'] > tolerance:
+        raise ValueError(f"Traced graph differs from the validation transforms by {diffs['traced']:.2e}")
+
+    if mlmodel is not None and platform.system() == 'Darwin':
+        probs = mlmodel.predict({'image': resized})['classLabelProbs']
+        coreml = torch.tensor([probs[label] for label in class_labels])
+        diffs['coreml'] = float((expected - coreml).abs().max())
+        if diffs['coreml'] > coreml_tolerance:
+            raise ValueError(f"Core ML model differs from the validation transforms by {diffs['coreml']:.2e}")
+    return diffs
+
+
 def create_class_mapping_for_swift(class_to_idx, output_path=None):
     """Create a mapping file that can be used in Swift code."""
     # Auto-detect paths
@@ -115,19 +204,13 @@ def create_class_mapping_for_swift(class_to_idx, output_path=None):
         else:
             output_path = 'ml_training/models/class_mapping_swift.json'
 
-    # Auto-detect original mapping path
-    if Path('data/class_mapping.json').exists():
-        original_mapping_path = Path('data/class_mapping.json')
-    else:
-        original_mapping_path = Path('ml_training/data/class_mapping.json')
-
-    if not original_mapping_path.exists():
+    # Auto-detect data directory with the landmark store
+    data_dir = Path('data') if Path('data').exists() else Path('ml_training/data')
+    original_mapping = load_class_mapping(data_dir)
+    if original_mapping is None:
         print("Warning: Original class mapping not found")
         return
 
-    with open(original_mapping_path, 'r', encoding='utf-8') as f:
-        original_mapping = json.load(f)
-
     # Create reverse mapping: class_name -> landmark_id
     swift_mapping = {}
     for class_name, info in original_mapping.items():
@@ -149,7 +232,14 @@ def create_class_mapping_for_swift(class_to_idx, output_path=None):
     return swift_mapping
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Convert models/best_model.pth to Core ML and write class_mapping_swift.json.')
+    return parser.parse_args()
+
+
 def main():
+    parse_args()
     print("="*60)
     print("PyTorch to Core ML Converter")
     print("="*60)
@@ -192,7 +282,22 @@ def main():
     pytorch_model, checkpoint = load_pytorch_model(MODEL_PATH, num_classes)
 
     # Convert to Core ML
-    mlmodel, output_path = convert_to_coreml(pytorch_model, class_labels, OUTPUT_PATH)
+    import architectures
+    input_size = architectures.checkpoint_arch(checkpoint)['input_size']
+    mlmodel, output_path = convert_to_coreml(pytorch_model, class_labels, OUTPUT_PATH, input_size=input_size)
+
+    # The app feeds camera pixels, so the model must normalize like training
+    sample = find_sample_image(CLASS_MAPPING_PATH.parent)
+    if sample is None:
+        print("Warning: No image found for the preprocessing parity check")
+    else:
+        try:
+            diffs = check_preprocessing_parity(pytorch_model, class_labels, sample, mlmodel, input_size)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"✓ Preprocessing matches the validation transforms on {sample.name} "
+              f"(max prob. difference: {', '.join(f'{k} {v:.1e}' for k, v in diffs.items())})")
 
     # Create Swift mapping
     swift_mapping = create_class_mapping_for_swift(class_to_idx)
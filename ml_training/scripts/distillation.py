@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Knowledge distillation from a larger teacher into a small student model.
+
+The fine-tuned teacher runs once per training image (plain, non-augmented
+view) and its logits are stored as a float32 memory-mapped array next to the
+tensor cache. Rows are keyed by image path and modification time like the
+tensor and feature caches, so only new or changed images are run through the
+teacher again. The student then trains against these cached soft targets
+while still seeing its own augmented inputs.
+"""
+import json
+import os
+from pathlib import Path
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import Dataset
+from tqdm import tqdm
+from batch_augment import BatchAugmenter
+
+CACHE_VERSION = 1
+
+
+class DistillationLoss(nn.Module):
+    """Blend of the softened teacher KL divergence and the hard-label loss.
+
+    Without teacher logits (validation) this is plain cross entropy, so
+    validation losses stay comparable to normal training runs.
+    """
+
+    def __init__(self, temperature=4.0, alpha=0.7):
+        super().__init__()
+        self.temperature = temperature
+        self.alpha = alpha
+        self.cross_entropy = nn.CrossEntropyLoss()
+
+    def forward(self, outputs, labels, teacher_logits=None):
+        hard_loss = self.cross_entropy(outputs, labels)
+        if teacher_logits is None:
+            return hard_loss
+
+        t = self.temperature
+        soft_loss = F.kl_div(
+            F.log_softmax(outputs.float() / t, dim=1),
+            F.softmax(teacher_logits.float() / t, dim=1),
+            reduction='batchmean'
+        ) * (t * t)
+        return self.alpha * soft_loss + (1 - self.alpha) * hard_loss
+
+
+def _load_index(store_dir):
+    """Load the index of an existing logit store, or None if there is none."""
+    index_path = store_dir / 'index.json'
+    if not index_path.exists() or not (store_dir / 'logits.f32').exists():
+        return None
+
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+
+    if index.get('version') != CACHE_VERSION:
+        return None
+    return index
+
+
+@torch.no_grad()
+def build_logit_cache(teacher, teacher_id, image_dataset, store_dir, device, input_size=None,
+                      batch_size=64):
+    """Build or refresh the teacher logits for one CachedImageFolder split.
+
+    `teacher_id` identifies the teacher weights; a different teacher
+    invalidates every cached row.
+    """
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    teacher.eval()
+
+    entries = image_dataset.entries
+    num_classes = len(image_dataset.classes)
+    settings = {'version': CACHE_VERSION, 'teacher': teacher_id, 'num_classes': num_classes}
+
+    old_index = _load_index(store_dir)
+    old_rows = {}
+    old_logits = None
+    if old_index is not None and all(old_index.get(k) == v for k, v in settings.items()):
+        if old_index['entries'] == entries:
+            print(f"✓ {store_dir.name}: teacher logits up to date ({len(entries)} images)")
+            return store_dir
+
+        old_rows = {
+            (entry['path'], entry['mtime_ns']): row
+            for row, entry in enumerate(old_index['entries'])
+        }
+        if old_rows:
+            old_logits = np.memmap(store_dir / 'logits.f32', dtype=np.float32, mode='r',
+                                   shape=(len(old_index['entries']), num_classes))
+
+    tmp_path = store_dir / 'logits.f32.tmp'
+    logits = np.memmap(tmp_path, dtype=np.float32, mode='w+', shape=(len(entries), num_classes))
+
+    missing = []
+    for row, entry in enumerate(entries):
+        old_row = old_rows.get((entry['path'], entry['mtime_ns']))
+        if old_row is not None:
+            logits[row] = old_logits[old_row]
+        else:
+            missing.append(row)
+
+    # Normalizes uint8 images exactly like the validation transforms
+    normalize = BatchAugmenter(device, size=input_size)
+    for start in tqdm(range(0, len(missing), batch_size), desc=f"Caching {store_dir.name} teacher logits"):
+        rows = missing[start:start + batch_size]
+        images = torch.stack([image_dataset[row][0] for row in rows])
+        logits[rows] = teacher(normalize(images, train=False)).float().cpu().numpy()
+
+    logits.flush()
+    del logits, old_logits
+    os.replace(tmp_path, store_dir / 'logits.f32')
+
+    with open(store_dir / 'index.json', 'w') as f:
+        json.dump({**settings, 'entries': entries}, f)
+
+    print(f"✓ {store_dir.name}: cached teacher logits for {len(entries)} images ({len(missing)} computed)")
+    return store_dir
+
+
+class TeacherLogitsDataset(Dataset):
+    """Wrap a CachedImageFolder so each sample also carries its teacher logits."""
+
+    def __init__(self, dataset, store_dir):
+        self.dataset = dataset
+        self.store_dir = Path(store_dir)
+
+        index = _load_index(self.store_dir)
+        if index is None or index['entries'] != dataset.entries:
+            raise FileNotFoundError(f"No matching teacher logits found at {self.store_dir}")
+
+        self.num_classes = index['num_classes']
+        self.targets = dataset.targets
+        self._logits = None
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getstate__(self):
+        # Each DataLoader worker opens its own memory map
+        state = self.__dict__.copy()
+        state['_logits'] = None
+        return state
+
+    def __getitem__(self, idx):
+        if self._logits is None:
+            self._logits = np.memmap(self.store_dir / 'logits.f32', dtype=np.float32, mode='r',
+                                     shape=(len(self.dataset), self.num_classes))
+
+        image, target = self.dataset[idx]
+        return image, target, torch.from_numpy(np.array(self._logits[idx]))
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Download the landmark_photos of every saved landmark into data/train.
+
+Photo rows (landmark_id, photo_url, updated_at) are paged from Supabase like
+the landmarks themselves. The photos are then fetched concurrently over one
+pooled aiohttp connector that bounds both the total number of connections
+and the connections per host, with retries and backoff for transient
+failures. Each response body is read into memory (at most 30 MB), then
+decoded, scaled down so its shorter side is at most --size pixels and written
+as JPEG straight to data/train/<class_name>/ in a thread pool, so decoding
+never stalls the other downloads. JPEGs are decoded at a reduced scale, so
+the full-size bitmap is never built, and the full-size file is never stored.
+The class name comes from fetch_landmarks.py.
+
+The ETag and `updated_at` of every downloaded photo are kept in
+data/.photo_state.json. Photos that are still on disk (also after
+prepare_dataset.py moved them to validation/ or rejected/) are skipped while
+their `updated_at` is unchanged, and revalidated with If-None-Match
+otherwise, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+import aiohttp
+from fetch_landmarks import (SUPABASE_KEY, SUPABASE_URL, check_config, create_session, iter_pages,
+                             landmark_class_name, load_saved_landmarks)
+
+PHOTO_FIELDS = 'landmark_id,photo_url,updated_at'
+STATE_FILE = '.photo_state.json'
+# Photos that failed in the last run, so pipeline.py does not treat it as complete
+FAILURES_FILE = '.photo_failures.json'
+# Where prepare_dataset.py may have moved a downloaded photo
+PHOTO_DIRS = ('train', 'validation', 'rejected')
+# photo_<16 hex digits>, before any suffix prepare_dataset.py adds on a name clash
+PHOTO_STEM_LENGTH = len('photo_') + 16
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def fetch_photo_rows(landmark_ids, base_url=None, key=None, page_size=1000, session=None):
+    """All landmark_photos rows that belong to the given landmarks."""
+    base_url = base_url or SUPABASE_URL
+    session = session or create_session(key or SUPABASE_KEY)
+    params = {'select': PHOTO_FIELDS, 'order': 'updated_at.asc,photo_url.asc'}
+
+    rows = []
+    for page, _ in iter_pages(session, f"{base_url}/rest/v1/landmark_photos", params, page_size=page_size):
+        rows.extend(row for row in page if row['landmark_id'] in landmark_ids and row.get('photo_url'))
+    return rows
+
+
+def photo_watermark(base_url=None, key=None, session=None, timeout=30):
+    """Newest `updated_at` and row count of landmark_photos, in one request.
+
+    Changes when photos are added, changed or deleted, so pipeline.py can
+    skip the download stage without listing every photo.
+    """
+    base_url = base_url or SUPABASE_URL
+    session = session or create_session(key or SUPABASE_KEY)
+    response = session.get(
+        f"{base_url}/rest/v1/landmark_photos",
+        params={'select': 'updated_at', 'order': 'updated_at.desc.nullslast'},
+        headers={'Range-Unit': 'items', 'Range': '0-0', 'Prefer': 'count=exact'},
+        timeout=timeout
+    )
+    if response.status_code == 416:
+        # No rows at all
+        return {'updated_at': None, 'count': 0}
+    response.raise_for_status()
+    rows = response.json()
+    # Content-Range: 0-0/<total>
+    total = response.headers.get('Content-Range', '*/').rsplit('/', 1)[-1]
+    return {
+        'updated_at': rows[0].get('updated_at') if rows else None,
+        'count': int(total) if total.isdigit() else len(rows),
+        'etag': response.headers.get('ETag')
+    }
+
+
+def photo_filename(photo_url):
+    """Stable file name of a photo, independent of the URL's own file name."""
+    return f"photo_{hashlib.sha1(photo_url.encode('utf-8')).hexdigest()[:16]}.jpg"
+
+
+def find_existing(data_dir):
+    """Map file name -> path of every downloaded photo in train/validation/rejected."""
+    existing = {}
+    for name in PHOTO_DIRS:
+        root = Path(data_dir) / name
+        if root.exists():
+            for path in root.rglob('photo_*.jpg'):
+                existing[path.stem[:PHOTO_STEM_LENGTH] + path.suffix] = path
+    return existing
+
+
+def interleave_by_host(jobs):
+    """Order jobs round-robin over hosts so one slow host does not block the workers."""
+    by_host = {}
+    for job in jobs:
+        by_host.setdefault(urlsplit(job['photo_url']).netloc, []).append(job)
+    queues = list(by_host.values())
+    ordered = []
+    for i in range(max((len(q) for q in queues), default=0)):
+        ordered.extend(q[i] for q in queues if i < len(q))
+    return ordered
+
+
+def load_state(data_dir):
+    state_path = Path(data_dir) / STATE_FILE
+    if not state_path.exists():
+        return {}
+    with open(state_path, 'r') as f:
+        return json.load(f)
+
+
+def save_failures(failures, data_dir):
+    """Record the photos that failed, or remove the record when none did."""
+    failures_path = Path(data_dir) / FAILURES_FILE
+    if not failures:
+        failures_path.unlink(missing_ok=True)
+        return
+    with open(failures_path, 'w') as f:
+        json.dump([{'photo_url': url, 'error': error} for url, error in failures], f, indent=2)
+
+
+def save_state(state, data_dir):
+    """Write the state atomically, it is also saved while downloads are running."""
+    state_path = Path(data_dir) / STATE_FILE
+    tmp_path = state_path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def resize_and_save(data, path, size, quality):
+    """Decode image bytes, scale the shorter side down to `size` and write an RGB JPEG atomically.
+
+    JPEGs are decoded at a reduced DCT scale that still covers `size`, so the
+    full-size bitmap is never built.
+    """
+    # Imported here so starting the downloader does not load PIL
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as source:
+        # No-op for formats other than JPEG
+        source.draft('RGB', (size, size))
+        image = source.convert('RGB')
+    scale = size / min(image.size)
+    if scale < 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    image.save(tmp_path, format='JPEG', quality=quality)
+    os.replace(tmp_path, path)
+    return image.size
+
+
+class PhotoDownloader:
+    """Downloads photos and decodes and writes them resized in an executor."""
+
+    def __init__(self, session, executor, size=512, quality=90, max_bytes=30 * 1024 ** 2,
+                 retries=4, backoff=0.5):
+        self.session = session
+        self.executor = executor
+        self.size = size
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _read(self, response):
+        """Read the body, giving up on responses larger than max_bytes."""
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            body += chunk
+            if len(body) > self.max_bytes:
+                raise ValueError(f"larger than {self.max_bytes // 1024 ** 2} MB")
+        return bytes(body)
+
+    async def download(self, url, path, etag=None):
+        """Download one photo to `path`.
+
+        Returns ('downloaded', etag, size), ('not_modified', etag, None) or
+        ('failed', error, None).
+        """
+        headers = {'If-None-Match': etag} if etag else {}
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 304:
+                        return 'not_modified', etag, None
+                    if response.status in RETRY_STATUSES and attempt < self.retries:
+                        retry_after = response.headers.get('Retry-After', '')
+                        if retry_after.isdigit():
+                            delay = max(delay, int(retry_after))
+                        await asyncio.sleep(delay)
+                        continue
+                    if response.status != 200:
+                        return 'failed', f"HTTP {response.status}", None
+                    data = await self._read(response)
+                    new_etag = response.headers.get('ETag')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt < self.retries:
+                    await asyncio.sleep(delay)
+                    continue
+                return 'failed', str(e) or type(e).__name__, None
+            except ValueError as e:
+                return 'failed', str(e), None
+
+            loop = asyncio.get_running_loop()
+            try:
+                size = await loop.run_in_executor(self.executor, resize_and_save, data, path,
+                                                  self.size, self.quality)
+            except Exception as e:
+                # One bad image (or a full disk) must not stop the other downloads
+                return 'failed', f"not saved ({type(e).__name__}: {e})", None
+            return 'downloaded', new_etag, size
+        return 'failed', 'retries exhausted', None
+
+
+def plan_downloads(rows, class_names, data_dir, state, force=False):
+    """Split photo rows into jobs to download and photos that are up to date."""
+    existing = {} if force else find_existing(data_dir)
+    jobs, up_to_date = [], 0
+    for row in rows:
+        url = row['photo_url']
+        name = photo_filename(url)
+        entry = state.get(url)
+        path = existing.get(name)
+
+        if path is not None and entry and entry.get('updated_at') == row.get('updated_at'):
+            up_to_date += 1
+            continue
+        jobs.append({
+            'photo_url': url,
+            'updated_at': row.get('updated_at'),
+            'class_name': class_names[row['landmark_id']],
+            # A changed photo replaces the file wherever prepare_dataset.py put it
+            'path': path or Path(data_dir) / 'train' / class_names[row['landmark_id']] / name,
+            # Revalidate only what is still on disk
+            'etag': entry.get('etag') if entry and path is not None else None
+        })
+    return jobs, up_to_date
+
+
+async def download_all(jobs, state, data_dir, connections=16, per_host=4, size=512, quality=90,
+                       timeout=60, save_every=50):
+    """Run the download jobs, updating `state` as they finish. Returns counts per outcome."""
+    counts = {'downloaded': 0, 'not_modified': 0, 'failed': 0}
+    failures = []
+    queue = asyncio.Queue()
+    for job in interleave_by_host(jobs):
+        queue.put_nowait(job)
+    done = 0
+    start = time.time()
+
+    connector = aiohttp.TCPConnector(limit=connections, limit_per_host=per_host)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    with ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1)) as executor:
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            downloader = PhotoDownloader(session, executor, size=size, quality=quality)
+
+            async def worker():
+                nonlocal done
+                while not queue.empty():
+                    job = queue.get_nowait()
+                    status, detail, _ = await downloader.download(job['photo_url'], job['path'], job['etag'])
+                    counts[status] += 1
+                    if status == 'failed':
+                        failures.append((job['photo_url'], detail))
+                    else:
+                        state[job['photo_url']] = {
+                            'updated_at': job['updated_at'],
+                            'etag': detail,
+                            'class_name': job['class_name']
+                        }
+                    done += 1
+                    if done % save_every == 0:
+                        save_state(state, data_dir)
+                        print(f"  {done}/{len(jobs)} photos ({done / (time.time() - start):.1f}/s)")
+
+            try:
+                await asyncio.gather(*(worker() for _ in range(min(connections, len(jobs)))))
+            finally:
+                # Keep the progress of an interrupted run
+                save_state(state, data_dir)
+
+    for url, error in failures[:10]:
+        print(f"  ✗ {url}: {error}")
+    if len(failures) > 10:
+        print(f"  ... and {len(failures) - 10} more failures")
+    save_failures(failures, data_dir)
+    return counts
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Download landmark_photos into data/train.')
+    parser.add_argument('--data-dir', default='ml_training/data',
+                        help='directory with the saved landmarks, photos go to <data-dir>/train')
+    parser.add_argument('--connections', type=int, default=16, help='concurrent connections in total')
+    parser.add_argument('--per-host', type=int, default=4, help='concurrent connections per host')
+    parser.add_argument('--size', type=int, default=512, help='shorter side of the saved images in pixels')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality of the saved images')
+    parser.add_argument('--timeout', type=int, default=60, help='seconds per photo download')
+    parser.add_argument('--force', action='store_true', help='download every photo again')
+    parser.add_argument('--page-size', type=int, default=1000, help='photo rows per Range request')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    check_config()
+
+    print("="*60)
+    print("Downloading Landmark Photos")
+    print("="*60)
+
+    landmarks = load_saved_landmarks(args.data_dir)
+    if not landmarks:
+        print(f"Error: No landmarks saved in {args.data_dir}")
+        print("Run 'python scripts/fetch_landmarks.py' first")
+        sys.exit(1)
+    class_names = {landmark['id']: landmark_class_name(landmark) for landmark in landmarks}
+
+    try:
+        rows = fetch_photo_rows(set(class_names), page_size=args.page_size)
+    except Exception as e:
+        print(f"Error fetching landmark_photos: {e}")
+        sys.exit(1)
+    print(f"✓ {len(rows)} photos for {len({row['landmark_id'] for row in rows})} of {len(landmarks)} landmarks")
+
+    state = {} if args.force else load_state(args.data_dir)
+    jobs, up_to_date = plan_downloads(rows, class_names, args.data_dir, state, force=args.force)
+    print(f"✓ {up_to_date} photos up to date, {len(jobs)} to download or revalidate")
+
+    counts = {'downloaded': 0, 'not_modified': 0, 'failed': 0}
+    start = time.time()
+    if jobs:
+        print(f"\nDownloading ({args.connections} connections, {args.per_host} per host)...")
+        counts = asyncio.run(download_all(jobs, state, args.data_dir, connections=args.connections,
+                                          per_host=args.per_host, size=args.size, quality=args.quality,
+                                          timeout=args.timeout))
+    else:
+        save_state(state, args.data_dir)
+        save_failures([], args.data_dir)
+
+    print(f"\n{'='*60}")
+    print(f"Downloaded: {counts['downloaded']}, unchanged: {up_to_date + counts['not_modified']}, "
+          f"failed: {counts['failed']} ({time.time() - start:.1f}s)")
+    print(f"Next: run 'python scripts/prepare_dataset.py' to verify and split the images")
+    print(f"{'='*60}")
+
+
+if __name__ == '__main__':
+    main()
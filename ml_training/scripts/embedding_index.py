@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Nearest-neighbour landmark recognition on classifier embeddings.
+
+The trained model's classifier hidden layer (256-d by default) is used as an
+embedding. Every training image is embedded once, L2-normalized and stored in
+a compact float16 or int8 index together with one prototype (mean embedding)
+per class. Queries are matched by cosine similarity, either exactly with a
+vectorized NumPy matrix product or, for large sets, through an inverted file
+with product-quantized residuals (IVF-PQ) that only scans a few lists.
+
+New landmarks are registered by embedding a handful of reference images
+(`add`), without retraining or re-shipping the classifier. The index is
+written as raw little-endian arrays plus index.json to
+models/embedding_index/, next to class_mapping_swift.json, so the app can
+memory-map it.
+
+    python scripts/embedding_index.py build --dtype int8 --ivf-lists 64
+    python scripts/embedding_index.py add --class-name new_landmark --images photos/ --landmark-id abc123
+    python scripts/embedding_index.py query photo.jpg --k 5
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torchvision import datasets
+from predictor import Predictor
+
+INDEX_VERSION = 1
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def quantize(vectors, dtype):
+    """Store unit vectors as float16, or int8 with one float16 scale per vector."""
+    if dtype == 'float16':
+        return vectors.astype(np.float16), None
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float16)
+
+
+def dequantize(codes, scales):
+    if scales is None:
+        return codes.astype(np.float32)
+    return codes.astype(np.float32) * scales.astype(np.float32)[:, None]
+
+
+def kmeans(x, k, iterations=20, seed=0):
+    """Plain Lloyd's k-means, returns (centroids, assignments)."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        # Squared distances without materializing (n, k, d)
+        distances = (x ** 2).sum(1)[:, None] - 2 * x @ centroids.T + (centroids ** 2).sum(1)[None, :]
+        assignments = distances.argmin(1)
+        for c in range(k):
+            members = x[assignments == c]
+            if len(members):
+                centroids[c] = members.mean(0)
+    return centroids, assignments
+
+
+def top_k(scores, k):
+    """Indices and values of the k largest scores per row, best first."""
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-values, axis=1)
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+class IVFPQ:
+    """Inverted file over coarse centroids with product-quantized residuals.
+
+    Vectors are assigned to the nearest of `num_lists` coarse centroids; the
+    residual to that centroid is split into `subspaces` parts, each encoded
+    as one byte (index into 256 sub-centroids). A query scores only the
+    vectors in its `nprobe` closest lists, using per-query lookup tables.
+    """
+
+    def __init__(self, coarse, codebooks, codes, ids, offsets):
+        self.coarse = coarse
+        self.codebooks = codebooks
+        self.codes = codes
+        self.ids = ids
+        self.offsets = offsets
+
+    @classmethod
+    def train(cls, vectors, num_lists=64, subspaces=16, iterations=20, seed=0):
+        n, dim = vectors.shape
+        if dim % subspaces:
+            raise ValueError(f"Embedding size {dim} is not divisible by {subspaces} subspaces")
+        num_lists = min(num_lists, n)
+        coarse, assignments = kmeans(vectors, num_lists, iterations, seed)
+        residuals = vectors - coarse[assignments]
+
+        sub_dim = dim // subspaces
+        centroids = min(256, n)
+        codebooks = np.zeros((subspaces, centroids, sub_dim), dtype=np.float32)
+        codes = np.zeros((n, subspaces), dtype=np.uint8)
+        for j in range(subspaces):
+            part = residuals[:, j * sub_dim:(j + 1) * sub_dim]
+            codebooks[j], codes[:, j] = kmeans(part, centroids, iterations, seed + j + 1)
+
+        # Store the vectors grouped by list
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.searchsorted(assignments[order], np.arange(num_lists + 1)).astype(np.int32)
+        return cls(coarse.astype(np.float32), codebooks, codes[order], order.astype(np.int32), offsets)
+
+    def search(self, queries, k=5, nprobe=8):
+        """(ids, approximate cosine scores) of the k best vectors per query."""
+        subspaces, _, sub_dim = self.codebooks.shape
+        results_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        results_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        coarse_scores = queries @ self.coarse.T
+        probes, _ = top_k(coarse_scores, nprobe)
+
+        for q, query in enumerate(queries):
+            # Inner products of each query part with every sub-centroid
+            tables = np.einsum('jd,jcd->jc', query.reshape(subspaces, sub_dim), self.codebooks)
+            ids, scores = [], []
+            for lst in probes[q]:
+                start, end = self.offsets[lst], self.offsets[lst + 1]
+                if start == end:
+                    continue
+                codes = self.codes[start:end]
+                scores.append(coarse_scores[q, lst] + tables[np.arange(subspaces), codes].sum(1))
+                ids.append(self.ids[start:end])
+            if not ids:
+                continue
+            ids, scores = np.concatenate(ids), np.concatenate(scores)
+            best, values = top_k(scores[None, :], k)
+            results_ids[q, :best.shape[1]] = ids[best[0]]
+            results_scores[q, :best.shape[1]] = values[0]
+        return results_ids, results_scores
+
+    def save(self, index_dir):
+        self.coarse.tofile(index_dir / 'ivf_coarse.f32')
+        self.codebooks.tofile(index_dir / 'pq_codebooks.f32')
+        self.codes.tofile(index_dir / 'pq_codes.u8')
+        self.ids.tofile(index_dir / 'ivf_ids.i32')
+        self.offsets.tofile(index_dir / 'ivf_offsets.i32')
+        return {
+            'num_lists': len(self.coarse),
+            'subspaces': self.codebooks.shape[0],
+            'centroids': self.codebooks.shape[1]
+        }
+
+    @classmethod
+    def load(cls, index_dir, meta, dim):
+        subspaces, centroids = meta['subspaces'], meta['centroids']
+        return cls(
+            np.fromfile(index_dir / 'ivf_coarse.f32', dtype=np.float32).reshape(meta['num_lists'], dim),
+            np.fromfile(index_dir / 'pq_codebooks.f32', dtype=np.float32).reshape(
+                subspaces, centroids, dim // subspaces),
+            np.fromfile(index_dir / 'pq_codes.u8', dtype=np.uint8).reshape(-1, subspaces),
+            np.fromfile(index_dir / 'ivf_ids.i32', dtype=np.int32),
+            np.fromfile(index_dir / 'ivf_offsets.i32', dtype=np.int32)
+        )
+
+
+class EmbeddingIndex:
+    """Reference embeddings with their classes, prototypes and k-NN lookup."""
+
+    def __init__(self, vectors, labels, class_names, landmark_ids=None, dtype='float16', model_info=None):
+        self.dtype = dtype
+        self.codes, self.scales = quantize(normalize(vectors), dtype)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.class_names = list(class_names)
+        self.landmark_ids = dict(landmark_ids or {})
+        self.model_info = model_info or {}
+        self.ivfpq = None
+        self._matrix = None
+        self._update_prototypes()
+
+    @property
+    def dim(self):
+        return self.codes.shape[1]
+
+    def matrix(self):
+        """Dequantized float32 vectors, kept after the first search."""
+        if self._matrix is None:
+            self._matrix = dequantize(self.codes, self.scales)
+        return self._matrix
+
+    def _update_prototypes(self):
+        vectors = self.matrix()
+        self.prototypes = np.zeros((len(self.class_names), self.dim), dtype=np.float32)
+        for c in range(len(self.class_names)):
+            members = vectors[self.labels == c]
+            if len(members):
+                self.prototypes[c] = members.mean(0)
+        self.prototypes = normalize(self.prototypes)
+
+    def add(self, vectors, class_name, landmark_id=None):
+        """Register reference embeddings for a (new or existing) class."""
+        if class_name not in self.class_names:
+            self.class_names.append(class_name)
+        if landmark_id is not None:
+            self.landmark_ids[class_name] = landmark_id
+        label = self.class_names.index(class_name)
+
+        codes, scales = quantize(normalize(vectors), self.dtype)
+        self.codes = np.concatenate([self.codes, codes])
+        if self.scales is not None:
+            self.scales = np.concatenate([self.scales, scales])
+        self.labels = np.concatenate([self.labels, np.full(len(codes), label, dtype=np.int32)])
+        self._matrix = None
+        self._update_prototypes()
+        if self.ivfpq is not None:
+            # The lists would miss the new vectors, exact search until rebuilt
+            print("Warning: IVF-PQ index dropped, rebuild it with 'build --ivf-lists N'")
+            self.ivfpq = None
+        return label
+
+    def build_ivfpq(self, num_lists=64, subspaces=16, seed=0):
+        self.ivfpq = IVFPQ.train(self.matrix(), num_lists=num_lists, subspaces=subspaces, seed=seed)
+
+    def search(self, queries, k=5, method='exact', nprobe=8):
+        """(ids, cosine scores) of the k nearest reference vectors per query."""
+        queries = normalize(queries)
+        if method == 'ivfpq':
+            return self.ivfpq.search(queries, k=k, nprobe=nprobe)
+        return top_k(queries @ self.matrix().T, k)
+
+    def classify(self, queries, k=5, method='exact', nprobe=8):
+        """Predicted class and score per query.
+
+        'prototype' picks the closest class mean; 'exact' and 'ivfpq' take a
+        similarity-weighted vote of the k nearest neighbours and return the
+        winning share of the vote.
+        """
+        queries = normalize(queries)
+        if method == 'prototype':
+            scores = queries @ self.prototypes.T
+            return scores.argmax(1), scores.max(1)
+
+        ids, scores = self.search(queries, k=k, method=method, nprobe=nprobe)
+        votes = np.zeros((len(queries), len(self.class_names)), dtype=np.float32)
+        valid = ids >= 0
+        rows = np.nonzero(valid)[0]
+        np.add.at(votes, (rows, self.labels[ids[valid]]), np.maximum(scores[valid], 0))
+        totals = np.maximum(votes.sum(1), 1e-12)
+        return votes.argmax(1), votes.max(1) / totals
+
+    def describe(self, class_index):
+        name = self.class_names[class_index]
+        return {'label': name, 'landmark_id': self.landmark_ids.get(name)}
+
+    def save(self, index_dir):
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        suffix = 'f16' if self.dtype == 'float16' else 'i8'
+        self.codes.tofile(index_dir / f'vectors.{suffix}')
+        if self.scales is not None:
+            self.scales.tofile(index_dir / 'scales.f16')
+        self.labels.tofile(index_dir / 'labels.i32')
+        self.prototypes.tofile(index_dir / 'prototypes.f32')
+        for stale in ('ivf_coarse.f32', 'pq_codebooks.f32', 'pq_codes.u8', 'ivf_ids.i32', 'ivf_offsets.i32'):
+            (index_dir / stale).unlink(missing_ok=True)
+
+        meta = {
+            'version': INDEX_VERSION,
+            'dim': self.dim,
+            'count': len(self.labels),
+            'dtype': self.dtype,
+            'metric': 'cosine',
+            'classes': [
+                {'label': name, 'landmark_id': self.landmark_ids.get(name)} for name in self.class_names
+            ],
+            'model': self.model_info,
+            'ivfpq': self.ivfpq.save(index_dir) if self.ivfpq is not None else None
+        }
+        with open(index_dir / 'index.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        return index_dir
+
+    @classmethod
+    def load(cls, index_dir):
+        index_dir = Path(index_dir)
+        with open(index_dir / 'index.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported embedding index version in {index_dir}")
+
+        index = cls.__new__(cls)
+        index.dtype = meta['dtype']
+        dim = meta['dim']
+        if index.dtype == 'float16':
+            index.codes = np.fromfile(index_dir / 'vectors.f16', dtype=np.float16).reshape(-1, dim)
+            index.scales = None
+        else:
+            index.codes = np.fromfile(index_dir / 'vectors.i8', dtype=np.int8).reshape(-1, dim)
+            index.scales = np.fromfile(index_dir / 'scales.f16', dtype=np.float16)
+        index.labels = np.fromfile(index_dir / 'labels.i32', dtype=np.int32)
+        index.class_names = [c['label'] for c in meta['classes']]
+        index.landmark_ids = {c['label']: c['landmark_id'] for c in meta['classes'] if c['landmark_id']}
+        index.model_info = meta.get('model', {})
+        index.prototypes = np.fromfile(index_dir / 'prototypes.f32', dtype=np.float32).reshape(-1, dim)
+        index.ivfpq = IVFPQ.load(index_dir, meta['ivfpq'], dim) if meta.get('ivfpq') else None
+        index._matrix = None
+        return index
+
+
+@torch.inference_mode()
+def embed_folder(embedder, image_dir, transform, batch_size=64, workers=2):
+    """Embeddings and class names for an ImageFolder-style directory."""
+    dataset = datasets.ImageFolder(image_dir, transform=transform)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=workers)
+    embeddings = [embedder(inputs).numpy() for inputs, _ in loader]
+    return np.concatenate(embeddings), np.array(dataset.targets), dataset.classes
+
+
+@torch.inference_mode()
+def embed_images(embedder, predictor, paths, batch_size=64):
+    embeddings = []
+    for start in range(0, len(paths), batch_size):
+        batch = torch.stack([predictor.preprocess(p) for p in paths[start:start + batch_size]])
+        embeddings.append(embedder(batch).numpy())
+    return np.concatenate(embeddings)
+
+
+def evaluate(index, queries, labels, k=5, nprobe=8):
+    """Accuracy and single-query latency of each lookup method."""
+    methods = ['prototype', 'exact'] + (['ivfpq'] if index.ivfpq is not None else [])
+    results = {}
+    for method in methods:
+        predicted, _ = index.classify(queries, k=k, method=method, nprobe=nprobe)
+        timings = []
+        for query in queries[:200]:
+            start = time.perf_counter()
+            index.classify(query[None, :], k=k, method=method, nprobe=nprobe)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[method] = {
+            'accuracy': round(100.0 * float((predicted == labels).mean()), 2),
+            'p50_ms': round(float(np.percentile(timings, 50)), 3)
+        }
+        print(f"  {method:10s} accuracy {results[method]['accuracy']:6.2f}%  "
+              f"p50 {results[method]['p50_ms']:.3f} ms/query")
+    return results
+
+
+def export_coreml_embedder(embedder, input_size, output_path):
+    """Core ML model that outputs the embedding, for on-device queries."""
+    import coremltools as ct
+    from convert_to_coreml import image_input, with_input_normalization
+
+    example_input = torch.rand(1, 3, input_size, input_size)
+    # Same image input and normalization as the classifier conversion
+    traced = torch.jit.trace(with_input_normalization(embedder), example_input)
+    mlmodel = ct.convert(
+        traced,
+        inputs=[image_input(example_input.shape)],
+        outputs=[ct.TensorType(name='embedding')],
+        minimum_deployment_target=ct.target.iOS15
+    )
+    mlmodel.short_description = 'Landmark embedding for nearest-neighbour lookup'
+    mlmodel.save(str(output_path))
+    return output_path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Embedding index for nearest-neighbour landmark recognition.')
+    parser.add_argument('--model', default=None, help='checkpoint (default: models/best_model.pth)')
+    parser.add_argument('--data-dir', default=None, help='data directory (auto-detected)')
+    parser.add_argument('--index-dir', default=None, help='index directory (default: models/embedding_index)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='embed data/train and write the index')
+    build.add_argument('--dtype', choices=['float16', 'int8'], default='float16')
+    build.add_argument('--ivf-lists', type=int, default=0,
+                       help='also build an IVF-PQ index with this many lists (0 = exact only)')
+    build.add_argument('--pq-subspaces', type=int, default=16, help='bytes per vector in the IVF-PQ index')
+    build.add_argument('--nprobe', type=int, default=8, help='lists scanned per query in the evaluation')
+    build.add_argument('--k', type=int, default=5, help='neighbours per query in the evaluation')
+    build.add_argument('--coreml', action='store_true', help='also export the embedding network to Core ML')
+    build.add_argument('--workers', type=int, default=2)
+
+    add = commands.add_parser('add', help='register reference images for a landmark')
+    add.add_argument('--class-name', required=True)
+    add.add_argument('--images', required=True, help='directory with reference images')
+    add.add_argument('--landmark-id', default=None)
+
+    query = commands.add_parser('query', help='look up images in the index')
+    query.add_argument('images', nargs='+')
+    query.add_argument('--k', type=int, default=5)
+    query.add_argument('--method', choices=['exact', 'prototype', 'ivfpq'], default='exact')
+    query.add_argument('--nprobe', type=int, default=8)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("="*60)
+    print("Embedding Index")
+    print("="*60)
+
+    # Auto-detect paths based on current directory
+    if Path('models').exists() or Path('.').resolve().name == 'ml_training':
+        models_dir = Path('models')
+    else:
+        models_dir = Path('ml_training/models')
+    data_dir = Path(args.data_dir) if args.data_dir else \
+        (Path('data') if Path('data').exists() else Path('ml_training/data'))
+    index_dir = Path(args.index_dir) if args.index_dir else models_dir / 'embedding_index'
+
+    model_path = Path(args.model) if args.model else models_dir / 'best_model.pth'
+    if not model_path.exists():
+        print(f"Error: Model not found at {model_path}")
+        print("Run 'python scripts/train_model.py' first")
+        sys.exit(1)
+
+    predictor = Predictor(model_path, data_dir)
+    embedder = predictor.embedder
+
+    if args.command == 'build':
+        print(f"\nEmbedding {data_dir / 'train'}...")
+        vectors, labels, classes = embed_folder(embedder, data_dir / 'train', predictor.transform,
+                                                workers=args.workers)
+        index = EmbeddingIndex(
+            vectors, labels, classes,
+            landmark_ids={name: predictor.landmark_ids.get(name) for name in classes},
+            dtype=args.dtype,
+            model_info={'checkpoint': model_path.name, 'arch': predictor.arch}
+        )
+        print(f"✓ {len(labels)} embeddings ({index.dim}-d, {args.dtype}), {len(classes)} classes")
+
+        if args.ivf_lists:
+            print(f"\nTraining IVF-PQ ({args.ivf_lists} lists, {args.pq_subspaces} bytes per vector)...")
+            index.build_ivfpq(num_lists=args.ivf_lists, subspaces=args.pq_subspaces)
+
+        index.save(index_dir)
+        size_kb = sum(f.stat().st_size for f in index_dir.iterdir() if f.is_file()) / 1024
+        print(f"✓ Index saved to {index_dir} ({size_kb:.1f} KB)")
+
+        val_dir = data_dir / 'validation'
+        if val_dir.exists():
+            print("\nValidation:")
+            val_vectors, val_labels, val_classes = embed_folder(embedder, val_dir, predictor.transform,
+                                                                workers=args.workers)
+            # Map validation folder indices onto the index classes
+            mapping = np.array([index.class_names.index(c) if c in index.class_names else -1
+                                for c in val_classes])
+            evaluate(index, val_vectors, mapping[val_labels], k=args.k, nprobe=args.nprobe)
+
+        if args.coreml:
+            coreml_path = export_coreml_embedder(embedder, predictor.input_size,
+                                                 index_dir / 'LandmarkEmbedding.mlpackage')
+            print(f"✓ Core ML embedding model saved to {coreml_path}")
+
+    elif args.command == 'add':
+        if not (index_dir / 'index.json').exists():
+            print(f"Error: No index at {index_dir}, run 'build' first")
+            sys.exit(1)
+        paths = sorted(str(p) for p in Path(args.images).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not paths:
+            print(f"Error: No images found in {args.images}")
+            sys.exit(1)
+
+        index = EmbeddingIndex.load(index_dir)
+        label = index.add(embed_images(embedder, predictor, paths), args.class_name, args.landmark_id)
+        index.save(index_dir)
+        print(f"✓ Added {len(paths)} reference images as class {label} '{args.class_name}'")
+        print(f"✓ Index now has {len(index.labels)} embeddings, {len(index.class_names)} classes")
+
+    else:
+        index = EmbeddingIndex.load(index_dir)
+        if args.method == 'ivfpq' and index.ivfpq is None:
+            print("Error: The index has no IVF-PQ part, build it with --ivf-lists")
+            sys.exit(1)
+        queries = embed_images(embedder, predictor, args.images)
+        ids, scores = index.search(queries, k=args.k, method='exact' if args.method == 'prototype' else args.method,
+                                   nprobe=args.nprobe)
+        predicted, confidence = index.classify(queries, k=args.k, method=args.method, nprobe=args.nprobe)
+        for i, path in enumerate(args.images):
+            result = index.describe(predicted[i])
+            print(f"\n{path}")
+            print(f"  → {result['label']} ({result['landmark_id']}), score {confidence[i]:.3f}")
+            for neighbour, score in zip(ids[i], scores[i]):
+                if neighbour >= 0:
+                    print(f"    {index.class_names[index.labels[neighbour]]:30s} {score:.3f}")
+
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
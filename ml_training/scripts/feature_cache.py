@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Cache the activations of the frozen MobileNetV3 prefix on disk.
+
+`build_model` freezes `features[:frozen_layers]`, so its output for a given input
+never changes during training. This module runs the frozen prefix once per image
+(view 0 is the plain image, views 1..K-1 are fixed augmented copies), stores the
+activations as a float16 memory-mapped array, and trains only the remaining
+blocks and the classifier head from that cache.
+
+Rows are keyed by image path and modification time like the tensor cache, and
+augmented views are seeded per image, so adding a few new landmarks only runs the
+prefix for the new images. The store also records a hash of the prefix's
+weights and BatchNorm buffers, so it is rebuilt when training starts from a
+different checkpoint (e.g. best_model.pth in incremental mode).
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import Dataset
+from tqdm import tqdm
+from batch_augment import BatchAugmenter
+
+CACHE_VERSION = 1
+
+
+class FeatureHead(nn.Module):
+    """The trainable part of a MobileNetV3 model, fed with cached activations.
+
+    Shares its parameters with `model`, so training the head trains the model.
+    """
+
+    def __init__(self, model, frozen_layers):
+        super().__init__()
+        self.features = model.features[frozen_layers:]
+        self.avgpool = model.avgpool
+        self.classifier = model.classifier
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.avgpool(x)
+        x = torch.flatten(x, 1)
+        return self.classifier(x)
+
+
+def _view_seed(path, view, seed):
+    """Deterministic augmentation seed for one view of one image."""
+    digest = hashlib.sha1(f"{seed}:{view}:{path}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little') & 0x7fffffffffffffff
+
+
+def prefix_fingerprint(prefix):
+    """Hash of the frozen prefix's weights and buffers (BatchNorm running stats).
+
+    The prefix is frozen within one training run, but a model resumed or
+    fine-tuned from another checkpoint has a different prefix, and features
+    cached from the old one must not be reused.
+    """
+    digest = hashlib.sha256()
+    for name, tensor in prefix.state_dict().items():
+        digest.update(name.encode('utf-8'))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _load_index(store_dir):
+    """Load the index of an existing feature store, or None if there is none."""
+    index_path = store_dir / 'index.json'
+    if not index_path.exists() or not (store_dir / 'features.f16').exists():
+        return None
+
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+
+    if index.get('version') != CACHE_VERSION:
+        return None
+    return index
+
+
+@torch.no_grad()
+def build_split(model, frozen_layers, image_dataset, store_dir, device, views=1,
+                seed=0, batch_size=64):
+    """Build or refresh the feature store for one CachedImageFolder split."""
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    prefix = model.features[:frozen_layers]
+    prefix.eval()
+
+    entries = image_dataset.entries
+    settings = {
+        'version': CACHE_VERSION,
+        'frozen_layers': frozen_layers,
+        'image_size': image_dataset.image_size,
+        'views': views,
+        'seed': seed,
+        'prefix': prefix_fingerprint(prefix)
+    }
+
+    # Infer the activation shape from a dummy input
+    dummy = torch.zeros(1, 3, image_dataset.image_size, image_dataset.image_size, device=device)
+    feature_shape = list(prefix(dummy).shape[1:])
+    settings['feature_shape'] = feature_shape
+
+    old_index = _load_index(store_dir)
+    old_rows = {}
+    old_features = None
+    if old_index is not None and all(old_index.get(k) == v for k, v in settings.items()):
+        if old_index['entries'] == entries:
+            print(f"✓ {store_dir.name}: feature cache up to date ({len(entries)} images x {views} views)")
+            return store_dir
+
+        old_rows = {
+            (entry['path'], entry['mtime_ns']): row
+            for row, entry in enumerate(old_index['entries'])
+        }
+        if old_rows:
+            old_features = np.memmap(
+                store_dir / 'features.f16', dtype=np.float16, mode='r',
+                shape=(len(old_index['entries']), views, *feature_shape)
+            )
+
+    tmp_path = store_dir / 'features.f16.tmp'
+    features = np.memmap(tmp_path, dtype=np.float16, mode='w+',
+                         shape=(len(entries), views, *feature_shape))
+
+    augmenter = BatchAugmenter(device, seed=seed)
+    missing = []
+    for row, entry in enumerate(entries):
+        old_row = old_rows.get((entry['path'], entry['mtime_ns']))
+        if old_row is not None:
+            features[row] = old_features[old_row]
+        else:
+            missing.append(row)
+
+    for start in tqdm(range(0, len(missing), batch_size), desc=f"Caching {store_dir.name} features"):
+        rows = missing[start:start + batch_size]
+        images = torch.stack([image_dataset[row][0] for row in rows]).to(device)
+
+        for view in range(views):
+            if view == 0:
+                inputs = augmenter(images, train=False)
+            else:
+                inputs = []
+                for i, row in enumerate(rows):
+                    augmenter.generator.manual_seed(_view_seed(entries[row]['path'], view, seed))
+                    inputs.append(augmenter(images[i:i + 1], train=True))
+                inputs = torch.cat(inputs)
+
+            activations = prefix(inputs).to(torch.float16).cpu().numpy()
+            features[rows, view] = activations
+
+    features.flush()
+    del features, old_features
+    os.replace(tmp_path, store_dir / 'features.f16')
+
+    with open(store_dir / 'index.json', 'w') as f:
+        json.dump({**settings, 'entries': entries}, f)
+
+    print(f"✓ {store_dir.name}: cached features for {len(entries)} images "
+          f"({len(missing)} computed, {views} views, {np.prod(feature_shape) * 2 // 1024} KB each)")
+    return store_dir
+
+
+class CachedFeatureDataset(Dataset):
+    """Dataset of cached prefix activations.
+
+    With `random_view`, each access picks one of the stored views at random
+    (training); otherwise the plain, non-augmented view is returned.
+    """
+
+    def __init__(self, store_dir, random_view=False, target_transform=None):
+        self.store_dir = Path(store_dir)
+        self.random_view = random_view
+        self.target_transform = target_transform
+
+        index = _load_index(self.store_dir)
+        if index is None:
+            raise FileNotFoundError(f"No feature cache found at {self.store_dir}")
+
+        self.views = index['views']
+        self.feature_shape = tuple(index['feature_shape'])
+        self.entries = index['entries']
+        self.targets = [entry['target'] for entry in self.entries]
+        self._features = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        # Each DataLoader worker opens its own memory map
+        state = self.__dict__.copy()
+        state['_features'] = None
+        return state
+
+    def __getitem__(self, idx):
+        if self._features is None:
+            self._features = np.memmap(
+                self.store_dir / 'features.f16', dtype=np.float16, mode='r',
+                shape=(len(self.entries), self.views, *self.feature_shape)
+            )
+
+        view = 0
+        if self.random_view and self.views > 1:
+            view = int(torch.randint(self.views, (1,)))
+
+        features = torch.from_numpy(np.array(self._features[idx, view], dtype=np.float32))
+        target = self.targets[idx]
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return features, target
@@ -1,13 +1,24 @@
 #!/usr/bin/env python3
 """
 Fetch all landmarks from Supabase database and save them for training.
+
+Landmarks are paged through with Range requests over a pooled session with
+retries. After the first run only rows changed since the stored `updated_at`
+watermark are requested and merged into the saved landmarks. Landmarks are
+saved in the compact data/landmarks.store (see landmark_store.py); --json
+also writes landmarks.json and class_mapping.json.
 """
+import argparse
 import json
 import os
 import sys
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+from landmark_store import (STORE_NAME, export_json, load_class_mapping, load_landmarks, store_path,
+                            write_store)
 
 # Load environment variables
 load_dotenv()
@@ -15,78 +26,257 @@ load_dotenv()
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_ANON_KEY')
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("Error: SUPABASE_URL and SUPABASE_ANON_KEY must be set in .env file")
-    sys.exit(1)
+LANDMARK_FIELDS = 'id,name,name_en,description,description_en,latitude,longitude,category_id,updated_at'
+STATE_FILE = '.fetch_state.json'
+
+
+def check_config():
+    """Exit with a hint when the Supabase credentials are missing."""
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        print("Error: SUPABASE_URL and SUPABASE_ANON_KEY must be set in .env file")
+        sys.exit(1)
+
 
+def create_session(key, retries=5, backoff=0.5, pool_size=4):
+    """Create a pooled session that retries transient failures with backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET', 'HEAD'),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
 
-def fetch_landmarks():
-    """Fetch all active landmarks from Supabase."""
-    url = f"{SUPABASE_URL}/rest/v1/landmarks"
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}',
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'apikey': key,
+        'Authorization': f'Bearer {key}',
         'Content-Type': 'application/json'
-    }
+    })
+    return session
+
+
+def iter_pages(session, url, params, etag=None, page_size=1000, timeout=30):
+    """Yield pages of rows from a PostgREST table, following Range pagination.
+
+    Yields (rows, etag) where etag is the first page's ETag header; a 304 for
+    a matching `etag` yields nothing.
+    """
+    start = 0
+    while True:
+        headers = {'Range-Unit': 'items', 'Range': f'{start}-{start + page_size - 1}'}
+        if start == 0 and etag:
+            headers['If-None-Match'] = etag
+
+        response = session.get(url, params=params, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return
+        if response.status_code == 416:
+            # Range starts past the last row
+            return
+        response.raise_for_status()
+
+        page = response.json()
+        yield page, response.headers.get('ETag') if start == 0 else None
+
+        if len(page) < page_size:
+            return
+        start += page_size
+
+
+def iter_landmark_pages(session, base_url, since=None, etag=None, page_size=1000, timeout=30):
+    """Yield pages of landmarks as (rows, etag), see iter_pages.
+
+    Without `since`, only active landmarks are requested. With an `updated_at`
+    watermark, every row changed since then is requested, including ones that
+    were deactivated, so they can be removed locally.
+    """
     params = {
-        'is_active': 'eq.true',
-        'select': 'id,name,name_en,description,description_en,latitude,longitude,category_id'
+        'select': LANDMARK_FIELDS + ',is_active',
+        'order': 'updated_at.asc,id.asc'
     }
+    if since:
+        params['updated_at'] = f'gte.{since}'
+    else:
+        params['is_active'] = 'eq.true'
 
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        landmarks = response.json()
+    yield from iter_pages(session, f"{base_url}/rest/v1/landmarks", params, etag=etag,
+                          page_size=page_size, timeout=timeout)
 
-        print(f"✓ Fetched {len(landmarks)} landmarks from Supabase")
-        return landmarks
+
+def load_state(output_dir):
+    """Load the stored watermark and ETag of the previous fetch."""
+    state_path = Path(output_dir) / STATE_FILE
+    if not state_path.exists():
+        return {}
+    with open(state_path, 'r') as f:
+        return json.load(f)
+
+
+def load_saved_landmarks(output_dir):
+    """Load the previously saved landmarks, or an empty list."""
+    return load_landmarks(output_dir)
+
+
+def merge_landmarks(existing, changes):
+    """Merge changed rows into the saved landmarks by id.
+
+    Existing landmarks keep their position so class indices stay stable,
+    new landmarks are appended and deactivated ones are removed.
+    """
+    merged = {landmark['id']: landmark for landmark in existing}
+    added = updated = removed = 0
+
+    for row in changes:
+        is_active = row.pop('is_active', True)
+        if not is_active:
+            if merged.pop(row['id'], None) is not None:
+                removed += 1
+        elif row['id'] in merged:
+            if merged[row['id']] != row:
+                updated += 1
+            merged[row['id']] = row
+        else:
+            merged[row['id']] = row
+            added += 1
+
+    return list(merged.values()), {'added': added, 'updated': updated, 'removed': removed}
+
+
+def replace_landmarks(existing, rows):
+    """Replace the saved landmarks with a full listing of the active ones.
+
+    Landmarks missing from the listing are removed. Like merge_landmarks,
+    remaining landmarks keep their position and new ones are appended.
+    """
+    listed = {row['id'] for row in rows}
+    kept = [landmark for landmark in existing if landmark['id'] in listed]
+    landmarks, stats = merge_landmarks(kept, rows)
+    stats['removed'] = len(existing) - len(kept)
+    return landmarks, stats
+
+
+def fetch_landmarks(output_dir='ml_training/data', full=False, page_size=1000,
+                    base_url=None, key=None, session=None):
+    """Fetch active landmarks from Supabase, only the delta after the first run."""
+    base_url = base_url or SUPABASE_URL
+    key = key or SUPABASE_KEY
+    session = session or create_session(key)
+
+    state = {} if full else load_state(output_dir)
+    existing = [] if full else load_saved_landmarks(output_dir)
+    since = state.get('watermark') if existing else None
+    etag = state.get('etag') if existing else None
+
+    changes = []
+    new_etag = etag
+    not_modified = True
+    try:
+        for page, page_etag in iter_landmark_pages(session, base_url, since=since, etag=etag,
+                                                   page_size=page_size):
+            not_modified = False
+            changes.extend(page)
+            if page_etag:
+                new_etag = page_etag
     except Exception as e:
         print(f"Error fetching landmarks: {e}")
         sys.exit(1)
 
+    if since or not_modified:
+        landmarks, stats = merge_landmarks(existing, changes)
+    else:
+        # Without a watermark the listing holds only active landmarks, so
+        # saved ones missing from it were deactivated (e.g. the state file
+        # was deleted, or landmarks.json came from an older checkout)
+        landmarks, stats = replace_landmarks(existing, changes)
+    changed = not existing or any(stats.values())
+
+    watermarks = [row['updated_at'] for row in changes if row.get('updated_at')]
+    new_state = {
+        'watermark': max(watermarks + ([since] if since else [])) if watermarks or since else None,
+        'etag': new_etag
+    }
+
+    if since:
+        print(f"✓ Fetched {len(changes)} changed landmarks since {since} "
+              f"({stats['added']} added, {stats['updated']} updated, {stats['removed']} removed)")
+    elif existing:
+        print(f"✓ Fetched {len(landmarks)} landmarks from Supabase "
+              f"({stats['added']} added, {stats['updated']} updated, {stats['removed']} removed)")
+    else:
+        print(f"✓ Fetched {len(landmarks)} landmarks from Supabase")
+
+    return landmarks, new_state, changed
 
-def save_landmarks(landmarks, output_dir='ml_training/data'):
-    """Save landmarks to JSON file."""
-    output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
 
-    filepath = output_path / 'landmarks.json'
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(landmarks, f, indent=2, ensure_ascii=False)
+def save_state(state, output_dir='ml_training/data'):
+    """Store the watermark and ETag for the next conditional fetch."""
+    state_path = Path(output_dir) / STATE_FILE
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=2)
 
-    print(f"✓ Saved {len(landmarks)} landmarks to {filepath}")
 
-    # Create class mapping file for training
-    class_mapping = {}
-    for idx, landmark in enumerate(landmarks):
-        # Use name_en if available, otherwise use name
-        class_name = landmark.get('name_en', landmark['name']).lower()
-        # Clean class name - remove special chars, replace spaces with underscores
-        class_name = ''.join(c if c.isalnum() or c == ' ' else '' for c in class_name)
-        class_name = class_name.replace(' ', '_')
+def landmark_class_name(landmark):
+    """Class (and training folder) name of a landmark."""
+    # Use name_en if available, otherwise use name
+    class_name = landmark.get('name_en', landmark['name']).lower()
+    # Clean class name - remove special chars, replace spaces with underscores
+    class_name = ''.join(c if c.isalnum() or c == ' ' else '' for c in class_name)
+    return class_name.replace(' ', '_')
 
-        class_mapping[class_name] = {
-            'id': landmark['id'],
-            'name': landmark['name'],
-            'name_en': landmark.get('name_en'),
-            'class_index': idx
-        }
 
-    mapping_path = output_path / 'class_mapping.json'
-    with open(mapping_path, 'w', encoding='utf-8') as f:
-        json.dump(class_mapping, f, indent=2, ensure_ascii=False)
+def save_landmarks(landmarks, output_dir='ml_training/data', write_json=False):
+    """Save landmarks to the landmark store, and optionally as JSON files."""
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    # Class index = position in the store
+    store = write_store(landmarks, [landmark_class_name(l) for l in landmarks], store_path(output_path))
+    print(f"✓ Saved {len(landmarks)} landmarks to {store}")
 
-    print(f"✓ Saved class mapping to {mapping_path}")
+    class_mapping = load_class_mapping(output_path)
+    if write_json:
+        for path in export_json(output_path):
+            print(f"✓ Saved {path}")
 
     return landmarks, class_mapping
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fetch landmarks from Supabase.')
+    parser.add_argument('--full', action='store_true',
+                        help='ignore the stored watermark and fetch every active landmark')
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help='rows per Range request')
+    parser.add_argument('--output-dir', default='ml_training/data',
+                        help=f'directory for {STORE_NAME}')
+    parser.add_argument('--json', action='store_true',
+                        help='also write landmarks.json and class_mapping.json')
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+    check_config()
+
     print("Fetching landmarks from Supabase...")
-    landmarks = fetch_landmarks()
+    landmarks, state, changed = fetch_landmarks(args.output_dir, full=args.full, page_size=args.page_size)
 
-    print(f"\nSaving landmarks...")
-    landmarks, class_mapping = save_landmarks(landmarks)
+    # Older checkouts only have landmarks.json, convert them once
+    if changed or not store_path(args.output_dir).exists():
+        print(f"\nSaving landmarks...")
+        landmarks, class_mapping = save_landmarks(landmarks, args.output_dir, write_json=args.json)
+    else:
+        print(f"✓ Landmarks up to date, keeping saved files")
+        class_mapping = load_class_mapping(args.output_dir)
+        if args.json:
+            for path in export_json(args.output_dir):
+                print(f"✓ Saved {path}")
+    save_state(state, args.output_dir)
 
     print(f"\n{'='*60}")
     print(f"Summary:")
@@ -101,9 +291,9 @@ def main():
         print(f"  ... and {len(landmarks) - 5} more")
 
     print(f"\nNext steps:")
-    print(f"  1. Collect training images manually (20-50 per landmark)")
-    print(f"  2. Place images in ml_training/data/train/<landmark_name>/")
-    print(f"  3. Run 'python scripts/train_model.py' to train the model")
+    print(f"  1. Run 'python scripts/download_photos.py' to download the landmark_photos")
+    print(f"     (or place 20-50 images per landmark in ml_training/data/train/<landmark_name>/)")
+    print(f"  2. Run 'python scripts/train_model.py' to train the model")
     print(f"{'='*60}")
 
 
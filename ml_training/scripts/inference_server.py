@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Serve the trained landmark classifier over HTTP for server-side recognition.
+
+POST an image (raw bytes) to /predict and get the top-k labels, mapped to
+landmark IDs, plus the recognized landmark if it passes the same 90% threshold
+as VisionService.swift. Images are decoded in a thread pool; concurrent
+requests are grouped into micro-batches of up to --max-batch-size images, and
+a batch is run at the latest --max-wait-ms after its first image arrived. The
+forward pass, the (gated) classifier head and top-k run for the whole batch in
+one executor thread, off the event loop.
+With `lat` and `lon` query parameters, only the landmarks within `radius`
+metres of that GPS fix are scored (see location_gating.py).
+
+    curl --data-binary @photo.jpg http://127.0.0.1:8080/predict?top_k=3
+    curl --data-binary @photo.jpg "http://127.0.0.1:8080/predict?lat=48.8584&lon=2.2945&radius=2000"
+"""
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import torch
+from aiohttp import web
+from location_gating import DEFAULT_RADIUS_M
+from predictor import CONFIDENCE_THRESHOLD, Predictor
+
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+
+class MicroBatcher:
+    """Group concurrent single-image requests into batched forward passes.
+
+    Each request carries its own location, top_k and threshold; the head is
+    scored once per distinct location in the batch.
+    """
+
+    def __init__(self, predictor, max_batch_size=16, max_wait_ms=10):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # One forward pass at a time, torch parallelizes within it
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.task = None
+        self.batches = 0
+        self.images = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown()
+
+    async def predict(self, tensor, lat=None, lon=None, radius_m=DEFAULT_RADIUS_M, k=3,
+                      threshold=CONFIDENCE_THRESHOLD):
+        """Queue one preprocessed image and wait for its top-k result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((tensor, (lat, lon, radius_m, k, threshold), future))
+        return await future
+
+    async def _collect(self):
+        """Wait for a first image, then fill the batch until it is full or the deadline passes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score(self, inputs, queries):
+        """Forward pass, head and top-k for one batch; runs in the executor."""
+        hidden = self.predictor.embed(inputs)
+        scored = self.predictor.predict_at_batch(hidden, [query[:3] for query in queries])
+        results = []
+        for (probs, classes), (_, _, _, k, threshold) in zip(scored, queries):
+            result = self.predictor.top_k(probs, k=k, threshold=threshold, classes=classes)
+            result['candidates'] = len(probs)
+            results.append(result)
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            inputs = torch.stack([tensor for tensor, _, _ in batch])
+            try:
+                results = await loop.run_in_executor(self.executor, self._score, inputs,
+                                                     [query for _, query, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.images += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def create_app(predictor, max_batch_size=16, max_wait_ms=10, workers=4, top_k=3,
+               threshold=CONFIDENCE_THRESHOLD):
+    """Build the aiohttp application around a loaded Predictor."""
+    batcher = MicroBatcher(predictor, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    preprocess_pool = ThreadPoolExecutor(max_workers=workers)
+
+    async def predict(request):
+        data = await request.read()
+        if not data:
+            return web.json_response({'error': 'Request body must contain an image'}, status=400)
+        try:
+            k = int(request.query.get('top_k', top_k))
+            lat = float(request.query['lat']) if 'lat' in request.query else None
+            lon = float(request.query['lon']) if 'lon' in request.query else None
+            radius = float(request.query.get('radius', DEFAULT_RADIUS_M))
+        except ValueError:
+            return web.json_response({'error': 'top_k, lat, lon and radius must be numbers'}, status=400)
+        if k < 1:
+            return web.json_response({'error': 'top_k must be at least 1'}, status=400)
+        if (lat is None) != (lon is None):
+            return web.json_response({'error': 'lat and lon must be given together'}, status=400)
+        if lat is not None and not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return web.json_response({'error': 'lat must be within [-90, 90] and lon within [-180, 180]'},
+                                     status=400)
+        if not radius > 0:
+            return web.json_response({'error': 'radius must be positive'}, status=400)
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            tensor = await loop.run_in_executor(preprocess_pool, predictor.preprocess, data)
+        except Exception as e:
+            return web.json_response({'error': f"Could not decode image: {e}"}, status=400)
+
+        result = await batcher.predict(tensor, lat, lon, radius, k=k, threshold=threshold)
+        result['threshold'] = threshold
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return web.json_response(result)
+
+    async def health(request):
+        return web.json_response({
+            'status': 'ok',
+            'classes': len(predictor.labels),
+            'input_size': predictor.input_size,
+            'max_batch_size': batcher.max_batch_size,
+            'max_wait_ms': batcher.max_wait * 1000,
+            'batches': batcher.batches,
+            'images': batcher.images,
+            'mean_batch_size': batcher.images / batcher.batches if batcher.batches else 0.0
+        })
+
+    async def on_startup(app):
+        await batcher.start()
+
+    async def on_cleanup(app):
+        await batcher.stop()
+        preprocess_pool.shutdown()
+
+    app = web.Application(client_max_size=MAX_UPLOAD_BYTES)
+    app.router.add_post('/predict', predict)
+    app.router.add_get('/health', health)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve the landmark classifier over HTTP.')
+    parser.add_argument('--model', default=None, help='checkpoint (default: models/best_model.pth)')
+    parser.add_argument('--data-dir', default=None, help='directory with the class mappings (auto-detected)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=16, help='images per forward pass')
+    parser.add_argument('--max-wait-ms', type=float, default=10,
+                        help='how long a batch waits for more images after the first one')
+    parser.add_argument('--workers', type=int, default=4, help='image decoding threads')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('--top-k', type=int, default=3, help='default number of labels returned')
+    parser.add_argument('--threshold', type=float, default=CONFIDENCE_THRESHOLD,
+                        help='minimum top-1 confidence for a recognized landmark')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("="*60)
+    print("Landmark Inference Server")
+    print("="*60)
+
+    # Auto-detect paths based on current directory
+    if Path('models').exists() or Path('.').resolve().name == 'ml_training':
+        models_dir = Path('models')
+    else:
+        models_dir = Path('ml_training/models')
+
+    model_path = Path(args.model) if args.model else models_dir / 'best_model.pth'
+    if not model_path.exists():
+        print(f"Error: Model not found at {model_path}")
+        print("Run 'python scripts/train_model.py' first")
+        sys.exit(1)
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    predictor = Predictor(model_path, args.data_dir)
+    app = create_app(
+        predictor,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        workers=args.workers,
+        top_k=args.top_k,
+        threshold=args.threshold
+    )
+
+    print(f"✓ Micro-batching: up to {args.max_batch_size} images, {args.max_wait_ms}ms deadline")
+    print(f"✓ Serving on http://{args.host}:{args.port} (POST /predict, GET /health)")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
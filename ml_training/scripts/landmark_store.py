@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Compact, memory-mappable landmark store (data/landmarks.store).
+
+fetch_landmarks.py saves the landmarks in one binary file instead of the
+pretty-printed landmarks.json and class_mapping.json. The file holds
+columnar arrays (class index, latitude, longitude), one offset array per
+text field into a shared UTF-8 string table, and hash tables for the id and
+class name. It is memory-mapped on open and only the header is parsed:
+columns are NumPy views into the mapping, strings are decoded when they are
+read, and lookup by id or class name is a single hash probe.
+
+Layout: 8-byte magic, uint32 header length, JSON header (count and the
+offset, dtype and length of every section), then the 8-byte aligned
+little-endian sections.
+
+The JSON files are still available for tools that need them:
+
+    python scripts/landmark_store.py export            # landmarks.json + class_mapping.json
+    python scripts/landmark_store.py build             # store from an existing landmarks.json
+    python scripts/landmark_store.py get <id or class name>
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+import numpy as np
+
+STORE_NAME = 'landmarks.store'
+STORE_MAGIC = b'LMSTORE1'
+STORE_VERSION = 1
+FLOAT_FIELDS = ('latitude', 'longitude')
+STRING_FIELDS = ('id', 'class_name', 'name', 'name_en', 'description', 'description_en', 'updated_at')
+# Fields without a column of their own (category_id, ...), kept as JSON per row
+EXTRA_FIELD = 'extra'
+HASHED_FIELDS = ('id', 'class_name')
+EMPTY_SLOT = -1
+
+
+def _hash(text):
+    """Stable 64-bit hash of a string (Python's hash() differs between runs)."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _table_size(count):
+    size = 8
+    while size < 2 * count:
+        size *= 2
+    return size
+
+
+def _hash_table(keys):
+    """Open-addressing table of row numbers; a repeated key points to its last row."""
+    size = _table_size(len(keys))
+    table = np.full(size, EMPTY_SLOT, dtype='<i4')
+    stored = {}
+    for row, key in enumerate(keys):
+        if key is None:
+            continue
+        slot = _hash(key) & (size - 1)
+        while table[slot] != EMPTY_SLOT and stored[int(table[slot])] != key:
+            slot = (slot + 1) & (size - 1)
+        table[slot] = row
+        stored[row] = key
+    return table
+
+
+def write_store(landmarks, class_names, path):
+    """Write landmarks (in class index order) and their class names to a store file."""
+    count = len(landmarks)
+    sections = {}
+
+    sections['class_index'] = np.arange(count, dtype='<i4')
+    for field in FLOAT_FIELDS:
+        sections[field] = np.array([np.nan if l.get(field) is None else l[field] for l in landmarks], dtype='<f8')
+
+    columns = {field: [l.get(field) for l in landmarks] for field in STRING_FIELDS if field != 'class_name'}
+    columns['class_name'] = list(class_names)
+    known = set(STRING_FIELDS) | set(FLOAT_FIELDS)
+    columns[EXTRA_FIELD] = [
+        json.dumps({k: v for k, v in l.items() if k not in known}, ensure_ascii=False) for l in landmarks
+    ]
+
+    blob = bytearray()
+    for field, values in columns.items():
+        offsets = np.full(count + 1, len(blob), dtype='<u8')
+        nulls = np.zeros(count, dtype='u1')
+        for row, value in enumerate(values):
+            if value is None:
+                nulls[row] = 1
+            else:
+                blob += str(value).encode('utf-8')
+            offsets[row + 1] = len(blob)
+        sections[f'{field}.offsets'] = offsets
+        sections[f'{field}.null'] = nulls
+    for field in HASHED_FIELDS:
+        sections[f'{field}.hash'] = _hash_table(columns[field])
+    sections['strings'] = np.frombuffer(bytes(blob), dtype='u1')
+
+    directory = {}
+    offset = 0
+    for name, array in sections.items():
+        directory[name] = {'offset': offset, 'dtype': array.dtype.str, 'length': len(array)}
+        offset += (array.nbytes + 7) // 8 * 8
+    header = json.dumps({'version': STORE_VERSION, 'count': count, 'sections': directory}).encode('utf-8')
+    header += b' ' * (-(len(STORE_MAGIC) + 4 + len(header)) % 8)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(STORE_MAGIC + struct.pack('<I', len(header)) + header)
+        for array in sections.values():
+            data = array.tobytes()
+            f.write(data + b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, path)
+    return path
+
+
+class LandmarkStore:
+    """Read-only, memory-mapped view of a landmark store file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(STORE_MAGIC)] != STORE_MAGIC:
+            raise ValueError(f"{self.path} is not a landmark store")
+        (header_size,) = struct.unpack_from('<I', self._map, len(STORE_MAGIC))
+        data_start = len(STORE_MAGIC) + 4
+        header = json.loads(self._map[data_start:data_start + header_size])
+        if header['version'] != STORE_VERSION:
+            raise ValueError(f"Unsupported landmark store version in {self.path}")
+        self._base = data_start + header_size
+        self._sections = header['sections']
+        self._columns = {}
+        self.count = header['count']
+
+    def __len__(self):
+        return self.count
+
+    def _section(self, name):
+        """NumPy view of a section, created on first access."""
+        if name not in self._columns:
+            info = self._sections[name]
+            self._columns[name] = np.frombuffer(self._map, dtype=info['dtype'], count=info['length'],
+                                                offset=self._base + info['offset'])
+        return self._columns[name]
+
+    def column(self, field):
+        """Numeric column (class_index, latitude, longitude) without copying."""
+        return self._section(field)
+
+    def value(self, row, field):
+        """One field of one row, decoding only that string."""
+        if field in FLOAT_FIELDS:
+            value = float(self._section(field)[row])
+            return None if np.isnan(value) else value
+        if field == 'class_index':
+            return int(self._section(field)[row])
+        if self._section(f'{field}.null')[row]:
+            return None
+        offsets = self._section(f'{field}.offsets')
+        strings = self._sections['strings']
+        start = self._base + strings['offset'] + int(offsets[row])
+        return self._map[start:start + int(offsets[row + 1] - offsets[row])].decode('utf-8')
+
+    def strings(self, field):
+        """All values of a text field."""
+        return [self.value(row, field) for row in range(self.count)]
+
+    def _find(self, field, key):
+        table = self._section(f'{field}.hash')
+        mask = len(table) - 1
+        slot = _hash(key) & mask
+        while table[slot] != EMPTY_SLOT:
+            row = int(table[slot])
+            if self.value(row, field) == key:
+                return row
+            slot = (slot + 1) & mask
+        return None
+
+    def find(self, landmark_id):
+        """Row (= class index) of a landmark id, or None."""
+        return self._find('id', landmark_id)
+
+    def find_class(self, class_name):
+        """Row of a class name, or None."""
+        return self._find('class_name', class_name)
+
+    def landmark(self, row):
+        """The landmark of a row, as in landmarks.json."""
+        landmark = {field: self.value(row, field) for field in STRING_FIELDS if field != 'class_name'}
+        for field in FLOAT_FIELDS:
+            landmark[field] = self.value(row, field)
+        landmark.update(json.loads(self.value(row, EXTRA_FIELD)))
+        return landmark
+
+    def landmarks(self):
+        return [self.landmark(row) for row in range(self.count)]
+
+    def class_mapping(self):
+        """The contents of class_mapping.json."""
+        mapping = {}
+        for row in range(self.count):
+            mapping[self.value(row, 'class_name')] = {
+                'id': self.value(row, 'id'),
+                'name': self.value(row, 'name'),
+                'name_en': self.value(row, 'name_en'),
+                'class_index': row
+            }
+        return mapping
+
+    def landmark_ids(self):
+        """Class name -> landmark id, as in class_mapping_swift.json."""
+        return {name: info['id'] for name, info in self.class_mapping().items()}
+
+    def close(self):
+        self._columns.clear()
+        self._map.close()
+
+
+def store_path(data_dir):
+    return Path(data_dir) / STORE_NAME
+
+
+def open_store(data_dir):
+    """The data directory's landmark store, or None if there is none yet."""
+    path = store_path(data_dir)
+    return LandmarkStore(path) if path.exists() else None
+
+
+def load_landmarks(data_dir):
+    """Landmarks from the store, or from a landmarks.json of an older checkout ([] if neither)."""
+    store = open_store(data_dir)
+    if store is not None:
+        return store.landmarks()
+    json_path = Path(data_dir) / 'landmarks.json'
+    if json_path.exists():
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return []
+
+
+def load_class_mapping(data_dir):
+    """class_mapping.json contents from the store or the JSON file, None if neither exists."""
+    store = open_store(data_dir)
+    if store is not None:
+        return store.class_mapping()
+    json_path = Path(data_dir) / 'class_mapping.json'
+    if json_path.exists():
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def export_json(data_dir):
+    """Generate landmarks.json and class_mapping.json from the data directory's store."""
+    store = LandmarkStore(store_path(data_dir))
+    paths = []
+    for name, data in (('landmarks.json', store.landmarks()), ('class_mapping.json', store.class_mapping())):
+        path = Path(data_dir) / name
+        # Written atomically so an interrupted run never leaves a partial file
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    store.close()
+    return paths
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Inspect and convert the landmark store.')
+    parser.add_argument('--data-dir', default=None, help='data directory (auto-detected)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('export', help='write landmarks.json and class_mapping.json from the store')
+    commands.add_parser('build', help='write the store from an existing landmarks.json')
+    get = commands.add_parser('get', help='show one landmark')
+    get.add_argument('key', help='landmark id or class name')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    data_dir = Path(args.data_dir) if args.data_dir else \
+        (Path('data') if Path('data').exists() else Path('ml_training/data'))
+
+    if args.command == 'build':
+        json_path = data_dir / 'landmarks.json'
+        if not json_path.exists():
+            print(f"Error: {json_path} not found")
+            sys.exit(1)
+        with open(json_path, 'r', encoding='utf-8') as f:
+            landmarks = json.load(f)
+        # Imported here, fetch_landmarks loads requests and the .env file
+        from fetch_landmarks import landmark_class_name
+        path = write_store(landmarks, [landmark_class_name(l) for l in landmarks], store_path(data_dir))
+        print(f"✓ Saved {len(landmarks)} landmarks to {path} ({path.stat().st_size / 1024:.1f} KB)")
+        return
+
+    store = open_store(data_dir)
+    if store is None:
+        print(f"Error: No landmark store at {store_path(data_dir)}")
+        print("Run 'python scripts/fetch_landmarks.py' first")
+        sys.exit(1)
+
+    if args.command == 'export':
+        for path in export_json(data_dir):
+            print(f"✓ Saved {path}")
+    else:
+        row = store.find(args.key)
+        if row is None:
+            row = store.find_class(args.key)
+        if row is None:
+            print(f"Error: No landmark with id or class name '{args.key}'")
+            sys.exit(1)
+        print(json.dumps({'class_index': row, 'class_name': store.value(row, 'class_name'),
+                          **store.landmark(row)}, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Load-test the inference server across micro-batch deadlines.
+
+For every --deadlines value an inference_server.py process is started with
+that --max-wait-ms, hit with --requests images from --concurrency concurrent
+clients, and stopped again. Throughput, latency percentiles and the mean
+micro-batch size are reported per deadline and optionally written as JSON.
+"""
+import argparse
+import asyncio
+import io
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+import aiohttp
+import numpy as np
+from PIL import Image
+
+SERVER_SCRIPT = Path(__file__).resolve().parent / 'inference_server.py'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_images(image_dir=None, count=32, size=640):
+    """Encoded JPEG payloads, from a directory or random noise images."""
+    if image_dir:
+        paths = sorted(p for p in Path(image_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if paths:
+            return [p.read_bytes() for p in paths[:count]]
+        print(f"Warning: No images in {image_dir}, using random images")
+
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8)).save(buffer, format='JPEG')
+        images.append(buffer.getvalue())
+    return images
+
+
+async def wait_for_server(url, process, timeout=120):
+    """Poll /health until the server answers."""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("Inference server exited during startup")
+            try:
+                async with session.get(f"{url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"Inference server at {url} did not start")
+
+
+async def run_load(url, images, requests, concurrency):
+    """Send `requests` images from `concurrency` clients, return per-request latencies."""
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def client(session):
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            async with session.post(f"{url}/predict", data=images[i % len(images)]) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        async with session.get(f"{url}/health") as response:
+            health = await response.json()
+
+    return np.array(latencies), elapsed, errors, health
+
+
+def benchmark_deadline(args, deadline_ms, images):
+    """Start a server with one deadline, load it and return the results."""
+    url = f"http://127.0.0.1:{args.port}"
+    command = [
+        sys.executable, str(SERVER_SCRIPT),
+        '--port', str(args.port),
+        '--max-wait-ms', str(deadline_ms),
+        '--max-batch-size', str(args.max_batch_size)
+    ]
+    if args.model:
+        command += ['--model', args.model]
+
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_for_server(url, process))
+        # Warm up the model and the thread pools
+        _, _, _, warmup = asyncio.run(run_load(url, images, args.concurrency, args.concurrency))
+        latencies, elapsed, errors, health = asyncio.run(
+            run_load(url, images, args.requests, args.concurrency)
+        )
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        'max_wait_ms': deadline_ms,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'errors': errors,
+        'images_per_sec': args.requests / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_batch_size': (health['images'] - warmup['images']) / max(health['batches'] - warmup['batches'], 1)
+    }
+
+
+def _float_list(value):
+    return [float(v) for v in value.split(',') if v]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load-test the inference server across batch deadlines.')
+    parser.add_argument('--model', default=None, help='checkpoint passed to the server')
+    parser.add_argument('--deadlines', type=_float_list, default=[0, 2, 5, 10, 20],
+                        help='comma-separated --max-wait-ms values to compare')
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='requests per deadline')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--images', default=None, help='directory of images to send (default: random)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("="*60)
+    print("Inference Server Load Test")
+    print("="*60)
+
+    images = load_images(args.images)
+    print(f"✓ {len(images)} test images, {args.requests} requests, {args.concurrency} clients\n")
+
+    results = []
+    for deadline_ms in args.deadlines:
+        result = benchmark_deadline(args, deadline_ms, images)
+        results.append(result)
+        print(f"  deadline={deadline_ms:5.1f}ms {result['images_per_sec']:8.1f} images/sec "
+              f"p50={result['p50_ms']:7.2f}ms p95={result['p95_ms']:7.2f}ms "
+              f"batch={result['mean_batch_size']:5.2f} errors={result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results saved to {args.output}")
+
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Pick DataLoader settings for the current machine with a short probe.
+
+The training set is loaded for a few batches with different worker counts,
+then prefetch factors (and optionally batch sizes). Configurations whose
+in-flight batches would not fit into the available memory are skipped. The
+probe measures the loader alone, while during training the workers share the
+cores with the model, so the smallest worker count within `tolerance` of the
+fastest one is chosen.
+"""
+import os
+import time
+from torch.utils.data import DataLoader
+
+# Rough resident memory of one worker process beyond the batches it holds
+WORKER_MEMORY_BYTES = 256 * 1024 ** 2
+
+
+def available_memory_bytes():
+    """Free physical memory, or half of the total where that is not reported (macOS)."""
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        pass
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def worker_candidates(cores):
+    """0, 1, 2, 4, ... up to the number of cores."""
+    counts = [0, 1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores and cores > 1:
+        counts.append(cores)
+    return counts
+
+
+def probe(dataset, batch_size, num_workers, prefetch_factor, max_batches=20, max_seconds=10):
+    """Images per second of one loader configuration, after its first batch."""
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=num_workers,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None
+    )
+    iterator = iter(loader)
+    # Excludes worker start-up, which persistent workers only pay once
+    next(iterator)
+
+    images = 0
+    start = time.perf_counter()
+    for i, batch in enumerate(iterator):
+        images += len(batch[0])
+        if i + 1 >= max_batches or time.perf_counter() - start > max_seconds:
+            break
+    elapsed = time.perf_counter() - start
+    del iterator
+    return images / elapsed if images else 0.0
+
+
+def _fits(config, sample_bytes, memory):
+    if memory is None:
+        return True
+    in_flight = config['num_workers'] * config['prefetch_factor'] * config['batch_size'] * sample_bytes
+    return in_flight + config['num_workers'] * WORKER_MEMORY_BYTES < memory // 2
+
+
+def tune_loader(dataset, batch_sizes, cores=None, prefetch_factors=(2, 4), tolerance=0.05,
+                max_batches=20):
+    """Probe loader configurations on `dataset` and return the chosen one.
+
+    Returns a dict with num_workers, prefetch_factor, batch_size,
+    images_per_sec and all probe results.
+    """
+    cores = cores or os.cpu_count() or 1
+    memory = available_memory_bytes()
+    sample = dataset[0][0]
+    sample_bytes = sample.element_size() * sample.nelement()
+    probes = []
+
+    def run(batch_size, num_workers, prefetch_factor):
+        config = {'batch_size': batch_size, 'num_workers': num_workers, 'prefetch_factor': prefetch_factor}
+        if not _fits(config, sample_bytes, memory):
+            print(f"  workers={num_workers:<2d} prefetch={prefetch_factor} batch={batch_size:<4d} skipped (memory)")
+            return None
+        config['images_per_sec'] = probe(dataset, batch_size, num_workers, prefetch_factor, max_batches)
+        print(f"  workers={num_workers:<2d} prefetch={prefetch_factor} batch={batch_size:<4d} "
+              f"{config['images_per_sec']:8.1f} images/sec")
+        probes.append(config)
+        return config
+
+    def pick(configs):
+        configs = [c for c in configs if c is not None]
+        best = max(c['images_per_sec'] for c in configs)
+        # Fewest workers (then smallest prefetch) that is nearly as fast as the best
+        return min((c for c in configs if c['images_per_sec'] >= best * (1 - tolerance)),
+                   key=lambda c: (c['num_workers'], c['prefetch_factor']))
+
+    print(f"\nTuning DataLoader ({cores} cores, "
+          f"{f'{memory / 1024 ** 3:.1f} GB' if memory else 'unknown'} memory available)...")
+
+    chosen = []
+    for batch_size in batch_sizes:
+        # Worker count first, at the default prefetch factor
+        by_workers = pick([run(batch_size, n, prefetch_factors[0]) for n in worker_candidates(cores)])
+        if by_workers['num_workers'] == 0:
+            chosen.append(by_workers)
+            continue
+        by_prefetch = [by_workers] + [
+            run(batch_size, by_workers['num_workers'], p) for p in prefetch_factors[1:]
+        ]
+        chosen.append(pick(by_prefetch))
+
+    best = max(chosen, key=lambda c: c['images_per_sec'])
+    return {**best, 'probes': probes}
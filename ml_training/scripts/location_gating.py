@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Location-gated classifier head: only score the landmarks near a GPS fix.
+
+The final Linear layer of the classifier scores every landmark of the city
+for every image, and the softmax spreads probability over landmarks that are
+kilometres away. GatedHead looks up the classes within a radius of the
+device's location in a SpatialIndex, multiplies the hidden layer with just
+those rows of the head's weights and renormalizes over them. The head's cost
+then depends on how many landmarks are nearby instead of the total number of
+classes.
+
+Classes without coordinates are always scored. At least `min_classes`
+classes (the nearest ones) are scored even where the radius holds fewer, so
+a lone nearby landmark does not win every image with 100% confidence.
+"""
+import time
+from collections import OrderedDict
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from landmark_store import open_store
+from spatial_index import SpatialIndex, random_points
+
+# Same as maxPOIDistance in ARModeManager.swift
+DEFAULT_RADIUS_M = 2000
+MIN_CLASSES = 5
+# Candidate sets kept for recent GPS fixes; camera frames arrive much more
+# often than location updates, so consecutive frames share one fix
+CANDIDATE_CACHE_SIZE = 256
+
+
+def class_coordinates(labels, landmark_ids, data_dir):
+    """Latitude and longitude of every class (NaN where unknown)."""
+    lats = np.full(len(labels), np.nan)
+    lons = np.full(len(labels), np.nan)
+    store = open_store(data_dir)
+    if store is None:
+        return lats, lons
+
+    # Rows of the landmark store by id, coordinates straight from its columns
+    rows = [store.find(landmark_ids[label]) if label in landmark_ids else None for label in labels]
+    known = np.array([i for i, row in enumerate(rows) if row is not None], dtype=np.int64)
+    if len(known):
+        store_rows = np.array([rows[i] for i in known])
+        lats[known] = store.column('latitude')[store_rows]
+        lons[known] = store.column('longitude')[store_rows]
+    return lats, lons
+
+
+class GatedHead:
+    """The classifier's final Linear layer, scored over all or only nearby classes."""
+
+    def __init__(self, linear, lats, lons, min_classes=MIN_CLASSES, cell_deg=0.01):
+        self.weight = linear.weight.detach()
+        self.bias = linear.bias.detach()
+        self.num_classes = self.weight.shape[0]
+        self.min_classes = min_classes
+
+        lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+        located = ~(np.isnan(lats) | np.isnan(lons))
+        self.located = np.nonzero(located)[0]
+        self.unlocated = np.nonzero(~located)[0]
+        self.index = SpatialIndex(list(self.located), lats[located], lons[located], cell_deg=cell_deg)
+        self._cache = OrderedDict()
+
+    @property
+    def gated(self):
+        """Whether any class has coordinates to gate on."""
+        return len(self.located) > 0
+
+    def candidates(self, lat, lon, radius_m=DEFAULT_RADIUS_M):
+        """Sorted class indices to score for a location, as a LongTensor."""
+        key = (float(lat), float(lon), float(radius_m))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        points, _ = self.index.within(lat, lon, radius_m)[0]
+        if len(points) < self.min_classes:
+            points, _ = self.index.nearest(lat, lon, self.min_classes)[0]
+        classes = np.concatenate([self.located[self.index.positions[points]], self.unlocated])
+        self._cache[key] = torch.from_numpy(np.sort(classes))
+        if len(self._cache) > CANDIDATE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return self._cache[key]
+
+    def logits(self, hidden, classes=None):
+        """Logits of the given classes (all if None) for hidden-layer activations."""
+        if classes is None:
+            return F.linear(hidden, self.weight, self.bias)
+        return F.linear(hidden, self.weight.index_select(0, classes), self.bias.index_select(0, classes))
+
+    @torch.inference_mode()
+    def probabilities(self, hidden, lat=None, lon=None, radius_m=DEFAULT_RADIUS_M):
+        """Softmax over the classes near (lat, lon), or over all classes without a location.
+
+        Returns (probabilities, classes); classes is None when all classes
+        were scored, otherwise probabilities[i] belongs to class classes[i].
+        """
+        if lat is None or lon is None or not self.gated:
+            return torch.softmax(self.logits(hidden), dim=-1), None
+        classes = self.candidates(lat, lon, radius_m)
+        return torch.softmax(self.logits(hidden, classes), dim=-1), classes
+
+
+def benchmark_gated_head(class_counts=(100, 1000, 10000), hidden_units=256, radius_m=DEFAULT_RADIUS_M,
+                         iterations=500, spread_m=15000):
+    """Per-image head latency of full vs. location-gated scoring.
+
+    Landmarks are scattered over a city `spread_m` across and queried from
+    random points in it, so the number of candidates grows with the density
+    of landmarks, not with the total count alone. `gated` looks up a new
+    location for every image, `same fix` reuses the candidates of the
+    previous frame's location.
+    """
+    print(f"\n{'Classes':>8s} {'full':>10s} {'gated':>10s} {'same fix':>10s} {'candidates':>11s}  (ms per image)")
+    results = []
+    for num_classes in class_counts:
+        torch.manual_seed(0)
+        linear = nn.Linear(hidden_units, num_classes)
+        lats, lons = random_points(num_classes, spread_m=spread_m)
+        head = GatedHead(linear, lats, lons)
+        q_lats, q_lons = random_points(iterations, spread_m=spread_m, seed=1)
+        hidden = torch.randn(1, hidden_units)
+
+        def per_image(fn):
+            for i in range(min(20, iterations)):
+                fn(i)
+            start = time.perf_counter()
+            for i in range(iterations):
+                fn(i)
+            return (time.perf_counter() - start) * 1000 / iterations
+
+        with torch.inference_mode():
+            full_ms = per_image(lambda i: torch.softmax(head.logits(hidden), dim=-1))
+            head._cache.clear()
+            gated_ms = per_image(lambda i: head.probabilities(hidden, q_lats[i], q_lons[i], radius_m))
+            same_fix_ms = per_image(lambda i: head.probabilities(hidden, q_lats[0], q_lons[0], radius_m))
+        candidates = float(np.mean([len(head.candidates(q_lats[i], q_lons[i], radius_m))
+                                    for i in range(min(iterations, 200))]))
+
+        results.append({
+            'classes': num_classes,
+            'radius_m': radius_m,
+            'full_ms': full_ms,
+            'gated_ms': gated_ms,
+            'same_fix_ms': same_fix_ms,
+            'mean_candidates': candidates
+        })
+        print(f"{num_classes:>8d} {full_ms:>10.4f} {gated_ms:>10.4f} {same_fix_ms:>10.4f} {candidates:>11.1f}")
+    return results
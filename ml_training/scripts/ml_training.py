@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Single command line for the training pipeline steps.
+
+    python scripts/ml_training.py fetch
+    python scripts/ml_training.py train --epochs 10 --fast
+    python scripts/ml_training.py update-swift
+
+Each subcommand runs the main() of one script (see COMMANDS) with the
+remaining arguments, so `ml_training.py train --help` shows the options of
+train_model.py. A script is only imported once its subcommand is chosen:
+fetch, download, prepare, update-swift, store and pipeline never load torch,
+torchvision or coremltools, and convert loads them only after its inputs are
+found. download and prepare import PIL only once they decode an image.
+
+The time from start until the subcommand's main() runs, and how much of it
+the script's imports took, is reported on stderr.
+"""
+import time
+
+START = time.perf_counter()
+
+import argparse
+import importlib
+import sys
+
+# Subcommand -> (script module, description)
+COMMANDS = {
+    'fetch': ('fetch_landmarks', 'Fetch landmarks from Supabase'),
+    'download': ('download_photos', 'Download the landmark photos into data/train'),
+    'prepare': ('prepare_dataset', 'Verify, deduplicate and split the images'),
+    'train': ('train_model', 'Train the model'),
+    'convert': ('convert_to_coreml', 'Convert the trained model to Core ML'),
+    'update-swift': ('update_vision_service', 'Update VisionService.swift with the class mapping'),
+    'bench': ('benchmark', 'Benchmark model latency and throughput'),
+    'store': ('landmark_store', 'Inspect and convert the landmark store'),
+    'pipeline': ('pipeline', 'Run the whole pipeline, skipping unchanged stages')
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='ml_training',
+        description='Run a step of the landmark training pipeline.',
+        epilog="Run 'ml_training <command> --help' for the options of a command.")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+    for name, (_, description) in COMMANDS.items():
+        # Options belong to the script, they are passed through unparsed
+        commands.add_parser(name, help=description, add_help=False)
+    return parser.parse_known_args(argv)
+
+
+def report_startup(command, module, import_ms):
+    total_ms = (time.perf_counter() - START) * 1000
+    print(f"ml_training {command}: started in {total_ms:.0f} ms "
+          f"({module} imported in {import_ms:.0f} ms)", file=sys.stderr, flush=True)
+
+
+def main():
+    args, script_args = parse_args()
+    module_name = COMMANDS[args.command][0]
+
+    import_start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    report_startup(args.command, module_name, (time.perf_counter() - import_start) * 1000)
+
+    # The scripts parse sys.argv themselves
+    sys.argv = [f'ml_training {args.command}'] + script_args
+    module.main()
+
+
+if __name__ == '__main__':
+    main()
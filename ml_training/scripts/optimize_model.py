@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Shrink the trained model before it is shipped to the app.
+
+Builds optimized variants of models/best_model.pth and reports top-1 accuracy on
+data/validation (and the drop vs. fp32), file size and CPU latency for each:
+
+  fp16            plain Core ML conversion, as convert_to_coreml.py produces it
+  int8_static     PyTorch FX static int8 quantization, calibrated on data/validation
+  pruned          L1 magnitude pruning of the classifier head and the unfrozen
+                  blocks, stored sparse in Core ML
+  palettized_N    Core ML k-means weight palettization to N bits
+  linear_int8     Core ML symmetric per-channel int8 weight quantization
+
+Core ML models can only be run on macOS, so the accuracy of the Core ML weight
+compression is measured on a PyTorch copy of the model with the same weight
+transform applied. The smallest Core ML variant within --max-size-mb and
+--max-accuracy-drop replaces models/LandmarkClassifier.mlpackage.
+"""
+import argparse
+import copy
+import json
+import platform
+import shutil
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.utils.prune as prune
+from torch.utils.data import DataLoader
+from torchvision import transforms
+from tensor_cache import IMAGE_SIZE, CachedImageFolder, build_tensor_cache
+from convert_to_coreml import load_pytorch_model, convert_to_coreml
+from benchmark import measure_latency
+import architectures
+
+# Core ML leaves weights with fewer elements than this uncompressed
+WEIGHT_THRESHOLD = 2048
+PALETTE_BITS = (8, 6, 4)
+
+
+def load_validation(data_dir, class_to_idx, input_size=IMAGE_SIZE, batch_size=32):
+    """DataLoader over data/validation plus a map from folder index to model index."""
+    store_dirs = build_tensor_cache(data_dir)
+    resize = [transforms.Resize((input_size, input_size), antialias=True)] if input_size != IMAGE_SIZE else []
+    dataset = CachedImageFolder(store_dirs['validation'], transform=transforms.Compose(resize + [
+        transforms.ConvertImageDtype(torch.float),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ]))
+
+    missing = [name for name in dataset.classes if name not in class_to_idx]
+    if missing:
+        print(f"Error: Validation classes not known to the model: {', '.join(missing)}")
+        sys.exit(1)
+
+    remap = torch.tensor([class_to_idx[name] for name in dataset.classes])
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=2)
+    return loader, remap
+
+
+@torch.inference_mode()
+def evaluate(model, loader, remap):
+    """Top-1 accuracy in percent."""
+    model.eval()
+    correct = 0
+    total = 0
+    for inputs, targets in loader:
+        predicted = model(inputs).argmax(dim=1)
+        correct += (predicted == remap[targets]).sum().item()
+        total += targets.size(0)
+    return 100 * correct / max(total, 1)
+
+
+def quantize_static(model, loader, calibration_images=512, input_size=224):
+    """FX graph mode static int8 quantization, calibrated on validation batches."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = 'qnnpack' if platform.machine().lower() in ('arm64', 'aarch64') else 'x86'
+    torch.backends.quantized.engine = engine
+
+    example_inputs = (torch.rand(1, 3, input_size, input_size),)
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(engine), example_inputs)
+
+    seen = 0
+    with torch.inference_mode():
+        for inputs, _ in loader:
+            prepared(inputs)
+            seen += inputs.size(0)
+            if seen >= calibration_images:
+                break
+    print(f"  Calibrated on {seen} validation images ({engine})")
+
+    return convert_fx(prepared)
+
+
+def prune_model(model, amount, frozen_layers=9):
+    """L1 magnitude pruning of the unfrozen blocks and the classifier head.
+
+    The frozen ImageNet prefix is left alone; the pruning is made permanent, so
+    the result is a plain model with zeroed weights.
+    """
+    pruned = copy.deepcopy(model)
+    modules = list(pruned.features[frozen_layers:].modules()) + list(pruned.classifier.modules())
+    for module in modules:
+        if isinstance(module, (nn.Conv2d, nn.Linear)) and module.weight.numel() > WEIGHT_THRESHOLD:
+            prune.l1_unstructured(module, name='weight', amount=amount)
+            prune.remove(module, 'weight')
+    return pruned
+
+
+def _kmeans_1d(values, clusters, iterations=10):
+    """Lloyd's k-means on a flat array, initialised at quantiles.
+
+    Returns a lookup table of exactly `clusters` entries and the uint8 index of
+    every value, the format of a Core ML palettization lookup table.
+    """
+    centroids = np.quantile(values, np.linspace(0, 1, clusters))
+    for _ in range(iterations):
+        boundaries = (centroids[1:] + centroids[:-1]) / 2
+        assignment = np.searchsorted(boundaries, values)
+        sums = np.bincount(assignment, weights=values, minlength=clusters)
+        counts = np.bincount(assignment, minlength=clusters)
+        centroids = np.sort(np.where(counts > 0, sums / np.maximum(counts, 1), centroids))
+    boundaries = (centroids[1:] + centroids[:-1]) / 2
+    return centroids, np.searchsorted(boundaries, values).astype(np.uint8)
+
+
+def _palette_lut(nbits):
+    """Core ML custom lut_function using the same k-means as the simulation."""
+    def lut_function(weight):
+        lut, indices = _kmeans_1d(weight.reshape(-1).astype(np.float64), 2 ** nbits)
+        return lut.astype(weight.dtype), indices
+    return lut_function
+
+
+def _compress_weights(model, fn):
+    """Copy of the model with fn applied to every weight Core ML would compress."""
+    compressed = copy.deepcopy(model)
+    with torch.no_grad():
+        for module in compressed.modules():
+            if isinstance(module, (nn.Conv2d, nn.Linear)) and module.weight.numel() > WEIGHT_THRESHOLD:
+                weight = module.weight.detach().numpy().astype(np.float64)
+                module.weight.copy_(torch.from_numpy(fn(weight)).to(module.weight.dtype))
+    return compressed
+
+
+def simulate_palettization(model, nbits):
+    """Per-tensor k-means palettization, as applied by the Core ML conversion."""
+    def palettize(w):
+        lut, indices = _kmeans_1d(w.reshape(-1), 2 ** nbits)
+        return lut[indices].reshape(w.shape)
+    return _compress_weights(model, palettize)
+
+
+def simulate_linear_quantization(model):
+    """Symmetric per-output-channel int8, as ct.optimize.coreml linear quantization."""
+    def quantize(w):
+        flat = w.reshape(w.shape[0], -1)
+        scale = np.abs(flat).max(axis=1, keepdims=True) / 127
+        scale[scale == 0] = 1
+        return (np.clip(np.round(flat / scale), -127, 127) * scale).reshape(w.shape)
+    return _compress_weights(model, quantize)
+
+
+def compression_pipeline(variant, prune_amount=0.0):
+    """Core ML conversion pass pipeline that compresses weights for one variant.
+
+    Compressing an already converted classifier fails in coremltools 7.1, so
+    the compression pass runs as part of the conversion instead.
+    """
+    import coremltools as ct
+    from coremltools.optimize import coreml as cto
+
+    if variant == 'fp16':
+        return None
+    if variant == 'pruned':
+        # Weights are already zero, only store them sparse
+        pass_name = 'compression::prune_weights'
+        op_config = cto.OpThresholdPrunerConfig(
+            threshold=1e-12, minimum_sparsity_percentile=prune_amount * 0.9,
+            weight_threshold=WEIGHT_THRESHOLD
+        )
+    elif variant.startswith('palettized_'):
+        pass_name = 'compression::palettize_weights'
+        op_config = cto.OpPalettizerConfig(
+            mode='custom', lut_function=_palette_lut(int(variant.split('_')[1])),
+            weight_threshold=WEIGHT_THRESHOLD
+        )
+    elif variant == 'linear_int8':
+        pass_name = 'compression::linear_quantize_weights'
+        op_config = cto.OpLinearQuantizerConfig(mode='linear_symmetric', weight_threshold=WEIGHT_THRESHOLD)
+    else:
+        raise ValueError(f"Unknown variant: {variant}")
+
+    pipeline = ct.PassPipeline()
+    pipeline.append_pass(pass_name)
+    pipeline.set_options(pass_name, {'config': cto.OptimizationConfig(global_config=op_config)})
+    return pipeline
+
+
+def _size_mb(path):
+    """Size of a file or package directory in MB."""
+    path = Path(path)
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob('*') if f.is_file()) / 1024 / 1024
+    return path.stat().st_size / 1024 / 1024
+
+
+def save_torchscript(model, path, input_size=224):
+    """Trace and save a PyTorch variant, so its size is comparable to the others."""
+    with torch.no_grad():
+        traced = torch.jit.trace(model, torch.rand(1, 3, input_size, input_size))
+    torch.jit.save(traced, str(path))
+    return traced
+
+
+def measure_coreml_latency(package_path, iterations=50, warmup=5, input_size=224):
+    """Core ML prediction latency in milliseconds, only available on macOS."""
+    if platform.system() != 'Darwin':
+        return None
+    import coremltools as ct
+    from PIL import Image
+
+    mlmodel = ct.models.MLModel(str(package_path), compute_units=ct.ComputeUnit.CPU_ONLY)
+    image = Image.fromarray(np.random.randint(0, 255, (input_size, input_size, 3), dtype=np.uint8))
+    for _ in range(warmup):
+        mlmodel.predict({'image': image})
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        mlmodel.predict({'image': image})
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': float(np.percentile(timings, 50)), 'p95_ms': float(np.percentile(timings, 95))}
+
+
+def select_variant(results, max_size_mb=None, max_accuracy_drop=1.0):
+    """Smallest Core ML variant within the size and accuracy budget, or None."""
+    candidates = [
+        r for r in results
+        if r['format'] == 'coreml'
+        and r['accuracy_drop'] <= max_accuracy_drop
+        and (max_size_mb is None or r['size_mb'] <= max_size_mb)
+    ]
+    return min(candidates, key=lambda r: r['size_mb']) if candidates else None
+
+
+def optimize_model(model, class_labels, loader, remap, output_dir, prune_amount=0.3,
+                   calibration_images=512, iterations=100, coreml=True, arch=architectures.DEFAULT_ARCH,
+                   frozen_layers=None):
+    """Build, evaluate and measure every variant, returning one result per variant.
+
+    `frozen_layers` is the frozen prefix the model was trained with (default:
+    the architecture's default), which pruning leaves alone.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    input_size = arch['input_size']
+    results = []
+
+    def record(variant, fmt, reference, path, latency):
+        accuracy = evaluate(reference, loader, remap)
+        result = {
+            'variant': variant,
+            'format': fmt,
+            'path': str(path),
+            'accuracy': accuracy,
+            'accuracy_drop': (results[0]['accuracy'] if results else accuracy) - accuracy,
+            'size_mb': _size_mb(path),
+            'latency': latency
+        }
+        results.append(result)
+        latency_ms = f"{latency['p50_ms']:7.2f}ms" if latency else "      n/a"
+        print(f"  {variant:14s} {fmt:8s} acc={accuracy:6.2f}% "
+              f"(-{result['accuracy_drop']:.2f}) {result['size_mb']:7.2f} MB  p50={latency_ms}")
+        return result
+
+    print("\nPyTorch variants...")
+    quantized = quantize_static(model, loader, calibration_images, input_size)
+    if frozen_layers is None:
+        frozen_layers = architectures.default_frozen_layers(arch)
+    pruned = prune_model(model, prune_amount, frozen_layers)
+    for variant, variant_model in (('fp32', model), ('int8_static', quantized), ('pruned', pruned)):
+        path = output_dir / f'{variant}.pt'
+        traced = save_torchscript(variant_model, path, input_size)
+        record(variant, 'pytorch', variant_model, path,
+               measure_latency(traced, torch.contiguous_format, iterations=iterations, input_size=input_size))
+
+    if not coreml:
+        return results
+
+    import coremltools as ct
+
+    print("\nCore ML variants...")
+    references = {
+        'fp16': model,
+        'pruned': pruned,
+        **{f'palettized_{n}': simulate_palettization(model, n) for n in PALETTE_BITS},
+        'linear_int8': simulate_linear_quantization(model)
+    }
+    for variant, reference in references.items():
+        path = output_dir / f'{variant}.mlpackage'
+        if path.exists():
+            shutil.rmtree(path)
+        pipeline = compression_pipeline(variant, prune_amount)
+        convert_to_coreml(
+            pruned if variant == 'pruned' else model, class_labels, path,
+            pass_pipeline=pipeline,
+            minimum_deployment_target=ct.target.iOS16 if pipeline else None,
+            input_size=input_size
+        )
+        record(variant, 'coreml', reference, path, measure_coreml_latency(path, input_size=input_size))
+
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Quantize, prune and palettize the trained model.')
+    parser.add_argument('--model', default=None, help='checkpoint (default: models/best_model.pth)')
+    parser.add_argument('--data-dir', default=None, help='data directory with validation/ (auto-detected)')
+    parser.add_argument('--prune-amount', type=float, default=0.3,
+                        help='share of weights zeroed in the unfrozen blocks and the head')
+    parser.add_argument('--calibration-images', type=int, default=512,
+                        help='validation images used to calibrate static quantization')
+    parser.add_argument('--max-size-mb', type=float, default=None, help='size budget of the shipped model')
+    parser.add_argument('--max-accuracy-drop', type=float, default=1.0,
+                        help='allowed top-1 accuracy drop in percentage points')
+    parser.add_argument('--iterations', type=int, default=100, help='timed single-image runs')
+    parser.add_argument('--no-coreml', action='store_true', help='only build the PyTorch variants')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report and select, but keep the current LandmarkClassifier.mlpackage')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("="*60)
+    print("Model Optimization")
+    print("="*60)
+
+    # Auto-detect paths based on current directory
+    if Path('models').exists() or Path('.').resolve().name == 'ml_training':
+        models_dir = Path('models')
+        data_dir = Path('data')
+    else:
+        models_dir = Path('ml_training/models')
+        data_dir = Path('ml_training/data')
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+
+    model_path = Path(args.model) if args.model else models_dir / 'best_model.pth'
+    if not model_path.exists():
+        print(f"Error: Model not found at {model_path}")
+        print("Run 'python scripts/train_model.py' first")
+        sys.exit(1)
+
+    checkpoint = torch.load(model_path, map_location='cpu')
+    model, _ = load_pytorch_model(model_path, checkpoint['num_classes'])
+    class_to_idx = checkpoint.get('class_to_idx')
+    if class_to_idx is None:
+        with open(data_dir / 'pytorch_class_mapping.json', 'r') as f:
+            class_to_idx = json.load(f)
+    class_labels = sorted(class_to_idx.keys(), key=lambda x: class_to_idx[x])
+
+    arch = architectures.checkpoint_arch(checkpoint)
+    loader, remap = load_validation(data_dir, class_to_idx, arch['input_size'])
+    print(f"✓ {len(loader.dataset)} validation images")
+
+    output_dir = models_dir / 'optimized'
+    results = optimize_model(
+        model, class_labels, loader, remap, output_dir,
+        prune_amount=args.prune_amount,
+        calibration_images=args.calibration_images,
+        iterations=args.iterations,
+        coreml=not args.no_coreml,
+        arch=arch,
+        # Checkpoints from before frozen_layers was saved use the default
+        frozen_layers=checkpoint.get('frozen_layers')
+    )
+
+    selected = select_variant(results, args.max_size_mb, args.max_accuracy_drop)
+    report = {
+        'model': str(model_path),
+        'budget': {'max_size_mb': args.max_size_mb, 'max_accuracy_drop': args.max_accuracy_drop},
+        'prune_amount': args.prune_amount,
+        'selected': selected['variant'] if selected else None,
+        'variants': results
+    }
+    report_path = output_dir / 'report.json'
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Report saved to {report_path}")
+
+    if args.no_coreml:
+        print("="*60)
+        return
+
+    if selected is None:
+        print("Error: No Core ML variant within the size and accuracy budget")
+        sys.exit(1)
+
+    print(f"✓ Selected {selected['variant']}: {selected['size_mb']:.2f} MB, "
+          f"accuracy {selected['accuracy']:.2f}% (-{selected['accuracy_drop']:.2f})")
+
+    if not args.dry_run:
+        target = models_dir / 'LandmarkClassifier.mlpackage'
+        if target.exists():
+            shutil.rmtree(target)
+        shutil.copytree(selected['path'], target)
+        print(f"✓ Copied to {target}")
+
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
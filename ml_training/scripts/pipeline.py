@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Run the training pipeline, skipping stages whose inputs have not changed.
+
+Every stage (fetch, download, prepare, train, convert, copy, update) is fingerprinted
+from the files it reads, the scripts that implement it and its options: the
+dataset manifest and image listing, the hyperparameters, the checkpoint,
+the landmark store, ... After a stage has run, its outputs are stored in a
+content-addressed cache under data/cache/pipeline/ and recorded under that
+fingerprint. On the next run a stage with a known fingerprint is skipped and
+any output that was changed or deleted since is restored from the cache, so
+a run where nothing changed only hashes files.
+
+The download stage is also keyed on a watermark of the landmark_photos
+table (newest updated_at and row count), queried with a single request, and
+is only recorded when no photo failed. Records beyond the last --keep per
+stage are dropped after each run, along with the cached files only they used.
+
+Stages can be run on their own, e.g. `pipeline.py convert copy`, and the run
+never waits for input: missing training images are an error instead of a
+prompt.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Commands run from the repository root, like train_pipeline.sh
+PROJECT_DIR = Path(__file__).resolve().parents[2]
+CACHE_DIR = Path('ml_training/data/cache/pipeline')
+SCRIPTS = 'ml_training/scripts'
+MODELS = 'ml_training/models'
+DATA = 'ml_training/data'
+XCODE_DIR = 'ios/ARLandmarks/ARLandmarks'
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _walk_files(root):
+    """Relative paths of all files below root, sorted."""
+    files = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            files.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(files)
+
+
+def hash_path(path):
+    """Content hash of a file or directory tree, None if it does not exist."""
+    path = Path(path)
+    if path.is_file():
+        return hash_file(path)
+    if path.is_dir():
+        tree = ''.join(f"{rel}\0{hash_file(path / rel)}\n" for rel in _walk_files(path))
+        return hashlib.sha256(tree.encode()).hexdigest()
+    return None
+
+
+def hash_listing(path):
+    """Hash of the names, sizes and modification times of the files below a directory.
+
+    Used for image folders, where hashing every image on each run would take
+    longer than the check is supposed to.
+    """
+    path = Path(path)
+    if not path.is_dir():
+        return None
+    sha256 = hashlib.sha256()
+    for rel in _walk_files(path):
+        stat = (path / rel).stat()
+        sha256.update(f"{rel}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return sha256.hexdigest()
+
+
+class Stage:
+    """One pipeline step: a command plus the files it reads and writes."""
+
+    def __init__(self, name, description, command, scripts=(), inputs=(), listings=(), outputs=(),
+                 cacheable=True, watermark=None, complete=None):
+        self.name = name
+        self.description = description
+        self.command = command
+        self.scripts = scripts
+        self.inputs = inputs
+        self.listings = listings
+        self.outputs = outputs
+        self.cacheable = cacheable
+        # Callables: remote state to fingerprint (None if unavailable), and
+        # whether a finished run may be recorded
+        self.watermark = watermark
+        self.complete = complete
+        self._watermark = None
+
+    def remote_state(self):
+        """The stage's watermark, queried once per run."""
+        if self.watermark is not None and self._watermark is None:
+            self._watermark = self.watermark()
+        return self._watermark
+
+    def fingerprint(self):
+        """Hash of everything that determines the stage's outputs."""
+        key = {
+            'command': self.command,
+            'scripts': {path: hash_path(path) for path in self.scripts},
+            'inputs': {path: hash_path(path) for path in self.inputs},
+            'listings': {path: hash_listing(path) for path in self.listings},
+            'watermark': self.remote_state()
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+class ArtifactCache:
+    """Content-addressed store of stage outputs, plus one record per stage fingerprint."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.objects = self.root / 'objects'
+        self.records = self.root / 'stages'
+
+    def _object_path(self, digest):
+        return self.objects / digest[:2] / digest
+
+    def _store_file(self, path):
+        digest = hash_file(path)
+        target = self._object_path(digest)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_suffix('.tmp')
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
+        return digest
+
+    def store(self, path):
+        """Add an output file or directory to the store and describe it."""
+        path = Path(path)
+        if path.is_dir():
+            files = {rel: self._store_file(path / rel) for rel in _walk_files(path)}
+            return {'type': 'dir', 'hash': hash_path(path), 'files': files}
+        return {'type': 'file', 'hash': self._store_file(path)}
+
+    def restore(self, path, output, dry_run=False):
+        """Bring an output back to its recorded content. False if the store lacks it."""
+        path = Path(path)
+        if hash_path(path) == output['hash']:
+            return True
+
+        digests = output['files'].values() if output['type'] == 'dir' else [output['hash']]
+        if not all(self._object_path(d).exists() for d in digests):
+            return False
+        if dry_run:
+            print(f"  → Would restore {path} from cache")
+            return True
+
+        if path.is_dir():
+            shutil.rmtree(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if output['type'] == 'dir':
+            for rel, digest in output['files'].items():
+                (path / rel).parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(self._object_path(digest), path / rel)
+        else:
+            shutil.copyfile(self._object_path(output['hash']), path)
+        print(f"  ✓ Restored {path} from cache")
+        return True
+
+    def lookup(self, stage, key):
+        record_path = self.records / stage / f"{key}.json"
+        if not record_path.exists():
+            return None
+        with open(record_path, 'r') as f:
+            return json.load(f)
+
+    def save(self, stage, key, outputs):
+        record_path = self.records / stage / f"{key}.json"
+        record_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(record_path, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'outputs': outputs}, f, indent=2)
+
+    def gc(self, keep=3):
+        """Keep the `keep` newest records per stage and delete unreferenced objects.
+
+        Returns the number of records and objects deleted and the bytes freed.
+        """
+        removed_records = 0
+        live = set()
+        for stage_dir in sorted(self.records.glob('*')) if self.records.exists() else []:
+            records = sorted(stage_dir.glob('*.json'), key=lambda p: p.stat().st_mtime, reverse=True)
+            for record_path in records[keep:]:
+                record_path.unlink()
+                removed_records += 1
+            for record_path in records[:keep]:
+                with open(record_path, 'r') as f:
+                    for output in json.load(f)['outputs'].values():
+                        live.update(output['files'].values() if output['type'] == 'dir' else [output['hash']])
+
+        removed_objects = freed = 0
+        for object_path in self.objects.glob('*/*') if self.objects.exists() else []:
+            if object_path.name not in live:
+                freed += object_path.stat().st_size
+                object_path.unlink()
+                removed_objects += 1
+        return removed_records, removed_objects, freed
+
+
+def photo_watermark():
+    """Watermark of landmark_photos, None if Supabase cannot be asked."""
+    try:
+        # Imported here: requests and aiohttp are only needed for this check
+        from download_photos import photo_watermark as query_watermark
+        return query_watermark()
+    except Exception as e:
+        print(f"  Could not check landmark_photos ({type(e).__name__}: {e})")
+        return None
+
+
+def build_stages(train_args):
+    """The pipeline of train_pipeline.sh, in order."""
+    python = [sys.executable]
+    model_scripts = [f'{SCRIPTS}/{name}' for name in (
+        'train_model.py', 'architectures.py', 'tensor_cache.py', 'batch_augment.py',
+        'feature_cache.py', 'distillation.py', 'training_profiler.py', 'prepare_dataset.py',
+        'samplers.py', 'loader_tuning.py'
+    )]
+    return [
+        # Fetching asks Supabase for changes since the last run (ETag / updated_at)
+        Stage('fetch', 'Fetching landmarks from Supabase',
+              python + [f'{SCRIPTS}/fetch_landmarks.py'], cacheable=False),
+        # landmark_photos changes independently of the landmarks, so the stage
+        # is also keyed on the table's watermark. The photos stay in data/
+        # (prepare moves them) and are not copied into the cache.
+        Stage('download', 'Downloading landmark photos',
+              python + [f'{SCRIPTS}/download_photos.py'],
+              scripts=[f'{SCRIPTS}/download_photos.py', f'{SCRIPTS}/fetch_landmarks.py',
+                       f'{SCRIPTS}/landmark_store.py'],
+              inputs=[f'{DATA}/landmarks.store'],
+              watermark=photo_watermark,
+              complete=lambda: not (Path(DATA) / '.photo_failures.json').exists()),
+        Stage('prepare', 'Verifying, deduplicating and splitting images',
+              python + [f'{SCRIPTS}/prepare_dataset.py'],
+              scripts=[f'{SCRIPTS}/prepare_dataset.py'],
+              listings=[f'{DATA}/train', f'{DATA}/validation', f'{DATA}/rejected'],
+              outputs=[f'{DATA}/manifest.jsonl']),
+        Stage('train', 'Training the model',
+              python + [f'{SCRIPTS}/train_model.py'] + train_args,
+              scripts=model_scripts,
+              inputs=[f'{DATA}/manifest.jsonl'],
+              listings=[f'{DATA}/train', f'{DATA}/validation'],
+              outputs=[f'{MODELS}/best_model.pth', f'{MODELS}/landmark_model_final.pth',
+                       f'{MODELS}/training_history.json', f'{DATA}/pytorch_class_mapping.json']),
+        Stage('convert', 'Converting to Core ML format',
+              python + [f'{SCRIPTS}/convert_to_coreml.py'],
+              scripts=[f'{SCRIPTS}/convert_to_coreml.py', f'{SCRIPTS}/architectures.py',
+                       f'{SCRIPTS}/landmark_store.py'],
+              inputs=[f'{MODELS}/best_model.pth', f'{DATA}/pytorch_class_mapping.json',
+                      f'{DATA}/landmarks.store'],
+              outputs=[f'{MODELS}/LandmarkClassifier.mlpackage', f'{MODELS}/class_mapping_swift.json']),
+        Stage('copy', 'Copying model to Xcode project',
+              ['bash', f'{SCRIPTS}/copy_model_to_xcode.sh'],
+              scripts=[f'{SCRIPTS}/copy_model_to_xcode.sh'],
+              inputs=[f'{MODELS}/LandmarkClassifier.mlpackage'],
+              outputs=[f'{XCODE_DIR}/Models/LandmarkClassifier.mlpackage']),
+        Stage('update', 'Updating VisionService.swift',
+              python + [f'{SCRIPTS}/update_vision_service.py'],
+              scripts=[f'{SCRIPTS}/update_vision_service.py', f'{SCRIPTS}/landmark_store.py'],
+              inputs=[f'{DATA}/landmarks.store', f'{MODELS}/class_mapping_swift.json',
+                      f'{XCODE_DIR}/Services/VisionService.swift'],
+              outputs=[f'{XCODE_DIR}/Services/VisionService.swift'])
+    ]
+
+
+def check_training_images():
+    """Stop with instructions when there are no training images yet."""
+    train_dir = Path(DATA) / 'train'
+    if train_dir.is_dir() and any(d.is_dir() and any(d.iterdir()) for d in train_dir.iterdir()):
+        return
+    print(f"Error: No training images found in {train_dir}/")
+    print("Place 20-50 images per landmark in ml_training/data/train/<landmark_name>/")
+    print("See MANUAL_IMAGE_COLLECTION.md for detailed instructions.")
+    sys.exit(1)
+
+
+def run_stage(stage, cache, force=False, dry_run=False):
+    """Run or skip one stage. Returns True if it ran (or would run)."""
+    if not stage.cacheable and dry_run:
+        print(f"→ {stage.name}: always runs")
+        return False
+
+    # Without its watermark a stage cannot tell whether it is up to date
+    cacheable = stage.cacheable and (stage.watermark is None or stage.remote_state() is not None)
+
+    if cacheable and not force:
+        record = cache.lookup(stage.name, stage.fingerprint())
+        if record is not None and all(cache.restore(path, output, dry_run)
+                                      for path, output in record['outputs'].items()):
+            print(f"✓ {stage.name}: inputs unchanged, skipped")
+            return False
+
+    if dry_run:
+        print(f"→ {stage.name}: would run")
+        return True
+
+    print(f"\n{'='*60}")
+    print(f"{stage.name}: {stage.description}")
+    print(f"{'='*60}")
+    start = time.time()
+    result = subprocess.run(stage.command)
+    if result.returncode != 0:
+        print(f"\nError: Stage '{stage.name}' failed (exit code {result.returncode})")
+        sys.exit(result.returncode)
+
+    if cacheable:
+        missing = [path for path in stage.outputs if not Path(path).exists()]
+        if missing:
+            print(f"Warning: {stage.name} did not produce {', '.join(missing)}, not cached")
+        elif stage.complete is not None and not stage.complete():
+            print(f"Warning: {stage.name} did not finish everything, not cached")
+        else:
+            outputs = {path: cache.store(path) for path in stage.outputs}
+            # Fingerprint after the run: prepare and update change their own inputs
+            cache.save(stage.name, stage.fingerprint(), outputs)
+
+    print(f"✓ {stage.name} finished in {time.time() - start:.1f}s")
+    return True
+
+
+def parse_args(stage_names):
+    parser = argparse.ArgumentParser(description='Run the training pipeline, skipping unchanged stages.')
+    parser.add_argument('stages', nargs='*', metavar='STAGE',
+                        help=f"stages to run (default: all of {', '.join(stage_names)})")
+    parser.add_argument('--force', action='store_true', help='run the selected stages even if unchanged')
+    parser.add_argument('--dry-run', action='store_true', help='only show which stages would run')
+    parser.add_argument('--keep', type=int, default=3,
+                        help='cache records kept per stage; older ones and their files are deleted')
+    parser.add_argument('--train-args', default='',
+                        help='options passed to train_model.py, e.g. "--epochs 10 --fast"')
+    return parser.parse_args()
+
+
+def main():
+    stage_names = [stage.name for stage in build_stages([])]
+    args = parse_args(stage_names)
+    os.chdir(PROJECT_DIR)
+
+    unknown = [name for name in args.stages if name not in stage_names]
+    if unknown:
+        print(f"Error: Unknown stage {', '.join(unknown)} (choose from {', '.join(stage_names)})")
+        sys.exit(1)
+
+    print("="*60)
+    print("Landmark Recognition Training Pipeline")
+    print("="*60)
+
+    stages = build_stages(shlex.split(args.train_args))
+    selected = set(args.stages or stage_names)
+    stages = [stage for stage in stages if stage.name in selected]
+
+    cache = ArtifactCache(CACHE_DIR)
+    start = time.time()
+    ran = []
+    for stage in stages:
+        if ran and args.dry_run:
+            # Later fingerprints depend on outputs that do not exist yet
+            print(f"→ {stage.name}: would be checked after {ran[-1]}")
+            continue
+        if stage.name in ('prepare', 'train'):
+            check_training_images()
+        if run_stage(stage, cache, force=args.force, dry_run=args.dry_run):
+            ran.append(stage.name)
+
+    if not args.dry_run:
+        records, objects, freed = cache.gc(keep=max(1, args.keep))
+        if records or objects:
+            print(f"\n✓ Cache: dropped {records} old records and {objects} files ({freed / 1024 ** 2:.1f} MB)")
+
+    print(f"\n{'='*60}")
+    print(f"Pipeline finished in {time.time() - start:.1f}s")
+    print(f"  {'Would run' if args.dry_run else 'Ran'}: {', '.join(ran) if ran else 'nothing, everything up to date'}")
+    print(f"{'='*60}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Load a trained checkpoint for inference outside of training.
+
+Shared by the inference server and batch scoring: the model is rebuilt with
+load_pytorch_model, images are preprocessed like the validation set, and
+logits are turned into top-k labels with the confidence threshold that
+VisionService.swift applies on device. With a GPS fix, the classifier head
+only scores the landmarks near it (see location_gating.py).
+"""
+import io
+import json
+from pathlib import Path
+import torch
+from PIL import Image
+from convert_to_coreml import load_pytorch_model
+from architectures import checkpoint_arch, embedding_network, final_layer, make_val_transforms
+from landmark_store import load_class_mapping
+from location_gating import DEFAULT_RADIUS_M, GatedHead, class_coordinates
+
+# VisionService.swift only accepts a top result above 90% confidence
+CONFIDENCE_THRESHOLD = 0.90
+
+
+class Predictor:
+    """A checkpoint plus its class labels, ready for batched CPU inference."""
+
+    def __init__(self, model_path, data_dir=None):
+        # Auto-detect data directory for the class mappings
+        if data_dir is None:
+            data_dir = 'data' if Path('data').exists() else 'ml_training/data'
+        data_dir = Path(data_dir)
+
+        checkpoint = torch.load(model_path, map_location='cpu')
+        self.model, _ = load_pytorch_model(model_path, checkpoint['num_classes'])
+        self.arch = checkpoint_arch(checkpoint)
+        self.input_size = self.arch['input_size']
+        self.transform = make_val_transforms(self.input_size)
+
+        class_to_idx = checkpoint.get('class_to_idx')
+        if class_to_idx is None:
+            with open(data_dir / 'pytorch_class_mapping.json', 'r') as f:
+                class_to_idx = json.load(f)
+        self.labels = sorted(class_to_idx.keys(), key=lambda x: class_to_idx[x])
+
+        # Landmark IDs, as used by the Swift class mapping
+        class_mapping = load_class_mapping(data_dir) or {}
+        self.landmark_ids = {name: info['id'] for name, info in class_mapping.items()}
+
+        # Backbone up to the hidden layer, and the head scored per location
+        self.embedder = embedding_network(self.model, self.arch)
+        lats, lons = class_coordinates(self.labels, self.landmark_ids, data_dir)
+        self.head = GatedHead(final_layer(self.model, self.arch), lats, lons)
+
+    def preprocess(self, image):
+        """Decode an image (bytes or path) into a normalized input tensor."""
+        source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+        with Image.open(source) as img:
+            return self.transform(img.convert('RGB'))
+
+    @torch.inference_mode()
+    def predict(self, inputs):
+        """Class probabilities for a (N, 3, H, W) batch."""
+        return torch.softmax(self.model(inputs), dim=1)
+
+    @torch.inference_mode()
+    def embed(self, inputs):
+        """Hidden-layer activations of the classifier head for a (N, 3, H, W) batch."""
+        return self.embedder(inputs)
+
+    def predict_at(self, hidden, lat=None, lon=None, radius_m=DEFAULT_RADIUS_M):
+        """Probabilities for one embed() row, over the classes near (lat, lon).
+
+        Without a location (or landmark coordinates) all classes are scored.
+        Returns (probs, classes) for top_k; classes is None for all classes.
+        """
+        return self.head.probabilities(hidden, lat, lon, radius_m)
+
+    def predict_at_batch(self, hidden, locations):
+        """predict_at for every row of an embed() batch, one (lat, lon, radius_m) per row.
+
+        Rows without a location, or with the same one, are scored together in
+        one matmul and softmax. Returns one (probs, classes) per row.
+        """
+        groups = {}
+        for row, (lat, lon, radius_m) in enumerate(locations):
+            key = (None, None, DEFAULT_RADIUS_M) if lat is None or lon is None else (lat, lon, radius_m)
+            groups.setdefault(key, []).append(row)
+
+        results = [None] * len(locations)
+        for (lat, lon, radius_m), rows in groups.items():
+            probs, classes = self.head.probabilities(hidden[rows], lat, lon, radius_m)
+            for row, row_probs in zip(rows, probs):
+                results[row] = (row_probs, classes)
+        return results
+
+    def top_k(self, probs, k=3, threshold=CONFIDENCE_THRESHOLD, classes=None):
+        """Top-k labels of one probability vector and the accepted result, if any.
+
+        `classes` maps the entries of a location-gated probability vector to
+        class indices.
+        """
+        confidences, indices = probs.topk(min(k, len(probs)))
+        if classes is not None:
+            indices = classes[indices]
+        predictions = [
+            {
+                'label': self.labels[i],
+                'landmark_id': self.landmark_ids.get(self.labels[i]),
+                'confidence': round(float(c), 4)
+            }
+            for c, i in zip(confidences.tolist(), indices.tolist())
+        ]
+        recognized = predictions[0] if float(confidences[0]) > threshold else None
+        return {'predictions': predictions, 'recognized': recognized}
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Verify, deduplicate and split the training images.
+
+Every image under data/train and data/validation is checked in a process pool
+(decodable, at least 300x300 pixels) and hashed twice: SHA-256 for exact
+duplicates and a 64-bit difference hash for near-duplicates (re-encoded or
+resized copies). Images are then moved into a deterministic train/validation
+split in which a group of near-duplicates never straddles both splits.
+
+The result is written to data/manifest.jsonl (one record per image with path,
+hashes, size, class and split), which later stages read instead of re-scanning
+the class folders.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from tqdm import tqdm
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+SPLITS = ('train', 'validation')
+MANIFEST_NAME = 'manifest.jsonl'
+MIN_SIZE = 300
+# Hashes of flat, low-detail images (sky, blank walls) have almost no bits set
+# and would chain unrelated images together, so they only get exact matching
+MIN_HASH_DETAIL = 6
+
+
+def _dhash(img, hash_size=8):
+    """64-bit difference hash: compares neighbouring pixels of a tiny grayscale copy."""
+    from PIL import Image
+
+    gray = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(''.join('1' if b else '0' for b in bits), 2)
+
+
+def inspect_image(path):
+    """Decode one image and return its hashes and size, or why it failed."""
+    # Imported in the worker processes, so starting the script does not load PIL
+    from PIL import Image
+
+    record = {'source': str(path)}
+    try:
+        data = Path(path).read_bytes()
+        record['sha256'] = hashlib.sha256(data).hexdigest()
+        record['bytes'] = len(data)
+        with Image.open(io.BytesIO(data)) as img:
+            # Fully decode, verify() alone misses truncated files
+            img.load()
+            record['width'], record['height'] = img.size
+            record['dhash'] = f"{_dhash(img):016x}"
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def find_near_duplicates(dhashes, max_distance, chunk_size=256):
+    """Return (i, j) index pairs whose hashes differ in at most max_distance bits."""
+    hashes = np.array([int(h, 16) for h in dhashes], dtype=np.uint64)
+    popcount = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    n = len(hashes)
+
+    pairs = []
+    for start in range(0, n, chunk_size):
+        block = hashes[start:start + chunk_size]
+        xor = block[:, None] ^ hashes[None, :]
+        distance = popcount[xor.view(np.uint8)].reshape(len(block), n, 8).sum(axis=-1)
+        rows, cols = np.nonzero(distance <= max_distance)
+        rows = rows + start
+        keep = cols > rows
+        pairs.extend(zip(rows[keep].tolist(), cols[keep].tolist()))
+
+    return pairs
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def collect_images(data_dir):
+    """List (class name, path) for every image in all splits."""
+    images = []
+    for split in SPLITS:
+        split_dir = data_dir / split
+        if not split_dir.exists():
+            continue
+        for class_dir in sorted(d for d in split_dir.iterdir() if d.is_dir()):
+            for path in sorted(class_dir.rglob('*')):
+                if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+                    images.append((class_dir.name, path))
+    return images
+
+
+def _split_order(seed, key):
+    return hashlib.sha256(f"{seed}:{key}".encode('utf-8')).hexdigest()
+
+
+def plan_split(records, split_ratio, seed):
+    """Assign a split to every accepted record, keeping each group together.
+
+    Groups are ordered per class by a seeded hash of their content, so the
+    split only depends on the images themselves, not on file names or the
+    order in which they were found. A class with a single group cannot be
+    split and stays in train, see unsplit_classes().
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(record['group'], []).append(record)
+
+    group_split = {}
+    by_class = {}
+    for group_id, members in groups.items():
+        by_class.setdefault(members[0]['class'], []).append(group_id)
+
+    for class_name, group_ids in sorted(by_class.items()):
+        class_size = sum(len(groups[g]) for g in group_ids)
+        target = max(1, round(class_size * split_ratio)) if len(group_ids) > 1 else 0
+
+        ordered = sorted(group_ids, key=lambda g: _split_order(seed, min(r['sha256'] for r in groups[g])))
+        val_count = 0
+        for group_id in ordered:
+            if group_id in group_split:
+                continue
+            if val_count < target:
+                group_split[group_id] = 'validation'
+                val_count += len(groups[group_id])
+            else:
+                group_split[group_id] = 'train'
+
+    for record in records:
+        record['split'] = group_split[record['group']]
+
+
+def unsplit_classes(records):
+    """Classes of the accepted records that have no validation image."""
+    return sorted({r['class'] for r in records} - {r['class'] for r in records if r['split'] == 'validation'})
+
+
+def remove_empty_class_dirs(data_dir):
+    """Remove class folders left without images, ImageFolder would count them as classes."""
+    removed = []
+    for split in SPLITS:
+        split_dir = data_dir / split
+        if not split_dir.exists():
+            continue
+        for class_dir in sorted(d for d in split_dir.iterdir() if d.is_dir()):
+            if any(path.is_file() for path in class_dir.rglob('*')):
+                continue
+            shutil.rmtree(class_dir)
+            removed.append(class_dir)
+    return removed
+
+
+def _move(source, destination, sha256):
+    """Move a file, avoiding name clashes, and return the final path."""
+    if source == destination:
+        return destination
+    if destination.exists():
+        destination = destination.with_name(f"{destination.stem}_{sha256[:8]}{destination.suffix}")
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(source), str(destination))
+    return destination
+
+
+def prepare_dataset(data_dir, split_ratio=0.2, min_size=MIN_SIZE, max_distance=4,
+                    seed=42, workers=None, dry_run=False):
+    """Verify, deduplicate and split data/train + data/validation into a manifest."""
+    data_dir = Path(data_dir)
+    images = collect_images(data_dir)
+    if not images:
+        print(f"Error: No images found in {data_dir / 'train'}")
+        sys.exit(1)
+
+    print(f"Inspecting {len(images)} images with {workers or os.cpu_count()} processes...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(tqdm(
+            pool.map(inspect_image, [path for _, path in images], chunksize=16),
+            total=len(images), desc="Inspecting"
+        ))
+
+    accepted = []
+    rejected = []
+    seen_sha = {}
+    for (class_name, path), record in zip(images, results):
+        record['class'] = class_name
+        if 'error' in record:
+            record['reason'] = 'corrupt'
+        elif min(record['width'], record['height']) < min_size:
+            record['reason'] = 'too_small'
+        elif record['sha256'] in seen_sha:
+            record['reason'] = 'duplicate'
+            record['duplicate_of'] = seen_sha[record['sha256']]
+        else:
+            seen_sha[record['sha256']] = record['source']
+            accepted.append(record)
+            continue
+        rejected.append(record)
+
+    # Group near-duplicates so they always land in the same split
+    union_find = _UnionFind(len(accepted))
+    detailed = [
+        i for i, r in enumerate(accepted)
+        if MIN_HASH_DETAIL <= bin(int(r['dhash'], 16)).count('1') <= 64 - MIN_HASH_DETAIL
+    ]
+    cross_class = []
+    for a, b in find_near_duplicates([accepted[i]['dhash'] for i in detailed], max_distance):
+        i, j = detailed[a], detailed[b]
+        union_find.union(i, j)
+        if accepted[i]['class'] != accepted[j]['class']:
+            cross_class.append((accepted[i]['source'], accepted[j]['source']))
+    for i, record in enumerate(accepted):
+        record['group'] = union_find.find(i)
+
+    plan_split(accepted, split_ratio, seed)
+
+    near_duplicates = len(accepted) - len({r['group'] for r in accepted})
+    reasons = {}
+    for record in rejected:
+        reasons[record['reason']] = reasons.get(record['reason'], 0) + 1
+
+    print(f"\n✓ Accepted: {len(accepted)} images in {len({r['group'] for r in accepted})} groups "
+          f"({near_duplicates} near-duplicates grouped)")
+    for reason, count in sorted(reasons.items()):
+        print(f"  Rejected ({reason}): {count}")
+    for a, b in cross_class[:10]:
+        print(f"  Warning: Near-duplicate across classes: {a} <-> {b}")
+
+    # Train and validation must have the same classes, or their class indices differ
+    unsplit = unsplit_classes(accepted)
+    if unsplit:
+        print(f"\nError: {len(unsplit)} classes have too few distinct images for a validation split:")
+        for class_name in unsplit[:10]:
+            print(f"  {class_name}")
+        if len(unsplit) > 10:
+            print(f"  ... and {len(unsplit) - 10} more")
+        print("Add more (not near-duplicate) images of these landmarks, or remove their folders")
+        if not dry_run:
+            sys.exit(1)
+
+    if dry_run:
+        print("\nDry run, no files moved and no manifest written")
+        return accepted, rejected
+
+    # Move files into place and record their final location
+    for record in accepted:
+        source = Path(record['source'])
+        destination = data_dir / record['split'] / record['class'] / source.name
+        record['path'] = _move(source, destination, record['sha256'])
+    for record in rejected:
+        source = Path(record['source'])
+        destination = data_dir / 'rejected' / record['reason'] / record['class'] / source.name
+        record['path'] = _move(source, destination, record.get('sha256', 'rejected'))
+    for class_dir in remove_empty_class_dirs(data_dir):
+        print(f"  Removed empty folder {class_dir}")
+
+    manifest_path = data_dir / MANIFEST_NAME
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        for record in accepted + rejected:
+            path = Path(record.pop('path'))
+            record.pop('source')
+            f.write(json.dumps({
+                'path': str(path.relative_to(data_dir)),
+                'mtime_ns': path.stat().st_mtime_ns,
+                **record,
+                'split': record.get('split', 'rejected')
+            }, ensure_ascii=False) + '\n')
+
+    for class_name in sorted({r['class'] for r in accepted}):
+        train = sum(1 for r in accepted if r['class'] == class_name and r['split'] == 'train')
+        val = sum(1 for r in accepted if r['class'] == class_name and r['split'] == 'validation')
+        print(f"  {class_name}: {train} training, {val} validation")
+
+    print(f"✓ Manifest written to {manifest_path}")
+    return accepted, rejected
+
+
+def manifest_is_current(data_dir):
+    """Whether data/manifest.jsonl still describes every image in the splits.
+
+    The split and class folders must not be newer than the manifest (no image
+    added, moved or removed), and every image must still have the
+    modification time recorded for it (not replaced in place).
+    """
+    data_dir = Path(data_dir)
+    manifest_path = data_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        return False
+
+    manifest_mtime = manifest_path.stat().st_mtime_ns
+    for split in SPLITS:
+        split_dir = data_dir / split
+        if not split_dir.exists():
+            continue
+        for entry in os.scandir(split_dir):
+            if entry.stat().st_mtime_ns > manifest_mtime:
+                return False
+        if split_dir.stat().st_mtime_ns > manifest_mtime:
+            return False
+
+    for record in load_manifest(data_dir):
+        if record['split'] not in SPLITS:
+            continue
+        try:
+            if os.stat(data_dir / record['path']).st_mtime_ns != record['mtime_ns']:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def load_manifest(data_dir, split=None):
+    """Read the manifest records, optionally only those of one split."""
+    with open(Path(data_dir) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if split is not None:
+        records = [r for r in records if r['split'] == split]
+    return records
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Verify, deduplicate and split the training images.')
+    parser.add_argument('--data-dir', default=None, help='data directory (auto-detected)')
+    parser.add_argument('--split-ratio', type=float, default=0.2, help='share of images used for validation')
+    parser.add_argument('--min-size', type=int, default=MIN_SIZE, help='minimum width and height in pixels')
+    parser.add_argument('--max-distance', type=int, default=4,
+                        help='maximum difference-hash bit distance for near-duplicates')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the deterministic split')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes')
+    parser.add_argument('--dry-run', action='store_true', help='only report, do not move files')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("="*60)
+    print("Dataset Preparation")
+    print("="*60)
+
+    # Auto-detect data directory
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+    elif Path('data/train').exists():
+        data_dir = Path('data')
+    else:
+        data_dir = Path('ml_training/data')
+
+    prepare_dataset(
+        data_dir,
+        split_ratio=args.split_ratio,
+        min_size=args.min_size,
+        max_distance=args.max_distance,
+        seed=args.seed,
+        workers=args.workers,
+        dry_run=args.dry_run
+    )
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
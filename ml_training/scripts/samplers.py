@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Training samplers that spend the forward/backward passes where they help.
+
+- `balanced` draws every class equally often (with replacement), so
+  landmarks with many photos no longer dominate an epoch.
+- `hard` keeps the latest training loss of every sample and each epoch
+  mostly skips samples the model has already learned, so an epoch costs
+  fewer sample passes once training has converged on the easy images.
+
+Both only replace the train loader's shuffling; validation always sees the
+full set.
+"""
+from collections import Counter
+import torch
+from torch.utils.data import Sampler, Subset, WeightedRandomSampler
+
+SAMPLERS = ('shuffle', 'balanced', 'hard')
+
+
+def dataset_targets(dataset):
+    """Class index of every sample, also for (nested) Subsets."""
+    if isinstance(dataset, Subset):
+        targets = dataset_targets(dataset.dataset)
+        return [targets[i] for i in dataset.indices]
+    return list(dataset.targets)
+
+
+def class_balanced_sampler(targets, generator=None):
+    """Draw len(targets) samples per epoch with equal probability per class."""
+    counts = Counter(targets)
+    weights = torch.tensor([1.0 / counts[t] for t in targets], dtype=torch.double)
+    return WeightedRandomSampler(weights, num_samples=len(targets), replacement=True, generator=generator)
+
+
+class HardExampleSampler(Sampler):
+    """Per-epoch subset of the samples, biased towards the ones with high loss.
+
+    A sample is kept with probability max(min_prob, q ** beta), where q is
+    the percentile of its last loss among all samples (1.0 = hardest).
+    Samples without a recorded loss are always kept, so the first epoch is a
+    full one. The DataLoader returns batches in sampler order, which lets
+    record_losses() match the per-sample losses of consecutive batches to
+    the indices yielded by the sampler.
+    """
+
+    def __init__(self, num_samples, beta=2.0, min_prob=0.1, generator=None):
+        self.num_samples = num_samples
+        self.beta = beta
+        self.min_prob = min_prob
+        self.generator = generator or torch.Generator()
+        self.losses = torch.full((num_samples,), float('nan'))
+        self.order = None
+        self.cursor = 0
+        self.set_epoch(0)
+
+    def keep_probabilities(self):
+        known = ~torch.isnan(self.losses)
+        probs = torch.ones(self.num_samples)
+        if known.sum() > 1:
+            ranks = self.losses[known].argsort().argsort().float()
+            percentiles = ranks / (len(ranks) - 1)
+            probs[known] = (percentiles ** self.beta).clamp(min=self.min_prob)
+        return probs
+
+    def set_epoch(self, epoch):
+        """Draw the samples of the next epoch."""
+        keep = torch.bernoulli(self.keep_probabilities(), generator=self.generator).bool()
+        indices = keep.nonzero().flatten()
+        self.order = indices[torch.randperm(len(indices), generator=self.generator)].tolist()
+        self.cursor = 0
+
+    def __iter__(self):
+        self.cursor = 0
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def record_losses(self, losses):
+        """Store the per-sample losses of the next batch in sampler order."""
+        indices = self.order[self.cursor:self.cursor + len(losses)]
+        self.losses[indices] = losses.float()
+        self.cursor += len(losses)
+
+    def state_dict(self):
+        return {'losses': self.losses.clone(), 'generator': self.generator.get_state()}
+
+    def load_state_dict(self, state):
+        self.losses = state['losses'].clone()
+        self.generator.set_state(state['generator'])
+
+
+def make_sampler(kind, dataset, seed=None, **options):
+    """Sampler for a training dataset, or None for plain shuffling."""
+    if kind == 'shuffle':
+        return None
+
+    generator = torch.Generator()
+    generator.manual_seed(seed if seed is not None else torch.initial_seed())
+    if kind == 'balanced':
+        return class_balanced_sampler(dataset_targets(dataset), generator=generator)
+    if kind == 'hard':
+        return HardExampleSampler(len(dataset), generator=generator, **options)
+    raise ValueError(f"Unknown sampler: {kind}")
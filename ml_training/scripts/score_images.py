@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Score a large set of images with the trained model.
+
+Image paths are streamed from a directory tree or from data/manifest.jsonl
+once, in the main process, and handed to DataLoader worker processes in
+batches to decode. Results are written in source order, so an interrupted run
+resumes after the last written path instead of loading every result. JSONL
+results are written as soon as their batch is done. Parquet part files are
+written every 4096 rows or 5 seconds, whichever comes first, so a crash
+loses at most a few seconds of work. Memory use stays flat however many
+images there are.
+
+When an image's class is known (its folder name, or the manifest class), the
+record also holds the model's confidence in that class, and images the model
+confidently assigns to another class are flagged as possibly mislabeled.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from functools import partial
+from pathlib import Path
+import torch
+from torch.utils.data import DataLoader, Dataset
+from predictor import CONFIDENCE_THRESHOLD, Predictor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+
+def iter_directory(image_dir):
+    """Yield (path, folder name) for every image below image_dir, one folder at a time."""
+    with os.scandir(image_dir) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir():
+            yield from iter_directory(entry.path)
+        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            yield entry.path, Path(image_dir).name
+
+
+def iter_manifest(manifest_path, split=None):
+    """Yield (path, class) for the accepted images of a prepare_dataset manifest."""
+    data_dir = Path(manifest_path).parent
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['split'] == 'rejected' or (split and record['split'] != split):
+                continue
+            yield str(data_dir / record['path']), record['class']
+
+
+class PathBatches:
+    """Batches of (path, label) from a source, listed once in the main process.
+
+    Used as the DataLoader's batch sampler, so workers only receive the
+    batches they decode. With `after`, everything up to and including that
+    path is skipped; `found` tells whether it was in the source.
+    """
+
+    def __init__(self, source, batch_size, after=None):
+        self.source = source
+        self.batch_size = batch_size
+        self.after = after
+        self.found = after is None
+
+    def __iter__(self):
+        batch = []
+        for path, label in self.source():
+            if not self.found:
+                self.found = path == self.after
+                continue
+            batch.append((path, label))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class ImageDecoder(Dataset):
+    """Decode one (path, label) item from PathBatches.
+
+    Images that fail to decode are passed on with their error instead of a
+    tensor.
+    """
+
+    def __init__(self, transform):
+        self.transform = transform
+
+    def __getitem__(self, item):
+        from PIL import Image
+
+        path, label = item
+        try:
+            with Image.open(path) as img:
+                return path, label, self.transform(img.convert('RGB')), None
+        except Exception as e:
+            return path, label, None, f"{type(e).__name__}: {e}"
+
+
+def _collate(samples):
+    return samples
+
+
+class JsonlWriter:
+    """Append records to a JSONL file, one flushed line per record."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._truncate_partial_line()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def _truncate_partial_line(self):
+        # A crash can leave half a line at the end
+        if not self.path.exists():
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def last_path(self):
+        """Path of the last written record, read from the end of the file."""
+        if not self.path.exists():
+            return None
+        with open(self.path, 'rb') as f:
+            end = f.seek(0, os.SEEK_END)
+            tail = b''
+            while end > 0 and tail.count(b'\n') < 2:
+                start = max(0, end - 65536)
+                f.seek(start)
+                tail = f.read(end - start) + tail
+                end = start
+        lines = [line for line in tail.split(b'\n') if line.strip()]
+        return json.loads(lines[-1])['path'] if lines else None
+
+    def write(self, records):
+        for record in records:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Write records as numbered Parquet part files in a directory.
+
+    A part file is written once `rows_per_file` records are buffered, or when
+    a batch arrives `max_seconds` after the last part file, whichever is first.
+    """
+
+    COLUMNS = ('path', 'label', 'label_confidence', 'mislabeled', 'error')
+
+    def __init__(self, path, rows_per_file=4096, max_seconds=5.0):
+        # Optional dependency, only needed for --format parquet
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq = pa, pq
+        # Fixed schema, so part files whose rows are all null in a column
+        # still read back as one table
+        self.schema = pa.schema([
+            ('path', pa.string()),
+            ('label', pa.string()),
+            ('label_confidence', pa.float64()),
+            ('mislabeled', pa.bool_()),
+            ('error', pa.string()),
+            ('predictions', pa.string()),
+            ('recognized', pa.string())
+        ])
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.rows_per_file = rows_per_file
+        self.max_seconds = max_seconds
+        self.last_flush = time.monotonic()
+        self.buffer = []
+        self.part = len(list(self.path.glob('part-*.parquet')))
+
+    def last_path(self):
+        """Path of the last row of the last part file."""
+        parts = sorted(self.path.glob('part-*.parquet'))
+        if not parts:
+            return None
+        paths = self.pq.read_table(parts[-1], columns=['path']).column('path')
+        return paths[-1].as_py() if len(paths) else None
+
+    def write(self, records):
+        self.buffer.extend(records)
+        if (len(self.buffer) >= self.rows_per_file
+                or time.monotonic() - self.last_flush >= self.max_seconds):
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+        # Same columns in every row, nested results as JSON strings
+        rows = [
+            {**{column: record.get(column) for column in self.COLUMNS},
+             'predictions': json.dumps(record['predictions']),
+             'recognized': json.dumps(record['recognized'])}
+            for record in self.buffer
+        ]
+        tmp_path = self.path / f"part-{self.part:05d}.parquet.tmp"
+        self.pq.write_table(self.pa.Table.from_pylist(rows, schema=self.schema), tmp_path)
+        os.replace(tmp_path, self.path / f"part-{self.part:05d}.parquet")
+        self.part += 1
+        self.buffer = []
+
+    def close(self):
+        self._flush()
+
+
+def score_images(predictor, source, writer, batch_size=64, workers=4, top_k=3,
+                 threshold=CONFIDENCE_THRESHOLD):
+    """Score every image from `source` after the last one `writer` has.
+
+    Records are written in source order, so the last written path is where
+    an interrupted run stopped. stats['resumed'] is False if that path is no
+    longer in the source, in which case nothing was scored.
+    """
+    after = writer.last_path()
+    if after:
+        print(f"✓ Resuming after {after}")
+
+    batches = PathBatches(source, batch_size, after)
+    loader = DataLoader(
+        ImageDecoder(predictor.transform),
+        batch_sampler=batches,
+        num_workers=workers,
+        collate_fn=_collate
+    )
+
+    stats = {'scored': 0, 'failed': 0, 'recognized': 0, 'mislabeled': 0}
+    start = time.time()
+    for batch in loader:
+        decoded = [sample for sample in batch if sample[3] is None]
+        probs = iter(predictor.predict(torch.stack([s[2] for s in decoded])) if decoded else [])
+
+        records = []
+        for path, label, _, error in batch:
+            if error is not None:
+                records.append({'path': path, 'label': label, 'error': error,
+                                'predictions': [], 'recognized': None})
+                stats['failed'] += 1
+                continue
+            row = next(probs)
+            result = predictor.top_k(row, k=top_k, threshold=threshold)
+            record = {'path': path, 'label': label, **result}
+            if label in predictor.labels:
+                record['label_confidence'] = round(float(row[predictor.labels.index(label)]), 4)
+                record['mislabeled'] = result['recognized'] is not None and result['recognized']['label'] != label
+                stats['mislabeled'] += record['mislabeled']
+            stats['recognized'] += result['recognized'] is not None
+            records.append(record)
+
+        writer.write(records)
+        stats['scored'] += len(decoded)
+        elapsed = time.time() - start
+        print(f"\r  {stats['scored']} scored, {stats['failed']} failed, "
+              f"{stats['scored'] / elapsed:.1f} images/sec", end='', flush=True)
+
+    writer.close()
+    print()
+    stats['resumed'] = batches.found
+    return stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Score a directory or manifest of images with the trained model.')
+    parser.add_argument('source', help='image directory or manifest.jsonl')
+    parser.add_argument('--model', default=None, help='checkpoint (default: models/best_model.pth)')
+    parser.add_argument('--data-dir', default=None, help='directory with the class mappings (auto-detected)')
+    parser.add_argument('--split', choices=['train', 'validation'], default=None,
+                        help='only score one split of a manifest')
+    parser.add_argument('--output', default=None,
+                        help='output file (jsonl) or directory (parquet), default: models/scores.<format>')
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl',
+                        help='parquet needs pyarrow, which is not in requirements.txt')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=4, help='image decoding processes')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=CONFIDENCE_THRESHOLD,
+                        help='minimum top-1 confidence for a recognized landmark')
+    parser.add_argument('--restart', action='store_true', help='discard existing results instead of resuming')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("="*60)
+    print("Batch Scoring")
+    print("="*60)
+
+    # Auto-detect paths based on current directory
+    if Path('models').exists() or Path('.').resolve().name == 'ml_training':
+        models_dir = Path('models')
+    else:
+        models_dir = Path('ml_training/models')
+
+    model_path = Path(args.model) if args.model else models_dir / 'best_model.pth'
+    if not model_path.exists():
+        print(f"Error: Model not found at {model_path}")
+        print("Run 'python scripts/train_model.py' first")
+        sys.exit(1)
+
+    source_path = Path(args.source)
+    if source_path.is_dir():
+        source = partial(iter_directory, source_path)
+    elif source_path.suffix == '.jsonl' and source_path.exists():
+        source = partial(iter_manifest, source_path, args.split)
+    else:
+        print(f"Error: {source_path} is neither a directory nor a manifest.jsonl")
+        sys.exit(1)
+
+    output_path = Path(args.output) if args.output else models_dir / f'scores.{args.format}'
+    if args.restart and output_path.exists():
+        if output_path.is_dir():
+            for part in output_path.glob('part-*.parquet'):
+                part.unlink()
+        else:
+            output_path.unlink()
+
+    if args.format == 'parquet':
+        try:
+            writer = ParquetWriter(output_path)
+        except ImportError:
+            print("Error: --format parquet requires pyarrow (pip install pyarrow)")
+            sys.exit(1)
+    else:
+        writer = JsonlWriter(output_path)
+
+    predictor = Predictor(model_path, args.data_dir)
+    stats = score_images(
+        predictor, source, writer,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        top_k=args.top_k,
+        threshold=args.threshold
+    )
+
+    if not stats['resumed']:
+        print(f"Error: The last scored image is no longer in {source_path}")
+        print("Run again with --restart to score everything")
+        sys.exit(1)
+
+    print(f"\n✓ Results written to {output_path}")
+    print(f"  Scored: {stats['scored']} ({stats['failed']} failed to decode)")
+    print(f"  Recognized above {args.threshold:.0%}: {stats['recognized']}")
+    print(f"  Possibly mislabeled: {stats['mislabeled']}")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Spatial index over landmark coordinates for radius and nearest-landmark queries.
+
+Landmarks are bucketed into a grid of `cell_deg` x `cell_deg` tiles and
+stored sorted by tile key (row * columns + column). Because the tiles of one
+grid row are consecutive keys, the candidates of a query are one contiguous
+slice of the sorted points per row its radius touches, found with binary
+search. The candidates are then filtered with a vectorized haversine
+distance. A query, or a whole batch of query points, takes a fixed number of
+NumPy calls, independent of the number of landmarks and tiles.
+
+k-nearest queries search a growing radius until at least k landmarks are
+inside it, which makes them exact. The index is saved as a compact binary
+tile file (data/landmark_tiles.bin).
+
+    python scripts/spatial_index.py build
+    python scripts/spatial_index.py query --lat 48.8584 --lon 2.2945 --radius 500
+    python scripts/spatial_index.py query --lat 48.8584 --lon 2.2945 --k 5
+    python scripts/spatial_index.py bench --sizes 100,1000,10000,50000
+"""
+import argparse
+import struct
+import sys
+import time
+from pathlib import Path
+import numpy as np
+from landmark_store import load_landmarks, open_store
+
+EARTH_RADIUS_M = 6371008.8
+TILE_MAGIC = b'LMTILES1'
+TILES_NAME = 'landmark_tiles.bin'
+# Header: magic, point count, cell size in degrees, id table size in bytes
+HEADER = struct.Struct('<8sIdI')
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres, broadcasting over NumPy arrays (degrees)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class SpatialIndex:
+    """Landmark coordinates bucketed into a sorted lat/lon tile grid."""
+
+    def __init__(self, ids, lats, lons, cell_deg=0.01):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.cell_deg = float(cell_deg)
+        self.rows = int(np.ceil(180 / self.cell_deg))
+        self.cols = int(np.ceil(360 / self.cell_deg))
+
+        keys = self._keys(lats, lons)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        # Position of each point in the input order, e.g. the landmark's class index
+        self.positions = order.astype(np.int32)
+        self.ids = [ids[i] for i in order]
+
+    @classmethod
+    def from_landmarks(cls, landmarks, cell_deg=0.01):
+        """Index of the landmarks that have coordinates; positions refer to `landmarks`."""
+        located = [i for i, l in enumerate(landmarks)
+                   if l.get('latitude') is not None and l.get('longitude') is not None]
+        index = cls([landmarks[i]['id'] for i in located],
+                    [landmarks[i]['latitude'] for i in located],
+                    [landmarks[i]['longitude'] for i in located],
+                    cell_deg=cell_deg)
+        index.positions = np.asarray(located, dtype=np.int32)[index.positions]
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _cell(self, lats, lons):
+        rows = np.clip(((lats + 90) // self.cell_deg).astype(np.int64), 0, self.rows - 1)
+        cols = (((lons + 180) // self.cell_deg).astype(np.int64)) % self.cols
+        return rows, cols
+
+    def _keys(self, lats, lons):
+        rows, cols = self._cell(lats, lons)
+        return rows * self.cols + cols
+
+    def _candidates(self, lats, lons, radius_m):
+        """(query, point) index pairs of every point in the tiles a query's radius touches."""
+        radius_deg = np.degrees(radius_m / EARTH_RADIUS_M)
+        row_lo, _ = self._cell(lats - radius_deg, lons)
+        row_hi, _ = self._cell(lats + radius_deg, lons)
+        # Longitude degrees per metre grow towards the poles
+        cos_lat = np.cos(np.radians(np.minimum(np.abs(lats) + radius_deg, 90)))
+        lon_deg = np.where(cos_lat > 1e-9, radius_deg / np.maximum(cos_lat, 1e-9), 360.0)
+        col_lo = np.floor((lons - lon_deg + 180) / self.cell_deg).astype(np.int64)
+        col_hi = np.floor((lons + lon_deg + 180) / self.cell_deg).astype(np.int64)
+        full = (col_hi - col_lo + 1 >= self.cols) | (lon_deg >= 180)
+        col_lo = np.where(full, 0, col_lo)
+        col_hi = np.where(full, self.cols - 1, col_hi)
+
+        # One (query, row) pair per grid row the radius touches
+        row_counts = row_hi - row_lo + 1
+        queries = np.repeat(np.arange(len(lats)), row_counts)
+        rows = np.repeat(row_lo - np.cumsum(row_counts) + row_counts, row_counts) + np.arange(row_counts.sum())
+        col_lo, col_hi = col_lo[queries], col_hi[queries]
+
+        # Column ranges crossing the antimeridian are split in two
+        ranges = [(queries, rows, np.maximum(col_lo, 0), np.minimum(col_hi, self.cols - 1))]
+        left, right = col_lo < 0, col_hi >= self.cols
+        if left.any():
+            ranges.append((queries[left], rows[left], col_lo[left] + self.cols, np.full(left.sum(), self.cols - 1)))
+        if right.any():
+            ranges.append((queries[right], rows[right], np.zeros(right.sum(), dtype=np.int64),
+                           col_hi[right] - self.cols))
+        queries, rows, lo, hi = (np.concatenate(parts) for parts in zip(*ranges))
+
+        starts = np.searchsorted(self.keys, rows * self.cols + lo, side='left')
+        ends = np.searchsorted(self.keys, rows * self.cols + hi, side='right')
+        lengths = ends - starts
+        # Expand the [start, end) slices into one flat array of point indices
+        pair_queries = np.repeat(queries, lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return pair_queries, np.repeat(starts, lengths) + offsets
+
+    def within(self, lats, lons, radius_m):
+        """Points within `radius_m` of each query point.
+
+        Returns one (point indices, distances) pair per query, sorted by
+        distance. Point indices refer to this index; use `ids` or `positions`
+        to map them back to landmarks.
+        """
+        lats, lons = np.atleast_1d(lats).astype(np.float64), np.atleast_1d(lons).astype(np.float64)
+        radii = np.broadcast_to(np.asarray(radius_m, dtype=np.float64), lats.shape)
+        pair_queries, points = self._candidates(lats, lons, float(radii.max()))
+        distances = haversine_m(lats[pair_queries], lons[pair_queries], self.lats[points], self.lons[points])
+        keep = distances <= radii[pair_queries]
+        pair_queries, points, distances = pair_queries[keep], points[keep], distances[keep]
+
+        order = np.lexsort((distances, pair_queries))
+        pair_queries, points, distances = pair_queries[order], points[order], distances[order]
+        bounds = np.searchsorted(pair_queries, np.arange(len(lats) + 1))
+        return [(points[bounds[i]:bounds[i + 1]], distances[bounds[i]:bounds[i + 1]]) for i in range(len(lats))]
+
+    def nearest(self, lats, lons, k=5, start_radius_m=None):
+        """The k nearest points of each query point as (point indices, distances)."""
+        lats, lons = np.atleast_1d(lats).astype(np.float64), np.atleast_1d(lons).astype(np.float64)
+        k = min(k, len(self))
+        results = [None] * len(lats)
+        if k == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0))] * len(lats)
+
+        # Start where k points are expected at the average density, doubling
+        # until every query has k points
+        radius = start_radius_m or self.spacing_m() * np.sqrt(k / np.pi) * 1.5
+        pending = np.arange(len(lats))
+        while len(pending):
+            found = self.within(lats[pending], lons[pending], radius)
+            unresolved = []
+            for q, (points, distances) in zip(pending, found):
+                if len(points) >= k:
+                    results[q] = (points[:k], distances[:k])
+                else:
+                    unresolved.append(q)
+            pending = np.asarray(unresolved, dtype=np.int64)
+            radius *= 2 if radius < np.pi * EARTH_RADIUS_M else 1
+        return results
+
+    def spacing_m(self):
+        """Typical distance between neighbouring points, from their bounding box."""
+        if not len(self):
+            return 0.0
+        height = np.radians(np.ptp(self.lats)) * EARTH_RADIUS_M
+        width = np.radians(np.ptp(self.lons)) * EARTH_RADIUS_M * np.cos(np.radians(np.median(self.lats)))
+        one_tile = np.radians(self.cell_deg) * EARTH_RADIUS_M
+        return max(np.sqrt(max(height, 1.0) * max(width, 1.0) / len(self)), one_tile / 16)
+
+    def save(self, path):
+        """Write the compact binary tile file.
+
+        Layout (little-endian): header, int64 tile keys, float32 latitudes,
+        float32 longitudes, int32 landmark positions, uint32 id offsets
+        (count + 1) and the UTF-8 id bytes.
+        """
+        encoded = [str(i).encode('utf-8') for i in self.ids]
+        offsets = np.concatenate([[0], np.cumsum([len(e) for e in encoded])]).astype('<u4')
+        id_bytes = b''.join(encoded)
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(TILE_MAGIC, len(self), self.cell_deg, len(id_bytes)))
+            f.write(self.keys.astype('<i8').tobytes())
+            f.write(self.lats.astype('<f4').tobytes())
+            f.write(self.lons.astype('<f4').tobytes())
+            f.write(self.positions.astype('<i4').tobytes())
+            f.write(offsets.tobytes())
+            f.write(id_bytes)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        data = Path(path).read_bytes()
+        magic, count, cell_deg, id_size = HEADER.unpack_from(data)
+        if magic != TILE_MAGIC:
+            raise ValueError(f"{path} is not a landmark tile file")
+
+        index = cls.__new__(cls)
+        index.cell_deg = cell_deg
+        index.rows = int(np.ceil(180 / cell_deg))
+        index.cols = int(np.ceil(360 / cell_deg))
+        offset = HEADER.size
+
+        def take(dtype, n):
+            nonlocal offset
+            array = np.frombuffer(data, dtype=dtype, count=n, offset=offset)
+            offset += array.nbytes
+            return array
+
+        index.keys = take('<i8', count).astype(np.int64)
+        index.lats = take('<f4', count).astype(np.float64)
+        index.lons = take('<f4', count).astype(np.float64)
+        index.positions = take('<i4', count).astype(np.int32)
+        id_offsets = take('<u4', count + 1)
+        id_bytes = data[offset:offset + id_size]
+        index.ids = [id_bytes[id_offsets[i]:id_offsets[i + 1]].decode('utf-8') for i in range(count)]
+        return index
+
+
+def random_points(n, center=(48.8566, 2.3522), spread_m=15000, seed=0):
+    """Synthetic landmarks scattered around a city centre."""
+    rng = np.random.default_rng(seed)
+    spread_deg = np.degrees(spread_m / EARTH_RADIUS_M)
+    lats = center[0] + rng.normal(0, spread_deg / 2, n)
+    lons = center[1] + rng.normal(0, spread_deg / 2, n) / np.cos(np.radians(center[0]))
+    return lats, lons
+
+
+def benchmark(sizes, radius_m=500, k=5, queries=1000, batch=256, cell_deg=0.01):
+    """Latency of radius and k-nearest queries against a linear haversine scan."""
+    print(f"\n{'Landmarks':>10s} {'radius':>10s} {'k-nearest':>10s} {'scan':>10s} {'batch/pt':>10s}  (ms per query)")
+    results = []
+    for size in sizes:
+        lats, lons = random_points(size)
+        index = SpatialIndex([str(i) for i in range(size)], lats, lons, cell_deg=cell_deg)
+        q_lats, q_lons = random_points(queries, seed=1)
+
+        def per_query(fn, n=min(queries, 200)):
+            start = time.perf_counter()
+            for i in range(n):
+                fn(i)
+            return (time.perf_counter() - start) * 1000 / n
+
+        # Check against the linear scan
+        points, _ = index.within(q_lats[0], q_lons[0], radius_m)[0]
+        scan = np.nonzero(haversine_m(q_lats[0], q_lons[0], lats, lons) <= radius_m)[0]
+        assert sorted(index.positions[points]) == sorted(scan), "index and scan disagree"
+
+        row = {
+            'landmarks': size,
+            'radius_ms': per_query(lambda i: index.within(q_lats[i], q_lons[i], radius_m)),
+            'nearest_ms': per_query(lambda i: index.nearest(q_lats[i], q_lons[i], k)),
+            'scan_ms': per_query(lambda i: np.nonzero(haversine_m(q_lats[i], q_lons[i], lats, lons) <= radius_m)),
+        }
+        start = time.perf_counter()
+        for b in range(0, queries, batch):
+            index.within(q_lats[b:b + batch], q_lons[b:b + batch], radius_m)
+        row['batch_ms'] = (time.perf_counter() - start) * 1000 / queries
+        results.append(row)
+        print(f"{size:>10d} {row['radius_ms']:>10.3f} {row['nearest_ms']:>10.3f} "
+              f"{row['scan_ms']:>10.3f} {row['batch_ms']:>10.4f}")
+    return results
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(',') if x]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Spatial index over landmark coordinates.')
+    parser.add_argument('--data-dir', default=None, help='data directory (auto-detected)')
+    parser.add_argument('--cell-deg', type=float, default=0.01, help='tile size in degrees (0.01 = ~1.1 km)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('build', help=f'index the saved landmarks and write {TILES_NAME}')
+
+    query = commands.add_parser('query', help='landmarks near a point')
+    query.add_argument('--lat', type=float, required=True)
+    query.add_argument('--lon', type=float, required=True)
+    query.add_argument('--radius', type=float, default=None, help='radius in metres')
+    query.add_argument('--k', type=int, default=5, help='nearest landmarks (without --radius)')
+
+    bench = commands.add_parser('bench', help='query latency on synthetic landmarks')
+    bench.add_argument('--sizes', type=_int_list, default=[100, 1000, 10000, 50000])
+    bench.add_argument('--radius', type=float, default=500)
+    bench.add_argument('--k', type=int, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("="*60)
+    print("Landmark Spatial Index")
+    print("="*60)
+
+    if args.command == 'bench':
+        benchmark(args.sizes, radius_m=args.radius, k=args.k, cell_deg=args.cell_deg)
+        print("="*60)
+        return
+
+    data_dir = Path(args.data_dir) if args.data_dir else \
+        (Path('data') if Path('data').exists() else Path('ml_training/data'))
+    tiles_path = data_dir / TILES_NAME
+
+    if args.command == 'build':
+        landmarks = load_landmarks(data_dir)
+        if not landmarks:
+            print(f"Error: No landmarks saved in {data_dir}")
+            print("Run 'python scripts/fetch_landmarks.py' first")
+            sys.exit(1)
+        index = SpatialIndex.from_landmarks(landmarks, cell_deg=args.cell_deg)
+        index.save(tiles_path)
+        skipped = len(landmarks) - len(index)
+        print(f"✓ Indexed {len(index)} landmarks" + (f" ({skipped} without coordinates)" if skipped else ""))
+        print(f"✓ Saved {tiles_path} ({tiles_path.stat().st_size / 1024:.1f} KB)")
+
+    else:
+        if not tiles_path.exists():
+            print(f"Error: {tiles_path} not found, run 'build' first")
+            sys.exit(1)
+        index = SpatialIndex.load(tiles_path)
+        store = open_store(data_dir)
+
+        start = time.perf_counter()
+        if args.radius is not None:
+            points, distances = index.within(args.lat, args.lon, args.radius)[0]
+        else:
+            points, distances = index.nearest(args.lat, args.lon, args.k)[0]
+        elapsed = (time.perf_counter() - start) * 1000
+
+        print(f"{len(points)} landmarks ({elapsed:.3f} ms):")
+        for point, distance in zip(points, distances):
+            name = landmark_id = index.ids[point]
+            row = store.find(landmark_id) if store is not None else None
+            if row is not None:
+                name = store.value(row, 'name_en') or store.value(row, 'name')
+            print(f"  {distance:8.0f} m  {name}")
+
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter sweep over train_model.py with asynchronous successive halving.
+
+Trial configurations are sampled from a search space of train_model.py flags
+(learning rate, batch size, frozen layers, dropout, ...). Each trial runs as a
+separate train_model.py process with its own --output-dir, several at a time
+with the CPU threads split between them. All trials read the same decoded
+tensor cache, which is built once before the first trial starts.
+
+Trials train in rungs of increasing epochs (e.g. 2, 6, 18, 25). After a rung,
+a trial is resumed from its training_state.pth for the next rung only if it
+ranks in the top 1/eta of all trials that finished that rung (ASHA), so poor
+configurations stop early. When a rung is complete its best trial is always
+promoted, so at least one trial trains for the full --max-epochs. The resulting leaderboard lists validation
+accuracy, training time and single-image inference latency per trial.
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+import torch
+from benchmark import measure_latency
+from convert_to_coreml import load_pytorch_model
+from architectures import checkpoint_arch
+from tensor_cache import build_tensor_cache
+from train_model import LandmarkClassifier
+
+TRAIN_SCRIPT = Path(__file__).resolve().parent / 'train_model.py'
+
+# Values are passed to train_model.py as --learning-rate, --batch-size, ...
+DEFAULT_SPACE = {
+    'learning_rate': [0.0003, 0.001, 0.003],
+    'batch_size': [16, 32, 64],
+    'frozen_layers': [6, 9, 11],
+    'dropout': [0.1, 0.2, 0.4]
+}
+
+
+def sample_configs(space, num_trials, seed=0):
+    """Draw distinct configurations from the grid of a search space."""
+    keys = sorted(space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    rng = random.Random(seed)
+    if num_trials >= len(grid):
+        rng.shuffle(grid)
+        return grid
+    return rng.sample(grid, num_trials)
+
+
+def rung_epochs(min_epochs, max_epochs, eta):
+    """Epoch budgets of the rungs: min_epochs * eta^k, capped by max_epochs."""
+    rungs = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= eta
+    rungs.append(max_epochs)
+    return rungs
+
+
+class SuccessiveHalving:
+    """Asynchronous successive halving (ASHA) scheduler.
+
+    Whenever a process slot is free, the highest rung with a promotable trial
+    wins: a trial is promoted once it is in the top 1/eta of the results
+    reported for its rung so far. Once every trial of a rung has reported, at
+    least its best trial is promoted, so the last rung is always trained even
+    when a rung holds fewer than eta trials. Otherwise the next new trial
+    starts. Failed trials are never promoted.
+    """
+
+    def __init__(self, num_trials, num_rungs, eta=3):
+        self.num_trials = num_trials
+        self.eta = eta
+        self.results = [{} for _ in range(num_rungs)]
+        self.promoted = [set() for _ in range(num_rungs)]
+        self.started = 0
+
+    def next_job(self):
+        """(trial, rung) to run next, or None if nothing can run right now."""
+        for rung in reversed(range(len(self.results) - 1)):
+            scores = self.results[rung]
+            ranked = sorted(scores, key=scores.get, reverse=True)
+            quota = len(ranked) // self.eta
+            if self._rung_complete(rung):
+                quota = max(1, quota)
+            for trial in ranked[:quota]:
+                if scores[trial] == float('-inf'):
+                    break
+                if trial not in self.promoted[rung]:
+                    self.promoted[rung].add(trial)
+                    return trial, rung + 1
+
+        if self.started < self.num_trials:
+            self.started += 1
+            return self.started - 1, 0
+        return None
+
+    def _rung_complete(self, rung):
+        """True once every trial that will ever enter `rung` has reported."""
+        if rung == 0:
+            return self.started == self.num_trials and len(self.results[0]) == self.num_trials
+        return self._rung_complete(rung - 1) and len(self.results[rung]) == len(self.promoted[rung - 1])
+
+    def report(self, trial, rung, score):
+        self.results[rung][trial] = score
+
+
+def trial_command(trial, epochs, resume, extra_args):
+    """train_model.py invocation that trains a trial up to `epochs`."""
+    command = [
+        sys.executable, str(TRAIN_SCRIPT),
+        '--output-dir', str(trial['dir']),
+        '--epochs', str(epochs),
+        '--seed', str(trial['seed'])
+    ]
+    for key, value in trial['config'].items():
+        command += ['--' + key.replace('_', '-'), str(value)]
+    if resume:
+        command.append('--resume')
+    return command + extra_args
+
+
+def read_history(trial_dir):
+    history_file = Path(trial_dir) / 'training_history.json'
+    if not history_file.exists():
+        return None
+    with open(history_file, 'r') as f:
+        return json.load(f)
+
+
+def run_sweep(trials, rungs, eta, parallel, extra_args):
+    """Train all trials through the rungs, `parallel` processes at a time."""
+    scheduler = SuccessiveHalving(len(trials), len(rungs), eta)
+    # Split the cores instead of oversubscribing them
+    threads = max(1, (os.cpu_count() or 1) // parallel)
+    env = {**os.environ, 'OMP_NUM_THREADS': str(threads), 'MKL_NUM_THREADS': str(threads)}
+    running = {}
+
+    while True:
+        while len(running) < parallel:
+            job = scheduler.next_job()
+            if job is None:
+                break
+            index, rung = job
+            trial = trials[index]
+            trial['dir'].mkdir(parents=True, exist_ok=True)
+            log = open(trial['dir'] / 'train.log', 'a')
+            process = subprocess.Popen(
+                trial_command(trial, rungs[rung], rung > 0, extra_args),
+                stdout=log, stderr=subprocess.STDOUT, env=env
+            )
+            running[process] = (index, rung, time.time(), log)
+            print(f"  → {trial['name']}: rung {rung + 1}/{len(rungs)} ({rungs[rung]} epochs)")
+
+        if not running:
+            break
+
+        time.sleep(1)
+        for process in [p for p in running if p.poll() is not None]:
+            index, rung, start, log = running.pop(process)
+            log.close()
+            trial = trials[index]
+            trial['train_time_s'] += time.time() - start
+
+            history = read_history(trial['dir'])
+            if process.returncode != 0 or history is None:
+                trial['status'] = 'failed'
+                scheduler.report(index, rung, float('-inf'))
+                print(f"  ✗ {trial['name']}: failed, see {trial['dir'] / 'train.log'}")
+                continue
+
+            trial['epochs'] = len(history['val_acc'])
+            trial['val_acc'] = max(history['val_acc'])
+            trial['status'] = 'completed' if rung == len(rungs) - 1 else f"stopped at rung {rung + 1}"
+            scheduler.report(index, rung, trial['val_acc'])
+            print(f"  ✓ {trial['name']}: rung {rung + 1}/{len(rungs)} "
+                  f"Val Acc {trial['val_acc']:.2f}% after {trial['epochs']} epochs")
+
+    return trials
+
+
+def measure_trial_latency(trial, iterations=100):
+    """Single-thread, single-image latency of a trial's best checkpoint."""
+    model_path = trial['dir'] / 'best_model.pth'
+    if not model_path.exists():
+        return None
+    checkpoint = torch.load(model_path, map_location='cpu')
+    with contextlib.redirect_stdout(io.StringIO()):
+        model, _ = load_pytorch_model(model_path, checkpoint['num_classes'])
+    latency = measure_latency(model, torch.contiguous_format, iterations=iterations,
+                              input_size=checkpoint_arch(checkpoint)['input_size'])
+    return latency['p50_ms']
+
+
+def print_leaderboard(rows, keys):
+    header = f"{'#':>2}  {'trial':<9}" + ''.join(f"{k:>15}" for k in keys)
+    header += f"{'epochs':>8}{'val_acc':>9}{'train_s':>9}{'p50_ms':>8}  status"
+    print(header)
+    print("-" * len(header))
+    for rank, row in enumerate(rows, 1):
+        val_acc = f"{row['val_acc']:.2f}" if row['val_acc'] is not None else '-'
+        latency = f"{row['latency_p50_ms']:.2f}" if row['latency_p50_ms'] is not None else '-'
+        print(f"{rank:>2}  {row['trial']:<9}" + ''.join(f"{row['config'][k]!s:>15}" for k in keys)
+              + f"{row['epochs']:>8}{val_acc:>9}{row['train_time_s']:>9.0f}{latency:>8}  {row['status']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Hyperparameter sweep with successive halving. '
+                    'Unknown arguments (e.g. --fast, --augment batch) are passed on to train_model.py.'
+    )
+    parser.add_argument('--space', default=None,
+                        help='JSON file mapping train_model.py options to lists of values')
+    parser.add_argument('--trials', type=int, default=12, help='number of configurations to try')
+    parser.add_argument('--min-epochs', type=int, default=2, help='epochs of the first rung')
+    parser.add_argument('--max-epochs', type=int, default=25, help='epochs of the last rung')
+    parser.add_argument('--eta', type=int, default=3,
+                        help='reduction factor: the top 1/eta of a rung is promoted')
+    parser.add_argument('--parallel', type=int, default=max(1, min(4, (os.cpu_count() or 1) // 2)),
+                        help='trials trained at the same time')
+    parser.add_argument('--seed', type=int, default=0, help='seed for sampling and training')
+    parser.add_argument('--latency-iterations', type=int, default=100)
+    parser.add_argument('--output-dir', default=None, help='sweep directory (default: models/sweeps/<time>)')
+    return parser.parse_known_args()
+
+
+def main():
+    args, extra_args = parse_args()
+
+    print("="*60)
+    print("Hyperparameter Sweep")
+    print("="*60)
+
+    # Auto-detect paths based on current directory
+    if Path('models').exists() or Path('.').resolve().name == 'ml_training':
+        models_dir = Path('models')
+    else:
+        models_dir = Path('ml_training/models')
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space, 'r') as f:
+            space = json.load(f)
+
+    if args.eta < 2 or args.min_epochs < 1 or args.min_epochs > args.max_epochs:
+        print("Error: Need --eta >= 2 and 1 <= --min-epochs <= --max-epochs")
+        sys.exit(1)
+
+    sweep_dir = Path(args.output_dir) if args.output_dir else \
+        models_dir / 'sweeps' / datetime.now().strftime('%Y%m%d-%H%M%S')
+    rungs = rung_epochs(args.min_epochs, args.max_epochs, args.eta)
+    configs = sample_configs(space, args.trials, seed=args.seed)
+
+    print(f"✓ {len(configs)} trials over {', '.join(sorted(space))}")
+    print(f"✓ Rungs (epochs): {rungs}, eta={args.eta}, {args.parallel} trials in parallel")
+    if extra_args:
+        print(f"✓ train_model.py options: {' '.join(extra_args)}")
+
+    # Split and decode the dataset once, before trials run concurrently
+    classifier = LandmarkClassifier()
+    classifier._create_validation_split()
+    if '--no-cache' not in extra_args:
+        build_tensor_cache(classifier.data_dir)
+
+    trials = [
+        {
+            'name': f"trial_{i:02d}",
+            'dir': sweep_dir / f"trial_{i:02d}",
+            'config': config,
+            'seed': args.seed + i,
+            'epochs': 0,
+            'val_acc': None,
+            'train_time_s': 0.0,
+            'status': 'not started'
+        }
+        for i, config in enumerate(configs)
+    ]
+
+    print(f"\nRunning trials in {sweep_dir}...")
+    sweep_start = time.time()
+    run_sweep(trials, rungs, args.eta, args.parallel, extra_args)
+    sweep_time = time.time() - sweep_start
+
+    print("\nMeasuring inference latency...")
+    torch.set_num_threads(1)
+    rows = []
+    for trial in trials:
+        rows.append({
+            'trial': trial['name'],
+            'config': trial['config'],
+            'epochs': trial['epochs'],
+            'val_acc': trial['val_acc'],
+            'train_time_s': round(trial['train_time_s'], 1),
+            'latency_p50_ms': measure_trial_latency(trial, args.latency_iterations),
+            'status': trial['status'],
+            'model': str(trial['dir'] / 'best_model.pth')
+        })
+    rows.sort(key=lambda row: row['val_acc'] if row['val_acc'] is not None else float('-inf'), reverse=True)
+
+    leaderboard_file = sweep_dir / 'leaderboard.json'
+    with open(leaderboard_file, 'w') as f:
+        json.dump({
+            'space': space,
+            'rungs': rungs,
+            'eta': args.eta,
+            'parallel': args.parallel,
+            'train_model_args': extra_args,
+            'sweep_time_s': round(sweep_time, 1),
+            'trials': rows
+        }, f, indent=2)
+
+    print(f"\nLeaderboard ({sweep_time / 60:.1f} min):\n")
+    print_leaderboard(rows, sorted(space))
+    print(f"\n✓ Leaderboard saved to {leaderboard_file}")
+    if rows and rows[0]['val_acc'] is not None:
+        print(f"✓ Best model: {rows[0]['model']}")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
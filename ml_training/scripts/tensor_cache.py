@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Decode and resize the training images once into a memory-mapped uint8 store.
+
+Every split (train/validation) is stored as a raw (N, 3, H, W) uint8 array next
+to an index keyed by file path and modification time, so only new or changed
+images are decoded again when the cache is rebuilt. When data/manifest.jsonl
+from prepare_dataset.py is up to date, it is used instead of scanning folders.
+"""
+import json
+import os
+import sys
+from pathlib import Path
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision.datasets.folder import IMG_EXTENSIONS
+from tqdm import tqdm
+from prepare_dataset import load_manifest, manifest_is_current
+
+IMAGE_SIZE = 224
+CACHE_VERSION = 1
+SPLITS = ('train', 'validation')
+
+
+def _scan_image_folder(image_dir):
+    """List (relative path, mtime_ns, target) in the same order as ImageFolder."""
+    image_dir = Path(image_dir)
+    classes = sorted(d.name for d in os.scandir(image_dir) if d.is_dir())
+    class_to_idx = {name: idx for idx, name in enumerate(classes)}
+
+    entries = []
+    for class_name in classes:
+        class_dir = image_dir / class_name
+        for root, _, fnames in sorted(os.walk(class_dir, followlinks=True)):
+            for fname in sorted(fnames):
+                if not fname.lower().endswith(IMG_EXTENSIONS):
+                    continue
+                path = Path(root) / fname
+                entries.append({
+                    'path': str(path.relative_to(image_dir)),
+                    'mtime_ns': path.stat().st_mtime_ns,
+                    'target': class_to_idx[class_name]
+                })
+
+    return classes, class_to_idx, entries
+
+
+def _scan_manifest(records, split):
+    """Same as _scan_image_folder, but from prepare_dataset.py manifest records."""
+    classes = sorted({r['class'] for r in records if r['split'] in SPLITS})
+    class_to_idx = {name: idx for idx, name in enumerate(classes)}
+
+    split_records = sorted(
+        (r for r in records if r['split'] == split),
+        key=lambda r: (r['class'], r['path'])
+    )
+    entries = [{
+        'path': str(Path(r['path']).relative_to(split)),
+        'mtime_ns': r['mtime_ns'],
+        'target': class_to_idx[r['class']]
+    } for r in split_records]
+
+    return classes, class_to_idx, entries
+
+
+def _decode_image(path, image_size):
+    """Decode an image and resize it the same way as transforms.Resize."""
+    with Image.open(path) as img:
+        img = img.convert('RGB').resize((image_size, image_size), Image.BILINEAR)
+        return np.asarray(img, dtype=np.uint8).transpose(2, 0, 1)
+
+
+def _load_index(store_dir):
+    """Load the index of an existing store, or None if there is none."""
+    index_path = store_dir / 'index.json'
+    if not index_path.exists() or not (store_dir / 'images.u8').exists():
+        return None
+
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+
+    if index.get('version') != CACHE_VERSION:
+        return None
+    return index
+
+
+def build_split(image_dir, store_dir, image_size=IMAGE_SIZE, scan=None):
+    """Build or refresh the uint8 store for one ImageFolder directory.
+
+    `scan` optionally provides (classes, class_to_idx, entries) so the
+    directory does not have to be walked.
+    """
+    image_dir = Path(image_dir)
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    classes, class_to_idx, entries = scan or _scan_image_folder(image_dir)
+    shape = (len(entries), 3, image_size, image_size)
+
+    old_index = _load_index(store_dir)
+    old_rows = {}
+    old_images = None
+    if old_index is not None and old_index['image_size'] == image_size:
+        if old_index['classes'] == classes and old_index['entries'] == entries:
+            print(f"✓ {image_dir.name}: cache up to date ({len(entries)} images)")
+            return store_dir
+
+        old_rows = {
+            (entry['path'], entry['mtime_ns']): row
+            for row, entry in enumerate(old_index['entries'])
+        }
+        if old_rows:
+            old_images = np.memmap(
+                store_dir / 'images.u8', dtype=np.uint8, mode='r',
+                shape=(len(old_index['entries']), 3, image_size, image_size)
+            )
+
+    tmp_path = store_dir / 'images.u8.tmp'
+    decoded = 0
+    if entries:
+        images = np.memmap(tmp_path, dtype=np.uint8, mode='w+', shape=shape)
+        for row, entry in enumerate(tqdm(entries, desc=f"Caching {image_dir.name}")):
+            old_row = old_rows.get((entry['path'], entry['mtime_ns']))
+            if old_row is not None:
+                images[row] = old_images[old_row]
+            else:
+                images[row] = _decode_image(image_dir / entry['path'], image_size)
+                decoded += 1
+        images.flush()
+        del images
+    else:
+        tmp_path.touch()
+
+    del old_images
+    os.replace(tmp_path, store_dir / 'images.u8')
+
+    with open(store_dir / 'index.json', 'w') as f:
+        json.dump({
+            'version': CACHE_VERSION,
+            'image_size': image_size,
+            'classes': classes,
+            'class_to_idx': class_to_idx,
+            'entries': entries
+        }, f)
+
+    print(f"✓ {image_dir.name}: cached {len(entries)} images ({decoded} decoded)")
+    return store_dir
+
+
+def build_tensor_cache(data_dir, cache_dir=None, image_size=IMAGE_SIZE):
+    """Build or refresh the stores for data/train and data/validation."""
+    data_dir = Path(data_dir)
+    cache_dir = Path(cache_dir) if cache_dir else data_dir / 'cache'
+
+    records = None
+    if manifest_is_current(data_dir):
+        records = load_manifest(data_dir)
+        print("✓ Using dataset manifest")
+
+    store_dirs = {}
+    for split in SPLITS:
+        image_dir = data_dir / split
+        if not image_dir.exists():
+            print(f"Error: Image directory not found: {image_dir}")
+            sys.exit(1)
+        scan = _scan_manifest(records, split) if records is not None else None
+        store_dirs[split] = build_split(image_dir, cache_dir / split, image_size, scan=scan)
+
+    return store_dirs
+
+
+class CachedImageFolder(Dataset):
+    """ImageFolder replacement that reads pre-decoded uint8 tensors from a store.
+
+    Samples are returned as (3, H, W) uint8 tensors, so `transform` should only
+    contain tensor transforms (augmentation, dtype conversion, normalization).
+    """
+
+    def __init__(self, store_dir, transform=None, target_transform=None):
+        self.store_dir = Path(store_dir)
+        self.transform = transform
+        self.target_transform = target_transform
+
+        index = _load_index(self.store_dir)
+        if index is None:
+            raise FileNotFoundError(f"No tensor cache found at {self.store_dir}")
+
+        self.image_size = index['image_size']
+        self.classes = index['classes']
+        self.class_to_idx = index['class_to_idx']
+        self.entries = index['entries']
+        self.samples = [(entry['path'], entry['target']) for entry in index['entries']]
+        self.targets = [target for _, target in self.samples]
+        self._images = None
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getstate__(self):
+        # Each DataLoader worker opens its own memory map
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def _open(self):
+        self._images = np.memmap(
+            self.store_dir / 'images.u8', dtype=np.uint8, mode='r',
+            shape=(len(self.samples), 3, self.image_size, self.image_size)
+        )
+
+    def __getitem__(self, idx):
+        if self._images is None:
+            self._open()
+
+        image = torch.from_numpy(np.array(self._images[idx]))
+        target = self.targets[idx]
+
+        if self.transform is not None:
+            image = self.transform(image)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+
+        return image, target
+
+
+def main():
+    print("="*60)
+    print("Tensor Cache Builder")
+    print("="*60)
+
+    # Auto-detect data directory
+    if Path('data/train').exists():
+        data_dir = Path('data')
+    else:
+        data_dir = Path('ml_training/data')
+
+    build_tensor_cache(data_dir)
+    print(f"\n✓ Tensor cache ready in {data_dir / 'cache'}")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
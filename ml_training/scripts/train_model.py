@@ -3,23 +3,92 @@
 Train a landmark recognition model using transfer learning with MobileNetV3.
 The model will be optimized for mobile deployment.
 """
+import argparse
 import json
 import os
+import random
 import sys
 from pathlib import Path
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
-from torch.utils.data import DataLoader
-from torchvision import datasets, transforms, models
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, Subset
+from torch.utils.data.distributed import DistributedSampler
+from torchvision import datasets, transforms
 from tqdm import tqdm
 import time
+from tensor_cache import IMAGE_SIZE, CachedImageFolder, build_tensor_cache
+from batch_augment import BatchAugmenter
+import architectures
+from architectures import make_val_transforms
+import distillation
+import feature_cache
+from loader_tuning import tune_loader
+import samplers
+from training_profiler import TrainingProfiler
+
+
+class EarlyStopping:
+    """Stop training when a validation metric stops improving.
+
+    `metric` is 'val_loss' (lower is better) or 'val_acc' (higher is better).
+    Training also stops as soon as `target_val_acc` is reached, if given.
+    """
+
+    def __init__(self, metric='val_loss', patience=5, min_delta=0.0, target_val_acc=None):
+        self.metric = metric
+        self.patience = patience
+        self.min_delta = min_delta
+        self.target_val_acc = target_val_acc
+        self.best = None
+        self.bad_epochs = 0
+
+    def step(self, val_loss, val_acc):
+        """Record one epoch and return a reason to stop, or None to continue."""
+        if self.target_val_acc is not None and val_acc >= self.target_val_acc:
+            return f"reached target validation accuracy ({val_acc:.2f}% >= {self.target_val_acc:.2f}%)"
+
+        if self.patience is None:
+            return None
+
+        # Compare so that larger is always better
+        value = -val_loss if self.metric == 'val_loss' else val_acc
+        if self.best is None or value > self.best + self.min_delta:
+            self.best = value
+            self.bad_epochs = 0
+            return None
+
+        self.bad_epochs += 1
+        if self.bad_epochs >= self.patience:
+            return f"no {self.metric} improvement for {self.bad_epochs} epochs"
+        return None
+
+    def state_dict(self):
+        return {'best': self.best, 'bad_epochs': self.bad_epochs}
+
+    def load_state_dict(self, state):
+        self.best = state['best']
+        self.bad_epochs = state['bad_epochs']
+
+
+class TargetRemap:
+    """Map dataset class indices (sorted folder order) to stable model indices."""
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def __call__(self, target):
+        return self.mapping[target]
 
 
 class LandmarkClassifier:
     """Wrapper for training a landmark classifier."""
 
-    def __init__(self, data_dir=None, num_classes=None):
+    def __init__(self, data_dir=None, num_classes=None, rank=0, world_size=1, arch=None):
         # Auto-detect data directory based on current location
         if data_dir is None:
             # Try relative to current directory first (if running from ml_training/)
@@ -33,15 +102,28 @@ class LandmarkClassifier:
                 data_dir = 'data'
 
         self.data_dir = Path(data_dir)
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.rank = rank
+        self.world_size = world_size
+        self.is_main = rank == 0
+        if world_size > 1:
+            # Distributed training uses one gloo process per CPU share
+            self.device = torch.device('cpu')
+        else:
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.num_classes = num_classes or self._count_classes()
 
         print(f"Using device: {self.device}")
+        if world_size > 1:
+            print(f"Distributed: {world_size} processes (gloo), {torch.get_num_threads()} threads each")
         print(f"Number of classes: {self.num_classes}")
 
+        # Network to build, see architectures.py
+        self.arch = arch or architectures.make_arch()
+        size = self.arch['input_size']
+
         # Data transforms
         self.train_transforms = transforms.Compose([
-            transforms.Resize((224, 224)),
+            transforms.Resize((size, size)),
             transforms.RandomHorizontalFlip(),
             transforms.RandomRotation(15),
             transforms.ColorJitter(brightness=0.2, contrast=0.2),
@@ -49,18 +131,55 @@ class LandmarkClassifier:
             transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
         ])
 
-        self.val_transforms = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
+        self.val_transforms = make_val_transforms(size)
+
+        # Same transforms for pre-decoded 224x224 uint8 tensors from the cache
+        resize_cached = [transforms.Resize((size, size), antialias=True)] if size != IMAGE_SIZE else []
+        self.cached_train_transforms = transforms.Compose(resize_cached + [
+            transforms.RandomHorizontalFlip(),
+            transforms.RandomRotation(15),
+            transforms.ColorJitter(brightness=0.2, contrast=0.2),
+            transforms.ConvertImageDtype(torch.float),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+
+        self.cached_val_transforms = transforms.Compose(resize_cached + [
+            transforms.ConvertImageDtype(torch.float),
             transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
         ])
 
+        # Batch augmentation mode: loaders only yield resized uint8 tensors
+        self.uint8_transforms = transforms.Compose([
+            transforms.Resize((IMAGE_SIZE, IMAGE_SIZE)),
+            transforms.PILToTensor()
+        ])
+        self.batch_augmenter = None
+
         # Load datasets
         self.train_dataset = None
         self.val_dataset = None
         self.train_loader = None
         self.val_loader = None
         self.model = None
+        self.frozen_layers = architectures.default_frozen_layers(self.arch)
+        self.feature_head = None
+        self.class_to_idx = None
+        self.batch_size = None
+        # DataLoader settings, chosen by tune_loaders() in auto-tuning mode
+        self.num_workers = 2
+        self.prefetch_factor = 2
+        # Training sampler, see samplers.py
+        self.sampler = 'shuffle'
+        self.sampler_options = {}
+        # Set by prepare_incremental: stable target mapping and replay subset
+        self.target_remap = None
+        self.train_indices = None
+        # Set by attach_teacher for distillation
+        self.criterion = None
+        # Prefix of the saved checkpoints, e.g. 'teacher_'
+        self.checkpoint_prefix = ''
+        # Replaces the auto-detected models directory, e.g. for sweep trials
+        self.output_dir = None
 
     def _count_classes(self):
         """Count number of classes from training directory."""
@@ -69,9 +188,48 @@ class LandmarkClassifier:
             print(f"Error: Training directory not found: {train_dir}")
             sys.exit(1)
 
-        classes = [d for d in train_dir.iterdir() if d.is_dir()]
+        # Folders left without images (e.g. all rejected) are not classes
+        classes = [d for d in train_dir.iterdir() if d.is_dir() and any(p.is_file() for p in d.rglob('*'))]
         return len(classes)
 
+    def _main_process_first(self, fn, *args, **kwargs):
+        """Run fn on rank 0 before the other ranks, e.g. to build shared caches."""
+        if self.world_size > 1 and not self.is_main:
+            dist.barrier()
+        result = fn(*args, **kwargs)
+        if self.world_size > 1 and self.is_main:
+            dist.barrier()
+        return result
+
+    def _make_loader(self, dataset, batch_size, train, num_workers=None, seed=None):
+        """Build a DataLoader, sharding the dataset across ranks when distributed."""
+        num_workers = self.num_workers if num_workers is None else num_workers
+        sampler = None
+        if self.world_size > 1:
+            if train:
+                sampler = DistributedSampler(
+                    dataset, num_replicas=self.world_size, rank=self.rank,
+                    shuffle=True, seed=seed or 0
+                )
+            else:
+                # Strided shards without padding, so all-reduced metrics are exact
+                dataset = Subset(dataset, range(self.rank, len(dataset), self.world_size))
+        elif train:
+            sampler = samplers.make_sampler(self.sampler, dataset, seed=seed, **self.sampler_options)
+
+        return DataLoader(
+            dataset,
+            batch_size=batch_size,
+            shuffle=train and sampler is None,
+            sampler=sampler,
+            num_workers=num_workers,
+            prefetch_factor=self.prefetch_factor if num_workers > 0 else None,
+            # Keep the workers between epochs instead of forking them again
+            persistent_workers=num_workers > 0,
+            # Page-locked memory only speeds up copies to a CUDA device
+            pin_memory=self.device.type == 'cuda'
+        )
+
     def _create_validation_split(self, split_ratio=0.2):
         """Create validation split from training data if it doesn't exist."""
         import shutil
@@ -115,72 +273,276 @@ class LandmarkClassifier:
 
         print("✓ Validation split created")
 
-    def load_data(self, batch_size=32):
-        """Load training and validation datasets."""
+    def load_data(self, batch_size=32, use_cache=True, augment='pil', seed=None, tune_batch_sizes=None):
+        """Load training and validation datasets.
+
+        With `use_cache`, images are decoded and resized once into a memory-mapped
+        uint8 store (see tensor_cache.py) and only augmentations run per epoch.
+        With `augment='batch'`, augmentation and normalization run on whole
+        batches on `self.device` (see batch_augment.py) instead of per sample.
+        With `tune_batch_sizes`, the DataLoader settings are probed first and
+        the fastest of these batch sizes replaces `batch_size`.
+        """
         print("\nLoading datasets...")
 
         # Create validation split if needed
-        self._create_validation_split()
+        self._main_process_first(self._create_validation_split)
 
         train_dir = self.data_dir / 'train'
         val_dir = self.data_dir / 'validation'
 
-        self.train_dataset = datasets.ImageFolder(train_dir, transform=self.train_transforms)
-        self.val_dataset = datasets.ImageFolder(val_dir, transform=self.val_transforms)
-
-        self.train_loader = DataLoader(
-            self.train_dataset,
-            batch_size=batch_size,
-            shuffle=True,
-            num_workers=2,
-            pin_memory=True
-        )
-
-        self.val_loader = DataLoader(
-            self.val_dataset,
-            batch_size=batch_size,
-            shuffle=False,
-            num_workers=2,
-            pin_memory=True
-        )
+        size = self.arch['input_size']
+        if augment == 'batch':
+            # Every rank draws different augmentations
+            rank_seed = seed + self.rank if seed is not None else None
+            self.batch_augmenter = BatchAugmenter(self.device, seed=rank_seed, size=size)
+            if use_cache:
+                train_transform, val_transform = None, None
+            else:
+                train_transform, val_transform = self.uint8_transforms, self.uint8_transforms
+        elif use_cache:
+            train_transform, val_transform = self.cached_train_transforms, self.cached_val_transforms
+        else:
+            train_transform, val_transform = self.train_transforms, self.val_transforms
+
+        if use_cache:
+            store_dirs = self._main_process_first(build_tensor_cache, self.data_dir)
+            self.train_dataset = CachedImageFolder(store_dirs['train'], transform=train_transform)
+            self.val_dataset = CachedImageFolder(store_dirs['validation'], transform=val_transform)
+        else:
+            self.train_dataset = datasets.ImageFolder(train_dir, transform=train_transform)
+            self.val_dataset = datasets.ImageFolder(val_dir, transform=val_transform)
+
+        if tune_batch_sizes:
+            batch_size = self.tune_loaders(tune_batch_sizes)
+
+        self.train_loader = self._make_loader(self.train_dataset, batch_size, train=True, seed=seed)
+        self.val_loader = self._make_loader(self.val_dataset, batch_size, train=False)
 
         print(f"✓ Training samples: {len(self.train_dataset)}")
         print(f"✓ Validation samples: {len(self.val_dataset)}")
         print(f"✓ Batch size: {batch_size}")
+        print(f"✓ DataLoader: {self.num_workers} workers"
+              + (f" (persistent), prefetch factor {self.prefetch_factor}" if self.num_workers else ""))
+        print(f"✓ Augmentation: {'batched on ' + str(self.device) if self.batch_augmenter else 'per-sample PIL'}")
+
+        self.batch_size = batch_size
+        self.class_to_idx = self.train_dataset.class_to_idx
+        return self.class_to_idx
+
+    def tune_loaders(self, batch_sizes):
+        """Choose worker count and prefetch factor with a probe, return the batch size.
+
+        Rank 0 probes with its share of the cores and the other ranks use its
+        result.
+        """
+        config = None
+        if self.is_main:
+            cores = max(1, (os.cpu_count() or 1) // self.world_size)
+            config = tune_loader(self.train_dataset, batch_sizes, cores=cores)
+            config.pop('probes')
+        if self.world_size > 1:
+            shared = [config]
+            dist.broadcast_object_list(shared, src=0)
+            config = shared[0]
+
+        self.num_workers = config['num_workers']
+        self.prefetch_factor = config['prefetch_factor']
+        print(f"✓ Chosen DataLoader config: {config['num_workers']} workers, prefetch factor "
+              f"{config['prefetch_factor']}, batch size {config['batch_size']} "
+              f"({config['images_per_sec']:.1f} images/sec)")
+        return config['batch_size']
+
+    def prepare_incremental(self, old_class_to_idx, replay_fraction=0.2, seed=0):
+        """Set up fine-tuning after new landmark folders were added.
+
+        Existing classes keep their index from `old_class_to_idx` and new
+        classes are appended after them. Training then uses every image of
+        the new classes plus a `replay_fraction` sample of each old class;
+        validation still covers all classes to catch forgetting.
+        """
+        class_to_idx = dict(old_class_to_idx)
+        new_classes = [name for name in self.train_dataset.classes if name not in class_to_idx]
+        for name in new_classes:
+            class_to_idx[name] = len(class_to_idx)
+
+        print(f"\nIncremental mode: {len(old_class_to_idx)} existing, {len(new_classes)} new classes")
+        for name in new_classes:
+            print(f"  + {name} -> {class_to_idx[name]}")
+        if not new_classes:
+            print("  Warning: No new classes found, fine-tuning on the replay sample only")
+
+        for dataset in (self.train_dataset, self.val_dataset):
+            missing = [name for name in dataset.classes if name not in class_to_idx]
+            if missing:
+                print(f"Error: Validation classes without training data: {', '.join(missing)}")
+                sys.exit(1)
+            dataset.target_transform = TargetRemap(
+                {idx: class_to_idx[name] for name, idx in dataset.class_to_idx.items()}
+            )
+        self.target_remap = self.train_dataset.target_transform
+
+        # All samples of new classes, a replay sample of old ones
+        by_class = {}
+        for idx, (_, target) in enumerate(self.train_dataset.samples):
+            by_class.setdefault(self.train_dataset.classes[target], []).append(idx)
+
+        rng = random.Random(seed)
+        indices = []
+        for name, class_indices in by_class.items():
+            if name in new_classes:
+                indices.extend(class_indices)
+            else:
+                replay_size = max(1, round(len(class_indices) * replay_fraction))
+                indices.extend(rng.sample(class_indices, min(replay_size, len(class_indices))))
+        self.train_indices = sorted(indices)
+
+        self.class_to_idx = class_to_idx
+        self.num_classes = len(class_to_idx)
+        self.train_loader = self._make_loader(
+            Subset(self.train_dataset, self.train_indices), self.batch_size, train=True, seed=seed
+        )
+
+        print(f"✓ Incremental training samples: {len(self.train_indices)} of {len(self.train_dataset)} "
+              f"(replay fraction {replay_fraction})")
+        return class_to_idx
+
+    def grow_classifier(self, checkpoint):
+        """Load a trained checkpoint into a model with more output classes.
+
+        All weights are copied; the final linear layer keeps its old rows and
+        only the rows of the new classes start from a fresh initialization.
+        """
+        state = dict(checkpoint['model_state_dict'])
+        old_weight = state.pop('classifier.3.weight')
+        old_bias = state.pop('classifier.3.bias')
+
+        missing, unexpected = self.model.load_state_dict(state, strict=False)
+        if unexpected or set(missing) != {'classifier.3.weight', 'classifier.3.bias'}:
+            print(f"Error: Checkpoint does not match the model architecture")
+            sys.exit(1)
+
+        old_classes = old_weight.shape[0]
+        with torch.no_grad():
+            self.model.classifier[3].weight[:old_classes] = old_weight
+            self.model.classifier[3].bias[:old_classes] = old_bias
 
-        return self.train_dataset.class_to_idx
+        print(f"✓ Grew classifier from {old_classes} to {self.num_classes} classes")
 
     def build_model(self):
         """Build MobileNetV3 model with transfer learning."""
         print("\nBuilding model...")
 
-        # Load pre-trained MobileNetV3-Small (optimized for mobile)
-        self.model = models.mobilenet_v3_small(pretrained=True)
+        # Pre-trained backbone (MobileNetV3-Small by default, optimized for mobile)
+        # with a new classifier head
+        self.model = architectures.build_network(self.arch, self.num_classes, pretrained=True)
 
         # Freeze early layers
-        for param in self.model.features[:9].parameters():
+        for param in architectures.frozen_prefix(self.model, self.arch, self.frozen_layers).parameters():
             param.requires_grad = False
 
-        # Replace classifier
-        num_features = self.model.classifier[0].in_features
-        self.model.classifier = nn.Sequential(
-            nn.Linear(num_features, 256),
-            nn.Hardswish(),
-            nn.Dropout(0.2),
-            nn.Linear(256, self.num_classes)
-        )
-
         self.model = self.model.to(self.device)
-        print(f"✓ Model built: MobileNetV3-Small")
+        print(f"✓ Model built: {architectures.describe(self.arch)}")
         print(f"  Trainable parameters: {sum(p.numel() for p in self.model.parameters() if p.requires_grad):,}")
 
         return self.model
 
-    def train(self, epochs=20, learning_rate=0.001):
-        """Train the model."""
+    def load_feature_data(self, batch_size=32, views=1, seed=0):
+        """Train from cached activations of the frozen prefix instead of images.
+
+        Requires `load_data(use_cache=True)` and `build_model()` first. The
+        frozen prefix runs once per image and view (see feature_cache.py);
+        afterwards only `features[frozen_layers:]` and the classifier are run.
+        Note that the frozen BatchNorm layers stay in eval mode here, whereas
+        the image path updates their running statistics during training.
+        """
+        if not isinstance(self.train_dataset, CachedImageFolder):
+            print("Error: Feature caching requires the tensor cache (drop --no-cache)")
+            sys.exit(1)
+        if self.arch['name'] == 'resnet50' or self.arch['input_size'] != IMAGE_SIZE:
+            print(f"Error: Feature caching needs a {IMAGE_SIZE}px MobileNetV3 model")
+            sys.exit(1)
+
+        print(f"\nCaching frozen features (features[:{self.frozen_layers}], {views} views)...")
+        cache_dir = self.data_dir / 'cache' / 'features'
+
+        # Read raw uint8 images, the feature cache applies its own augmentation
+        splits = {'train': (self.train_dataset, views), 'validation': (self.val_dataset, 1)}
+        store_dirs = {}
+        for split, (dataset, split_views) in splits.items():
+            image_dataset = CachedImageFolder(dataset.store_dir)
+            store_dirs[split] = self._main_process_first(
+                feature_cache.build_split,
+                self.model, self.frozen_layers, image_dataset, cache_dir / split,
+                self.device, views=split_views, seed=seed
+            )
+
+        train_features = feature_cache.CachedFeatureDataset(
+            store_dirs['train'], random_view=True, target_transform=self.target_remap
+        )
+        val_features = feature_cache.CachedFeatureDataset(
+            store_dirs['validation'], target_transform=self.val_dataset.target_transform
+        )
+        if self.train_indices is not None:
+            train_features = Subset(train_features, self.train_indices)
+
+        self.train_loader = self._make_loader(train_features, batch_size, train=True, num_workers=0, seed=seed)
+        self.val_loader = self._make_loader(val_features, batch_size, train=False, num_workers=0)
+        self.feature_head = feature_cache.FeatureHead(self.model, self.frozen_layers)
+        self.batch_augmenter = None
+
+        print(f"✓ Training from cached features: {len(train_features)} images")
+        return store_dirs
+
+    def attach_teacher(self, teacher, teacher_id, teacher_arch, temperature=4.0, alpha=0.7, seed=None):
+        """Distill from a fine-tuned teacher instead of training on labels alone.
+
+        Requires `load_data(use_cache=True)`. The teacher runs once over the
+        training images and its logits are cached (see distillation.py); the
+        loss then blends the softened teacher predictions with the labels.
+        """
+        if not isinstance(self.train_dataset, CachedImageFolder):
+            print("Error: Distillation requires the tensor cache (drop --no-cache)")
+            sys.exit(1)
+
+        print(f"\nCaching teacher logits ({architectures.describe(teacher_arch)})...")
+        store_dir = self._main_process_first(
+            distillation.build_logit_cache,
+            teacher.to(self.device), teacher_id, CachedImageFolder(self.train_dataset.store_dir),
+            self.data_dir / 'cache' / 'teacher' / 'train', self.device,
+            input_size=teacher_arch['input_size']
+        )
+
+        train_dataset = distillation.TeacherLogitsDataset(self.train_dataset, store_dir)
+        self.train_loader = self._make_loader(train_dataset, self.batch_size, train=True, seed=seed)
+        self.criterion = distillation.DistillationLoss(temperature=temperature, alpha=alpha)
+
+        print(f"✓ Distilling with temperature {temperature}, alpha {alpha}")
+        return store_dir
+
+    def train(self, epochs=20, learning_rate=0.001, fast=False, compile_model=False,
+              resume_from=None, early_stopping=None, profile=False, trace_steps=0, trace_skip=10):
+        """Train the model.
+
+        With `fast`, training uses autocast (bfloat16 on CPU, float16 with grad
+        scaling on CUDA), channels_last tensors and accumulates metrics on the
+        device, syncing once per epoch. `compile_model` wraps the model in
+        torch.compile. Both are off by default so the plain fp32 path stays
+        available for comparison.
+
+        After every epoch the full training state is written to
+        `training_state.pth`; pass its path as `resume_from` to continue an
+        interrupted run. `early_stopping` is an optional EarlyStopping rule.
+
+        With `profile`, every epoch's history gets a `profile` entry with the
+        time per phase (data wait, to_device, forward, backward, optimizer,
+        metrics, validation), samples/sec and peak RSS. `trace_steps` > 0 also
+        records that many steps after the first `trace_skip` with
+        torch.profiler into `training_trace.json`.
+        """
         print(f"\nTraining for {epochs} epochs...")
 
-        criterion = nn.CrossEntropyLoss()
+        criterion = self.criterion or nn.CrossEntropyLoss()
         optimizer = optim.Adam(
             filter(lambda p: p.requires_grad, self.model.parameters()),
             lr=learning_rate
@@ -189,58 +551,144 @@ class LandmarkClassifier:
             optimizer, mode='min', patience=3, factor=0.5, verbose=True
         )
 
+        # In feature-cache mode only the layers after the frozen prefix run
+        model = self.feature_head if self.feature_head is not None else self.model
+
+        use_cuda = self.device.type == 'cuda'
+        amp_dtype = torch.float16 if use_cuda else torch.bfloat16
+        scaler = torch.cuda.amp.GradScaler(enabled=fast and use_cuda)
+        memory_format = torch.channels_last if fast else torch.contiguous_format
+        if fast:
+            self.model.to(memory_format=torch.channels_last)
+            print(f"  Fast path: {amp_dtype} autocast, channels_last, per-epoch metric sync")
+
         best_val_acc = 0.0
-        history = {'train_loss': [], 'train_acc': [], 'val_loss': [], 'val_acc': []}
+        history = {'train_loss': [], 'train_acc': [], 'val_loss': [], 'val_acc': [], 'train_images_per_sec': [],
+                   'train_samples': []}
+        start_epoch = 0
+
+        # The hard-example sampler learns from the per-sample losses
+        sampler = self.train_loader.sampler
+        hard_sampler = sampler if isinstance(sampler, samplers.HardExampleSampler) else None
+
+        if resume_from is not None:
+            state = self.load_training_state(resume_from, optimizer, scheduler, scaler, early_stopping)
+            start_epoch = state['epoch'] + 1
+            best_val_acc = state['best_val_acc']
+            history = state['history']
+            history.setdefault('train_samples', [])
+            print(f"✓ Resumed from {resume_from} after epoch {start_epoch} (best Val Acc: {best_val_acc:.2f}%)")
+
+        if self.world_size > 1:
+            model = DistributedDataParallel(model)
+
+        forward = torch.compile(model) if compile_model else model
+
+        profiler = TrainingProfiler(
+            self.device,
+            enabled=profile,
+            trace_steps=trace_steps if self.is_main else 0,
+            trace_skip=trace_skip,
+            trace_path=self.models_dir() / f'{self.checkpoint_prefix}training_trace.json'
+        )
 
-        for epoch in range(epochs):
+        for epoch in range(start_epoch, epochs):
             print(f"\nEpoch {epoch+1}/{epochs}")
             print("-" * 60)
 
+            if isinstance(sampler, (DistributedSampler, samplers.HardExampleSampler)):
+                sampler.set_epoch(epoch)
+
             # Training phase
-            self.model.train()
-            train_loss = 0.0
-            train_correct = 0
+            model.train()
+            train_loss = torch.zeros((), device=self.device) if fast else 0.0
+            train_correct = torch.zeros((), dtype=torch.long, device=self.device) if fast else 0
             train_total = 0
+            epoch_start = time.time()
+            profiler.start_epoch()
 
-            pbar = tqdm(self.train_loader, desc="Training")
-            for inputs, labels in pbar:
-                inputs, labels = inputs.to(self.device), labels.to(self.device)
-
-                optimizer.zero_grad()
-                outputs = self.model(inputs)
-                loss = criterion(outputs, labels)
-                loss.backward()
-                optimizer.step()
-
-                train_loss += loss.item()
-                _, predicted = outputs.max(1)
-                train_total += labels.size(0)
-                train_correct += predicted.eq(labels).sum().item()
-
-                pbar.set_postfix({'loss': f"{loss.item():.3f}", 'acc': f"{100.*train_correct/train_total:.1f}%"})
-
-            train_loss /= len(self.train_loader)
-            train_acc = 100. * train_correct / train_total
+            pbar = tqdm(self.train_loader, desc="Training", disable=not self.is_main)
+            for inputs, labels, *teacher_logits in profiler.batches(pbar):
+                profiler.begin_step()
+                with profiler.phase('to_device'):
+                    inputs, labels = inputs.to(self.device), labels.to(self.device)
+                    teacher_logits = [t.to(self.device) for t in teacher_logits]
+                    if self.batch_augmenter:
+                        inputs = self.batch_augmenter(inputs, train=True)
+                    inputs = inputs.contiguous(memory_format=memory_format)
+
+                with profiler.phase('optimizer'):
+                    optimizer.zero_grad()
+                with profiler.phase('forward'):
+                    with torch.autocast(device_type=self.device.type, dtype=amp_dtype, enabled=fast):
+                        outputs = forward(inputs)
+                        loss = criterion(outputs, labels, *teacher_logits)
+                with profiler.phase('backward'):
+                    scaler.scale(loss).backward()
+                with profiler.phase('optimizer'):
+                    scaler.step(optimizer)
+                    scaler.update()
+
+                with profiler.phase('metrics'):
+                    _, predicted = outputs.max(1)
+                    train_total += labels.size(0)
+                    if hard_sampler is not None:
+                        hard_sampler.record_losses(
+                            F.cross_entropy(outputs.detach().float(), labels, reduction='none').cpu()
+                        )
+                    if fast:
+                        # Stay on the device, synced once after the epoch
+                        train_loss += loss.detach().float()
+                        train_correct += predicted.eq(labels).sum()
+                    else:
+                        train_loss += loss.item()
+                        train_correct += predicted.eq(labels).sum().item()
+                        pbar.set_postfix({'loss': f"{loss.item():.3f}", 'acc': f"{100.*train_correct/train_total:.1f}%"})
+
+            train_batches = len(self.train_loader)
+            if self.world_size > 1:
+                train_loss, train_correct, train_total, train_batches = self._all_reduce_sums(
+                    train_loss, train_correct, train_total, train_batches
+                )
+
+            train_loss = float(train_loss) / train_batches
+            train_acc = 100. * int(train_correct) / train_total
+            images_per_sec = train_total / (time.time() - epoch_start)
 
             # Validation phase
-            self.model.eval()
-            val_loss = 0.0
-            val_correct = 0
+            model.eval()
+            val_loss = torch.zeros((), device=self.device) if fast else 0.0
+            val_correct = torch.zeros((), dtype=torch.long, device=self.device) if fast else 0
             val_total = 0
 
-            with torch.no_grad():
-                for inputs, labels in tqdm(self.val_loader, desc="Validation"):
+            with torch.no_grad(), profiler.phase('validation'):
+                for inputs, labels in tqdm(self.val_loader, desc="Validation", disable=not self.is_main):
                     inputs, labels = inputs.to(self.device), labels.to(self.device)
-                    outputs = self.model(inputs)
-                    loss = criterion(outputs, labels)
+                    if self.batch_augmenter:
+                        inputs = self.batch_augmenter(inputs, train=False)
+                    inputs = inputs.contiguous(memory_format=memory_format)
+
+                    with torch.autocast(device_type=self.device.type, dtype=amp_dtype, enabled=fast):
+                        outputs = forward(inputs)
+                        loss = criterion(outputs, labels)
 
-                    val_loss += loss.item()
                     _, predicted = outputs.max(1)
                     val_total += labels.size(0)
-                    val_correct += predicted.eq(labels).sum().item()
-
-            val_loss /= len(self.val_loader)
-            val_acc = 100. * val_correct / val_total
+                    if fast:
+                        val_loss += loss.float()
+                        val_correct += predicted.eq(labels).sum()
+                    else:
+                        val_loss += loss.item()
+                        val_correct += predicted.eq(labels).sum().item()
+
+            val_batches = len(self.val_loader)
+            if self.world_size > 1:
+                val_loss, val_correct, val_total, val_batches = self._all_reduce_sums(
+                    val_loss, val_correct, val_total, val_batches
+                )
+
+            val_loss = float(val_loss) / val_batches
+            val_acc = 100. * int(val_correct) / val_total
 
             # Update learning rate
             scheduler.step(val_loss)
@@ -250,45 +698,162 @@ class LandmarkClassifier:
             history['train_acc'].append(train_acc)
             history['val_loss'].append(val_loss)
             history['val_acc'].append(val_acc)
+            history['train_images_per_sec'].append(images_per_sec)
+            history['train_samples'].append(int(train_total))
 
             print(f"\nResults:")
             print(f"  Train Loss: {train_loss:.4f} | Train Acc: {train_acc:.2f}%")
             print(f"  Val Loss:   {val_loss:.4f} | Val Acc:   {val_acc:.2f}%")
+            print(f"  Throughput: {images_per_sec:.1f} images/sec")
+
+            if profiler.enabled:
+                stats = profiler.end_epoch(train_total)
+                history.setdefault('profile', []).append(stats)
+                profiler.report(stats)
 
             # Save best model
             if val_acc > best_val_acc:
                 best_val_acc = val_acc
-                self.save_model('best_model.pth')
-                print(f"  ✓ Saved best model (Val Acc: {val_acc:.2f}%)")
+                if self.is_main:
+                    self.save_model(f'{self.checkpoint_prefix}best_model.pth')
+                    print(f"  ✓ Saved best model (Val Acc: {val_acc:.2f}%)")
+
+            stop_reason = early_stopping.step(val_loss, val_acc) if early_stopping else None
+
+            # Collective, every rank contributes its own generators
+            rng_states = self._gather_rng_states()
+            if self.is_main:
+                self.save_model(f'{self.checkpoint_prefix}training_state.pth', extra={
+                    'epoch': epoch,
+                    'best_val_acc': best_val_acc,
+                    'history': history,
+                    'optimizer_state_dict': optimizer.state_dict(),
+                    'scheduler_state_dict': scheduler.state_dict(),
+                    'scaler_state_dict': scaler.state_dict(),
+                    'early_stopping': early_stopping.state_dict() if early_stopping else None,
+                    'rng_states': rng_states,
+                    'sampler': hard_sampler.state_dict() if hard_sampler else None
+                })
+
+            if stop_reason:
+                print(f"\nStopping early after epoch {epoch+1}: {stop_reason}")
+                break
+
+        profiler.close()
 
         print(f"\n{'='*60}")
         print(f"Training completed!")
         print(f"Best validation accuracy: {best_val_acc:.2f}%")
+        self._report_sample_passes(history)
         print(f"{'='*60}")
 
         return history
 
-    def save_model(self, filename='landmark_model.pth', save_dir=None):
-        """Save the trained model."""
-        # Auto-detect models directory
+    def _report_sample_passes(self, history):
+        """Print the forward/backward passes spent, compared to full epochs."""
+        passes = history['train_samples']
+        if not passes or not history['val_acc']:
+            return
+        best_epoch = history['val_acc'].index(max(history['val_acc']))
+        full = len(self.train_loader.dataset) * len(passes)
+        print(f"Sample passes: {sum(passes):,} in {len(passes)} epochs, "
+              f"{sum(passes[:best_epoch + 1]):,} until the best epoch")
+        if self.sampler == 'hard':
+            print(f"  {100 * (1 - sum(passes) / full):.0f}% fewer than {len(passes)} full epochs ({full:,})")
+
+    def _all_reduce_sums(self, *values):
+        """Sum per-rank metric values across all processes."""
+        totals = torch.tensor([float(v) for v in values], dtype=torch.float64)
+        dist.all_reduce(totals, op=dist.ReduceOp.SUM)
+        return totals.tolist()
+
+    def _rng_state(self):
+        """Collect the random number generator states for a checkpoint."""
+        return {
+            'python': random.getstate(),
+            'torch': torch.get_rng_state(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+            'batch_augmenter': self.batch_augmenter.generator.get_state() if self.batch_augmenter else None
+        }
+
+    def _gather_rng_states(self):
+        """RNG states of all ranks, indexed by rank."""
+        if self.world_size == 1:
+            return [self._rng_state()]
+        states = [None] * self.world_size
+        dist.all_gather_object(states, self._rng_state())
+        return states
+
+    def _restore_rng_states(self, states):
+        """Restore this rank's RNG state from a checkpoint's per-rank states.
+
+        Checkpoints written with fewer ranks (or before states were saved per
+        rank) only have rank 0's state. Other ranks then restore it and
+        re-seed with an offset, so they do not draw rank 0's augmentations.
+        """
+        if self.rank < len(states):
+            self._set_rng_state(states[self.rank])
+            return
+        self._set_rng_state(states[0])
+        # Same draw on every rank, offset by rank
+        seed = int(torch.randint(2 ** 62, (1,))) + self.rank
+        random.seed(seed)
+        torch.manual_seed(seed)
+        if self.batch_augmenter:
+            self.batch_augmenter.generator.manual_seed(seed)
+
+    def _set_rng_state(self, state):
+        """Restore the random number generator states from a checkpoint."""
+        random.setstate(state['python'])
+        torch.set_rng_state(state['torch'])
+        if state['cuda'] is not None and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(state['cuda'])
+        if state['batch_augmenter'] is not None and self.batch_augmenter:
+            self.batch_augmenter.generator.set_state(state['batch_augmenter'])
+
+    def models_dir(self, save_dir=None):
+        """Auto-detect the models directory."""
+        if save_dir is None:
+            save_dir = self.output_dir
         if save_dir is None:
             if Path('models').exists() or Path('.').resolve().name == 'ml_training':
                 save_dir = 'models'
             else:
                 save_dir = 'ml_training/models'
+        return Path(save_dir)
 
-        save_path = Path(save_dir)
+    def save_model(self, filename='landmark_model.pth', save_dir=None, extra=None):
+        """Save the trained model, plus any `extra` checkpoint entries."""
+        save_path = self.models_dir(save_dir)
         save_path.mkdir(parents=True, exist_ok=True)
 
         filepath = save_path / filename
         torch.save({
             'model_state_dict': self.model.state_dict(),
             'num_classes': self.num_classes,
-            'class_to_idx': self.train_dataset.class_to_idx
+            'class_to_idx': self.class_to_idx,
+            'arch': self.arch,
+            # Blocks that were not fine-tuned, e.g. left alone by pruning
+            'frozen_layers': self.frozen_layers,
+            **(extra or {})
         }, filepath)
 
         return filepath
 
+    def load_training_state(self, filepath, optimizer, scheduler, scaler, early_stopping=None):
+        """Restore model, optimizer, scheduler and RNG state from training_state.pth."""
+        state = torch.load(filepath, map_location=self.device)
+        self.model.load_state_dict(state['model_state_dict'])
+        optimizer.load_state_dict(state['optimizer_state_dict'])
+        scheduler.load_state_dict(state['scheduler_state_dict'])
+        scaler.load_state_dict(state['scaler_state_dict'])
+        if early_stopping is not None and state['early_stopping'] is not None:
+            early_stopping.load_state_dict(state['early_stopping'])
+        self._restore_rng_states(state['rng_states'] if 'rng_states' in state else [state['rng_state']])
+        if state.get('sampler') is not None and isinstance(self.train_loader.sampler, samplers.HardExampleSampler):
+            self.train_loader.sampler.load_state_dict(state['sampler'])
+        return state
+
     def load_model(self, filepath):
         """Load a saved model."""
         checkpoint = torch.load(filepath, map_location=self.device)
@@ -296,21 +861,214 @@ class LandmarkClassifier:
         return checkpoint
 
 
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train the landmark recognition model.')
+    parser.add_argument('--epochs', type=int, default=25)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=0.001)
+    parser.add_argument('--sampler', choices=samplers.SAMPLERS, default='shuffle',
+                        help='balanced: equal draws per class; hard: skip samples the model has already learned')
+    parser.add_argument('--hard-min-prob', type=float, default=0.1,
+                        help='with --sampler hard, the lowest chance of an easy sample to be kept per epoch')
+    parser.add_argument('--hard-beta', type=float, default=2.0,
+                        help='with --sampler hard, how strongly easy samples are skipped')
+    parser.add_argument('--num-workers', type=int, default=2, help='DataLoader worker processes')
+    parser.add_argument('--prefetch-factor', type=int, default=2, help='batches loaded ahead by each worker')
+    parser.add_argument('--tune-loader', action='store_true',
+                        help='probe worker counts and prefetch factors at startup and use the fastest')
+    parser.add_argument('--tune-batch-sizes', type=_int_list, default=None,
+                        metavar='LIST', help='with --tune-loader, also try these batch sizes, e.g. 32,64,128')
+    parser.add_argument('--frozen-layers', type=int, default=None,
+                        help='pretrained blocks kept frozen (default: 9 for MobileNetV3-Small)')
+    parser.add_argument('--dropout', type=float, default=0.2,
+                        help='dropout of the classifier head')
+    parser.add_argument('--output-dir', default=None,
+                        help='write checkpoints and history here instead of models/')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='decode images with PIL every epoch instead of using the tensor cache')
+    parser.add_argument('--augment', choices=['pil', 'batch'], default='pil',
+                        help='per-sample PIL transforms or batched tensor augmentation on the device')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed for shuffling and augmentation')
+    parser.add_argument('--feature-cache', type=int, default=0, metavar='K',
+                        help='run the frozen layers once per image for K views (1 = no augmentation) '
+                             'and train the remaining layers from the cached activations')
+    parser.add_argument('--fast', action='store_true',
+                        help='mixed precision (bf16 on CPU, fp16 on CUDA), channels_last and per-epoch metric sync')
+    parser.add_argument('--compile', action='store_true',
+                        help='wrap the model in torch.compile')
+    parser.add_argument('--profile', action='store_true',
+                        help='record time per training phase, samples/sec and peak RSS in the history')
+    parser.add_argument('--trace-steps', type=int, default=0, metavar='N',
+                        help='also save a torch.profiler trace of N training steps to models/training_trace.json')
+    parser.add_argument('--trace-skip', type=int, default=10, metavar='N',
+                        help='training steps to run before the trace starts')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue from models/training_state.pth')
+    parser.add_argument('--early-stop-patience', type=int, default=None, metavar='EPOCHS',
+                        help='stop when the monitored metric has not improved for this many epochs')
+    parser.add_argument('--early-stop-metric', choices=['val_loss', 'val_acc'], default='val_loss',
+                        help='metric monitored for early stopping')
+    parser.add_argument('--early-stop-min-delta', type=float, default=0.0,
+                        help='minimum change that counts as an improvement')
+    parser.add_argument('--target-val-acc', type=float, default=None, metavar='PERCENT',
+                        help='stop as soon as validation accuracy reaches this value')
+    parser.add_argument('--incremental', action='store_true',
+                        help='add new landmark classes to models/best_model.pth instead of retraining')
+    parser.add_argument('--incremental-epochs', type=int, default=5,
+                        help='fine-tuning epochs in incremental mode')
+    parser.add_argument('--replay-fraction', type=float, default=0.2,
+                        help='share of each existing class replayed in incremental mode')
+    parser.add_argument('--distributed', type=int, default=1, metavar='N',
+                        help='train with DistributedDataParallel across N local CPU processes (gloo)')
+    parser.add_argument('--master-port', type=int, default=29500,
+                        help='rendezvous port for --distributed')
+    parser.add_argument('--width-mult', type=float, default=1.0,
+                        help='MobileNetV3 width multiplier (below 1.0 trains from scratch, no ImageNet weights)')
+    parser.add_argument('--hidden-units', type=int, default=256,
+                        help='size of the hidden layer of the classifier head')
+    parser.add_argument('--input-size', type=int, default=224,
+                        help='input resolution of the model')
+    parser.add_argument('--distill', choices=architectures.TEACHERS, default=None, metavar='TEACHER',
+                        help=f"fine-tune a teacher ({', '.join(architectures.TEACHERS)}) once and train "
+                             'the model against its cached logits')
+    parser.add_argument('--teacher-epochs', type=int, default=None,
+                        help='teacher fine-tuning epochs (default: same as the model)')
+    parser.add_argument('--retrain-teacher', action='store_true',
+                        help='fine-tune the teacher again even if models/teacher_best_model.pth matches')
+    parser.add_argument('--temperature', type=float, default=4.0,
+                        help='distillation softmax temperature')
+    parser.add_argument('--distill-alpha', type=float, default=0.7,
+                        help='weight of the teacher loss vs. the label loss')
+    return parser.parse_args()
+
+
+def distributed_worker(rank, world_size, args):
+    """Entry point of one DistributedDataParallel process."""
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', str(args.master_port))
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+
+    # Share the cores between processes instead of oversubscribing them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+
+    # Only rank 0 reports progress
+    if rank != 0:
+        sys.stdout = open(os.devnull, 'w')
+
+    try:
+        run_training(args, rank=rank, world_size=world_size)
+    finally:
+        dist.destroy_process_group()
+
+
 def main():
+    args = parse_args()
+
+    if args.distributed > 1:
+        mp.spawn(distributed_worker, args=(args.distributed, args), nprocs=args.distributed)
+    else:
+        run_training(args)
+
+
+def prepare_teacher(args, epochs, batch_size, learning_rate, rank=0, world_size=1):
+    """Fine-tune the distillation teacher, or reuse a saved one for the same classes."""
+    teacher = LandmarkClassifier(rank=rank, world_size=world_size, arch=architectures.make_arch(args.distill))
+    teacher.checkpoint_prefix = 'teacher_'
+    teacher.num_workers = args.num_workers
+    teacher.prefetch_factor = args.prefetch_factor
+    class_to_idx = teacher.load_data(
+        batch_size=batch_size,
+        use_cache=not args.no_cache,
+        augment=args.augment,
+        seed=args.seed
+    )
+    teacher.build_model()
+
+    teacher_path = teacher.models_dir() / 'teacher_best_model.pth'
+    checkpoint = torch.load(teacher_path, map_location=teacher.device) if teacher_path.exists() else None
+    if (checkpoint is not None and not args.retrain_teacher
+            and architectures.checkpoint_arch(checkpoint) == teacher.arch
+            and checkpoint['class_to_idx'] == class_to_idx):
+        print(f"✓ Reusing teacher from {teacher_path}")
+    else:
+        print(f"\nFine-tuning teacher: {architectures.describe(teacher.arch)}")
+        if teacher.is_main and teacher_path.exists():
+            # A stale teacher must not stand in for one that never improved
+            teacher_path.unlink()
+        teacher.train(epochs=epochs, learning_rate=learning_rate, fast=args.fast)
+        if world_size > 1:
+            # Rank 0 writes the teacher checkpoint
+            dist.barrier()
+        if not teacher_path.exists():
+            # Only written when validation accuracy improves on 0%
+            print(f"Error: The teacher never improved on 0% validation accuracy, no {teacher_path.name} was saved")
+            print("Check the training data, or train the teacher for more epochs")
+            sys.exit(1)
+        checkpoint = torch.load(teacher_path, map_location=teacher.device)
+
+    teacher.model.load_state_dict(checkpoint['model_state_dict'])
+    teacher_id = f"{teacher_path.name}:{teacher_path.stat().st_mtime_ns}"
+    return teacher.model, teacher_id, teacher.arch
+
+
+def run_training(args, rank=0, world_size=1):
     print("="*60)
     print("Landmark Recognition Model Training")
     print("="*60)
 
     # Configuration
-    EPOCHS = 25
-    BATCH_SIZE = 32
-    LEARNING_RATE = 0.001
+    EPOCHS = args.epochs
+    BATCH_SIZE = args.batch_size
+    LEARNING_RATE = args.learning_rate
+
+    if args.seed is not None:
+        torch.manual_seed(args.seed)
+
+    if args.distill and (args.incremental or args.feature_cache):
+        print("Error: --distill cannot be combined with --incremental or --feature-cache")
+        sys.exit(1)
+
+    if args.sampler != 'shuffle' and args.distributed > 1:
+        print("Error: --sampler is not supported with --distributed")
+        sys.exit(1)
+
+    arch = architectures.make_arch(
+        width_mult=args.width_mult,
+        hidden_units=args.hidden_units,
+        dropout=args.dropout,
+        input_size=args.input_size
+    )
+
+    teacher = None
+    if args.distill:
+        teacher, teacher_id, teacher_arch = prepare_teacher(
+            args, args.teacher_epochs or EPOCHS, BATCH_SIZE, LEARNING_RATE, rank=rank, world_size=world_size
+        )
 
     # Initialize classifier
-    classifier = LandmarkClassifier()
+    classifier = LandmarkClassifier(rank=rank, world_size=world_size, arch=arch)
+    classifier.output_dir = args.output_dir
+    classifier.num_workers = args.num_workers
+    classifier.prefetch_factor = args.prefetch_factor
+    classifier.sampler = args.sampler
+    if args.sampler == 'hard':
+        classifier.sampler_options = {'beta': args.hard_beta, 'min_prob': args.hard_min_prob}
+    if args.frozen_layers is not None:
+        classifier.frozen_layers = args.frozen_layers
 
     # Load data
-    class_to_idx = classifier.load_data(batch_size=BATCH_SIZE)
+    class_to_idx = classifier.load_data(
+        batch_size=BATCH_SIZE,
+        use_cache=not args.no_cache,
+        augment=args.augment,
+        seed=args.seed,
+        tune_batch_sizes=(args.tune_batch_sizes or [BATCH_SIZE]) if args.tune_loader else None
+    )
 
     # Save class mapping for later use
     # Auto-detect path
@@ -319,28 +1077,86 @@ def main():
     else:
         mapping_file = Path('ml_training/data/pytorch_class_mapping.json')
 
-    mapping_file.parent.mkdir(parents=True, exist_ok=True)
-    with open(mapping_file, 'w') as f:
-        json.dump(class_to_idx, f, indent=2)
-    print(f"✓ Saved class mapping to {mapping_file}")
+    base_checkpoint = None
+    if args.incremental:
+        base_path = classifier.models_dir() / 'best_model.pth'
+        if not base_path.exists():
+            print(f"Error: Incremental mode needs a trained model at {base_path}")
+            sys.exit(1)
+        base_checkpoint = torch.load(base_path, map_location=classifier.device)
+        class_to_idx = classifier.prepare_incremental(
+            base_checkpoint['class_to_idx'],
+            replay_fraction=args.replay_fraction,
+            seed=args.seed if args.seed is not None else 0
+        )
+        EPOCHS = args.incremental_epochs
+
+    if classifier.is_main:
+        mapping_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(mapping_file, 'w') as f:
+            json.dump(class_to_idx, f, indent=2)
+        print(f"✓ Saved class mapping to {mapping_file}")
 
     # Build model
     classifier.build_model()
 
+    if teacher is not None:
+        classifier.attach_teacher(
+            teacher, teacher_id, teacher_arch,
+            temperature=args.temperature,
+            alpha=args.distill_alpha,
+            seed=args.seed
+        )
+        del teacher
+
+    if base_checkpoint is not None:
+        classifier.grow_classifier(base_checkpoint)
+
+    if args.feature_cache:
+        classifier.load_feature_data(
+            batch_size=classifier.batch_size,
+            views=args.feature_cache,
+            seed=args.seed if args.seed is not None else 0
+        )
+
+    early_stopping = None
+    if args.early_stop_patience is not None or args.target_val_acc is not None:
+        early_stopping = EarlyStopping(
+            metric=args.early_stop_metric,
+            patience=args.early_stop_patience,
+            min_delta=args.early_stop_min_delta,
+            target_val_acc=args.target_val_acc
+        )
+
+    resume_from = None
+    if args.resume:
+        resume_from = classifier.models_dir() / 'training_state.pth'
+        if not resume_from.exists():
+            print(f"Error: No training state found at {resume_from}")
+            sys.exit(1)
+
     # Train model
-    history = classifier.train(epochs=EPOCHS, learning_rate=LEARNING_RATE)
+    history = classifier.train(
+        epochs=EPOCHS,
+        learning_rate=LEARNING_RATE,
+        fast=args.fast,
+        compile_model=args.compile,
+        resume_from=resume_from,
+        early_stopping=early_stopping,
+        profile=args.profile,
+        trace_steps=args.trace_steps,
+        trace_skip=args.trace_skip
+    )
+
+    if not classifier.is_main:
+        return
 
     # Save final model
     final_path = classifier.save_model('landmark_model_final.pth')
     print(f"\n✓ Final model saved to {final_path}")
 
     # Save training history
-    # Auto-detect path
-    if Path('models').exists() or Path('.').resolve().name == 'ml_training':
-        history_file = Path('models/training_history.json')
-    else:
-        history_file = Path('ml_training/models/training_history.json')
-
+    history_file = classifier.models_dir() / 'training_history.json'
     history_file.parent.mkdir(parents=True, exist_ok=True)
     with open(history_file, 'w') as f:
         json.dump(history, f, indent=2)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Per-phase instrumentation of the training loop.
+
+TrainingProfiler splits every training step into the time spent waiting for
+the DataLoader (decode and transforms not hidden by the workers), copying to
+the device, forward, backward, optimizer step and metric bookkeeping (the
+`.item()` syncs and progress bar), plus the validation pass. Each epoch adds
+these totals, samples/sec and the peak RSS of the training process and of
+each DataLoader worker during that epoch to the training history.
+
+Optionally a torch.profiler trace of a window of steps is written as a
+Chrome trace, with the same phases as labelled ranges. When disabled, phase()
+returns a shared no-op context and batches are passed through untouched, so
+the training loop runs as before.
+"""
+import contextlib
+import os
+import sys
+import time
+import torch
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+_NO_OP = contextlib.nullcontext()
+
+
+def peak_rss_mb():
+    """Lifetime high-water mark of this process's resident set size in MB, or None if unknown."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(usage.ru_maxrss * scale / 1024 ** 2, 1)
+
+
+def child_pids():
+    """PIDs of this process's children (the DataLoader workers), [] without /proc."""
+    if not os.path.isdir('/proc'):
+        return []
+    me = os.getpid()
+    pids = []
+    for entry in os.scandir('/proc'):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry.name}/stat', 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name in parentheses may contain spaces, the ppid follows the state
+        if int(stat.rsplit(')', 1)[1].split()[1]) == me:
+            pids.append(int(entry.name))
+    return sorted(pids)
+
+
+def proc_memory_mb(pid='self'):
+    """Current (VmRSS) and peak (VmHWM) resident set size of a process in MB, or None."""
+    memory = {}
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    memory[line[:5]] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    if 'VmRSS' not in memory:
+        return None
+    return memory['VmRSS'], memory['VmHWM']
+
+
+def reset_peak_rss(pid='self'):
+    """Reset a process's VmHWM to its current RSS, so the next read is a per-epoch peak."""
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class TrainingProfiler:
+    """Accumulate per-phase wall time and optionally trace a window of steps.
+
+    `trace_steps` training steps after the first `trace_skip` ones are
+    recorded with torch.profiler and exported to `trace_path`.
+    """
+
+    def __init__(self, device, enabled=False, trace_steps=0, trace_skip=10, trace_path=None):
+        self.device = device
+        self.enabled = enabled or trace_steps > 0
+        self.trace_steps = trace_steps
+        self.trace_skip = trace_skip
+        self.trace_path = trace_path
+        self.step_count = 0
+        self.trace = None
+        self.times = {}
+        self.epoch_start = None
+        self.peaks_reset = False
+
+    def _sync(self):
+        # CUDA kernels run asynchronously, wait for them so time lands in the right phase
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        label = torch.profiler.record_function(name) if self.trace is not None else _NO_OP
+        with label:
+            self._sync()
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self._sync()
+                self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+    def phase(self, name):
+        """Context manager that adds its wall time to phase `name`."""
+        if not self.enabled:
+            return _NO_OP
+        return self._timed(name)
+
+    def batches(self, loader):
+        """Iterate over `loader`, counting the wait for each batch as 'data'."""
+        if not self.enabled:
+            return loader
+        return self._timed_batches(loader)
+
+    def _timed_batches(self, loader):
+        # Starting the iterator spawns the DataLoader workers
+        with self.phase('data'):
+            iterator = iter(loader)
+        while True:
+            with self.phase('data'):
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    return
+            yield batch
+
+    def start_epoch(self):
+        if self.enabled:
+            self.times = {}
+            self.epoch_start = time.perf_counter()
+            # Persistent workers live across epochs, reset their peaks too;
+            # workers started during this epoch begin with a fresh peak anyway
+            self.peaks_reset = all([reset_peak_rss('self')] + [reset_peak_rss(pid) for pid in child_pids()])
+
+    def memory_stats(self):
+        """RSS of the training process and each DataLoader worker, sampled now.
+
+        Peaks cover the current epoch where /proc allows resetting them,
+        otherwise the lifetime of the process. Without /proc only the
+        process's own lifetime peak is known.
+        """
+        own = proc_memory_mb('self')
+        if own is None:
+            return {'peak_rss_mb': peak_rss_mb(), 'peak_is_per_epoch': False}
+
+        workers = {}
+        for pid in child_pids():
+            memory = proc_memory_mb(pid)
+            # A worker may exit between listing and reading it
+            if memory is not None:
+                workers[pid] = memory
+        return {
+            'rss_mb': own[0],
+            'peak_rss_mb': own[1],
+            'peak_is_per_epoch': self.peaks_reset,
+            'workers': [{'pid': pid, 'rss_mb': rss, 'peak_rss_mb': peak}
+                        for pid, (rss, peak) in workers.items()],
+            'worker_rss_mb': round(sum(rss for rss, _ in workers.values()), 1),
+            'peak_worker_rss_mb': round(sum(peak for _, peak in workers.values()), 1)
+        }
+
+    def begin_step(self):
+        """Mark the start of a training step, starting or stopping the trace window."""
+        if not self.trace_steps:
+            return
+        if self.step_count == self.trace_skip:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device.type == 'cuda':
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.trace = torch.profiler.profile(activities=activities)
+            self.trace.__enter__()
+        elif self.step_count == self.trace_skip + self.trace_steps:
+            self.close()
+        self.step_count += 1
+
+    def end_epoch(self, samples):
+        """Per-epoch stats for the training history, `samples` being the training images seen."""
+        elapsed = time.perf_counter() - self.epoch_start
+        train_seconds = elapsed - self.times.get('validation', 0.0)
+        return {
+            'seconds': round(elapsed, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.times.items()},
+            'samples_per_sec': round(samples / train_seconds, 1),
+            **self.memory_stats()
+        }
+
+    def report(self, stats):
+        total = stats['seconds']
+        phases = ', '.join(f"{name} {seconds:.1f}s ({100 * seconds / total:.0f}%)"
+                           for name, seconds in sorted(stats['phases'].items(), key=lambda p: -p[1]))
+        print(f"  Profile: {phases}")
+        scope = 'this epoch' if stats['peak_is_per_epoch'] else 'since start'
+        if 'workers' not in stats:
+            print(f"  Peak RSS ({scope}): {stats['peak_rss_mb']} MB")
+            return
+        print(f"  Peak RSS ({scope}): {stats['peak_rss_mb']} MB, "
+              f"{len(stats['workers'])} workers {stats['peak_worker_rss_mb']} MB "
+              f"(now {stats['rss_mb']} MB / {stats['worker_rss_mb']} MB)")
+
+    def close(self):
+        """Stop an active trace and export it."""
+        if self.trace is None:
+            return
+        trace, self.trace = self.trace, None
+        trace.__exit__(None, None, None)
+        self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+        trace.export_chrome_trace(str(self.trace_path))
+        print(f"\n✓ Profiler trace of {self.trace_steps} steps saved to {self.trace_path}")
+        print(trace.key_averages().table(sort_by='self_cpu_time_total', row_limit=15))
@@ -1,20 +1,34 @@
 #!/usr/bin/env python3
 """
 Update VisionService.swift with the generated class mapping.
+
+The class to landmark ID mapping is read from the landmark store
+(data/landmarks.store), or from class_mapping_swift.json where there is no
+store yet.
 """
+import argparse
 import json
 import re
 from pathlib import Path
 import sys
+from landmark_store import open_store
 
 
 def load_class_mapping():
     """Load the class to landmark ID mapping."""
-    mapping_file = Path('ml_training/models/class_mapping_swift.json')
+    # Auto-detect paths based on current directory
+    if Path('models').exists() or Path('.').resolve().name == 'ml_training':
+        data_dir, mapping_file = Path('data'), Path('models/class_mapping_swift.json')
+    else:
+        data_dir, mapping_file = Path('ml_training/data'), Path('ml_training/models/class_mapping_swift.json')
+
+    store = open_store(data_dir)
+    if store is not None:
+        return store.landmark_ids()
 
     if not mapping_file.exists():
         print(f"Error: Class mapping not found at {mapping_file}")
-        print("Run 'python scripts/convert_to_coreml.py' first")
+        print("Run 'python scripts/fetch_landmarks.py' and 'python scripts/convert_to_coreml.py' first")
         sys.exit(1)
 
     with open(mapping_file, 'r') as f:
@@ -74,7 +88,14 @@ def update_vision_service(swift_mapping_code):
     print(f"✓ Updated {vision_service_path}")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Write the class to landmark ID mapping into VisionService.swift.')
+    return parser.parse_args()
+
+
 def main():
+    parse_args()
     print("="*60)
     print("VisionService.swift Updater")
     print("="*60)
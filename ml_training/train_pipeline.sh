@@ -1,5 +1,5 @@
 #!/bin/bash
-# Complete ML training pipeline - runs all steps in sequence
+# Complete ML training pipeline - runs all steps in sequence, skipping unchanged ones
 
 set -e  # Exit on error
 
@@ -32,56 +32,12 @@ else
     echo ""
 fi
 
-# Step 1: Fetch landmarks
-echo "=========================================="
-echo "Step 1/5: Fetching landmarks from Supabase"
-echo "=========================================="
-python ml_training/scripts/fetch_landmarks.py
-echo ""
-
-# Check for training images
-echo "=========================================="
-echo "IMPORTANT: Training Images Required"
-echo "=========================================="
-echo "Please ensure you have placed training images in ml_training/data/train/"
-echo ""
-echo "Requirements:"
-echo "  1. 20-50 images per landmark in ml_training/data/train/<landmark_name>/"
-echo "  2. Diverse angles, lighting, and conditions"
-echo "  3. Good quality (min 300x300px)"
-echo ""
-echo "See MANUAL_IMAGE_COLLECTION.md for detailed instructions."
-echo ""
-read -p "Press ENTER when your images are ready (or Ctrl+C to exit)..."
-echo ""
-
-# Step 2: Train model
-echo "=========================================="
-echo "Step 2/5: Training the model"
-echo "=========================================="
-echo "This will take 30-60 minutes..."
-python ml_training/scripts/train_model.py
-echo ""
-
-# Step 3: Convert to Core ML
-echo "=========================================="
-echo "Step 3/5: Converting to Core ML format"
-echo "=========================================="
-python ml_training/scripts/convert_to_coreml.py
-echo ""
-
-# Step 4: Copy to Xcode
-echo "=========================================="
-echo "Step 4/5: Copying model to Xcode project"
-echo "=========================================="
-./ml_training/scripts/copy_model_to_xcode.sh
-echo ""
-
-# Step 5: Update VisionService
-echo "=========================================="
-echo "Step 5/5: Updating VisionService.swift"
-echo "=========================================="
-python ml_training/scripts/update_vision_service.py
+# Run the stages: fetch, download, prepare, train, convert, copy, update
+# Stages whose inputs did not change are skipped, see scripts/pipeline.py.
+# Pass stage names or options through, e.g.:
+#   ./train_pipeline.sh convert copy
+#   ./train_pipeline.sh --train-args "--epochs 10 --fast"
+python ml_training/scripts/pipeline.py "$@"
 echo ""
 
 # Final summary